@@ -0,0 +1,6 @@
+"""
+Benchmarks Module
+=================
+
+This module provides tools to measure the speed and the memory of the models and of the I/O path.
+"""
@@ -0,0 +1,187 @@
+"""
+Seeded synthetic inputs of the benchmarks.
+
+The networks are generated with the `pgm.synthetic` generators of each algorithm and written in the
+formats read by `import_data` and `import_data_mtcov`, so that the benchmarks also time the
+input path.
+"""
+
+import dataclasses
+from pathlib import Path
+from typing import List, Optional
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from ..synthetic.syn_acd import SyntNetAnomaly
+from ..synthetic.syn_dyncrep import SyntheticDynCRep
+from ..synthetic.syn_rep import GM_reciprocity
+from ..synthetic.syn_sbm import StandardMMSBM
+
+
+@dataclasses.dataclass
+class BenchmarkInput:
+    """
+    Files of a synthetic input.
+
+    Attributes
+    ----------
+    folder : str
+             Folder of the files.
+    adj_name : str
+               Name of the edge list.
+    cov_name : str, optional
+               Name of the design matrix, for MTCOV.
+    sep : str
+          Separator of the columns of the edge list.
+    n_nodes : int
+              Number of nodes of the network.
+    n_edges : int
+              Number of rows of the edge list.
+    """
+
+    folder: str
+    adj_name: str
+    cov_name: Optional[str] = None
+    sep: str = " "
+    n_nodes: int = 0
+    n_edges: int = 0
+
+
+def write_edgelist(
+    path: Path, layers: List[sparse.spmatrix], columns: List[str], sep: str = " "
+) -> int:
+    """
+    Write the edge list of a multilayer network, with one weight column per layer.
+
+    Parameters
+    ----------
+    path : Path
+           Path of the output file.
+    layers : list
+             Sparse adjacency matrices of the layers.
+    columns : list
+              Names of the weight columns.
+    sep : str
+          Separator of the columns.
+
+    Returns
+    -------
+    n_edges : int
+              Number of rows of the edge list.
+    """
+    layers = [sparse.csr_matrix(layer) for layer in layers]
+    support = sum(abs(layer) for layer in layers).tocoo()
+    df = pd.DataFrame({"source": support.row, "target": support.col})
+    for name, layer in zip(columns, layers):
+        df[name] = np.asarray(layer[support.row, support.col]).ravel()
+    df.to_csv(path, sep=sep, index=False)
+
+    return len(df)
+
+
+def make_input(
+    algorithm: str,
+    folder: str,
+    N: int,
+    K: int,
+    L: int = 1,
+    avg_degree: float = 10.0,
+    T: int = 3,
+    seed: int = 0,
+) -> BenchmarkInput:
+    """
+    Generate the synthetic input of an algorithm and write it to a folder.
+
+    CRep and JointCRep use a network with reciprocity, MTCOV a multilayer MMSBM with the
+    community of the nodes as covariate, DynCRep a temporal network with T + 1 snapshots and ACD
+    a network with anomalies. The generators of CRep, JointCRep, MTCOV and ACD draw the edges
+    from the factorized means, without the dense NxN matrix.
+
+    Parameters
+    ----------
+    algorithm : str
+                Name of the algorithm.
+    folder : str
+             Output folder.
+    N : int
+        Number of nodes.
+    K : int
+        Number of communities.
+    L : int
+        Number of layers, for MTCOV.
+    avg_degree : float
+                 Average degree of the network.
+    T : int
+        Number of time steps, for DynCRep.
+    seed : int
+           Seed of the generators.
+
+    Returns
+    -------
+    data : BenchmarkInput
+           Files of the input.
+    """
+    folder_path = Path(folder)
+    cov_name = None
+    sep = " "
+
+    if algorithm in ("CRep", "JointCRep"):
+        _, A = GM_reciprocity(
+            N, K, k=avg_degree, seed=seed, factorized=True, output_graph=False
+        ).reciprocity_planted_network()
+        layers, columns = [A], ["w"]
+    elif algorithm == "MTCOV":
+        mmsbm = StandardMMSBM(
+            N=N,
+            K=K,
+            L=L,
+            avg_degree=avg_degree,
+            seed=seed,
+            is_sparse=True,
+            structure="assortative",
+            perc_overlapping=0.0,
+            label="benchmark",
+            factorized=True,
+            output_net=False,
+            show_details=False,
+            show_plots=False,
+        )
+        layers = mmsbm.layer_graphs
+        columns = [f"L{layer + 1}" for layer in range(L)]
+        cov_name = "X.csv"
+        pd.DataFrame(
+            {
+                "Name": np.arange(mmsbm.N),
+                "Metadata": [f"Meta{k}" for k in np.argmax(mmsbm.u, axis=1)],
+            }
+        ).to_csv(folder_path / cov_name)
+        sep = ","
+    elif algorithm == "DynCRep":
+        G = SyntheticDynCRep(
+            N, K, T=T, avg_degree=avg_degree, rseed=seed, eta=0.2, verbose=0
+        ).generate_net()
+        nodes = list(G[0].nodes())
+        layers = [nx.to_scipy_sparse_array(G_t, nodelist=nodes) for G_t in G]
+        columns = [f"weight_t{t}" for t in range(len(G))]
+    elif algorithm == "ACD":
+        G, _ = SyntNetAnomaly(
+            N=N, K=K, avg_degree=avg_degree, rseed=seed, factorized=True
+        ).anomaly_network_PB()
+        layers, columns = [nx.to_scipy_sparse_array(G, nodelist=list(G.nodes()))], ["w"]
+    else:
+        raise ValueError(f"Unknown algorithm: {algorithm}")
+
+    adj_name = f"{algorithm}_adj.csv" if algorithm == "MTCOV" else f"{algorithm}_adj.dat"
+    n_edges = write_edgelist(folder_path / adj_name, layers, columns, sep=sep)
+
+    return BenchmarkInput(
+        folder=str(folder_path),
+        adj_name=adj_name,
+        cov_name=cov_name,
+        sep=sep,
+        n_nodes=layers[0].shape[0],
+        n_edges=n_edges,
+    )
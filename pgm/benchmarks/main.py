@@ -0,0 +1,150 @@
+"""
+Main module for running the performance benchmarks.
+"""
+
+import argparse
+import logging
+import sys
+
+from pgm.benchmarks.runner import (
+    ALGORITHMS, compare_reports, define_cases, load_report, PHASES, run_benchmarks, save_report)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Script to benchmark the speed and the memory of the CRep, JointCRep, MTCOV, "
+        "DynCRep and ACD algorithms on seeded synthetic networks.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-a",
+        "--algorithms",
+        nargs="+",
+        choices=ALGORITHMS,
+        default=list(ALGORITHMS),
+        help="Algorithms to benchmark",
+    )
+    parser.add_argument("-N", "--N", nargs="+", type=int, default=[200], help="Numbers of nodes")
+    parser.add_argument(
+        "-K", "--K", nargs="+", type=int, default=[3], help="Numbers of communities"
+    )
+    parser.add_argument(
+        "-L", "--L", nargs="+", type=int, default=[1], help="Numbers of layers (MTCOV)"
+    )
+    parser.add_argument(
+        "--avg_degree",
+        nargs="+",
+        type=float,
+        default=[10.0],
+        help="Average degrees, which set the density of the networks",
+    )
+    parser.add_argument(
+        "-T", "--T", nargs="+", type=int, default=[3], help="Numbers of time steps (DynCRep)"
+    )
+    parser.add_argument("--rseed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "--max_iter", type=int, default=100, help="Maximum number of EM iterations of the fits"
+    )
+    parser.add_argument(
+        "--NFold", type=int, default=5, help="Number of folds of the cross-validation"
+    )
+    parser.add_argument(
+        "--phases", nargs="+", choices=PHASES, default=list(PHASES), help="Phases to time"
+    )
+    parser.add_argument(
+        "--no_isolate",
+        action="store_true",
+        default=False,
+        help="Run all the cases in the current process, instead of one process per case",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="benchmarks.json",
+        help="Path of the JSON file with the results",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        default=None,
+        help="Path of the JSON file of a baseline to compare the results against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown above which a result is a regression of the baseline",
+    )
+    parser.add_argument(
+        "--debug",
+        "-d",
+        dest="debug",
+        action="store_true",
+        default=False,
+        help="Enable debug mode",
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Command-line entry point of the benchmarks.
+
+    The exit code is 1 if a baseline is given and one of the results is a regression. With a
+    baseline, a failure of a phase is raised rather than stored in the report.
+    """
+    args = parse_args(argv)
+
+    # Logging
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="*** [%(levelname)s][%(asctime)s][%(module)s] %(message)s",
+    )
+
+    cases = define_cases(
+        args.algorithms,
+        N=args.N,
+        K=args.K,
+        L=args.L,
+        avg_degree=args.avg_degree,
+        T=args.T,
+        seed=args.rseed,
+    )
+    logging.info("Running %d benchmark cases", len(cases))
+    report = run_benchmarks(
+        cases,
+        isolate=not args.no_isolate,
+        max_iter=args.max_iter,
+        NFold=args.NFold,
+        phases=args.phases,
+        raise_errors=args.baseline is not None,
+    )
+    save_report(report, args.output)
+    logging.info("Results saved in: %s", args.output)
+
+    if args.baseline is None:
+        return 0
+
+    comparison = compare_reports(report, load_report(args.baseline), threshold=args.threshold)
+    print(f"{'case':<50} {'metric':<18} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for row in comparison:
+        flag = "  REGRESSION" if row["regression"] else ""
+        # The current value and the ratio of a phase missing from the report are None
+        baseline, current, ratio = (
+            "-" if row[key] is None else format(row[key], spec)
+            for key, spec in (("baseline", ".4g"), ("current", ".4g"), ("ratio", ".2f"))
+        )
+        print(
+            f"{row['name']:<50} {row['metric']:<18} {baseline:>12} {current:>12} {ratio:>8}{flag}"
+        )
+    regressions = sum(row["regression"] for row in comparison)
+    logging.info("%d regressions against the baseline %s", regressions, args.baseline)
+
+    return int(regressions > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
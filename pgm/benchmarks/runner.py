@@ -0,0 +1,552 @@
+"""
+Runner of the performance benchmarks.
+
+A benchmark case is an algorithm and a point of the grid of network sizes. Every case generates
+its seeded synthetic input, then times the phases of the pipeline: reading the input with the
+loaders, the EM iterations and the full fit of the model, the AUC of the fitted model and a
+cross-validation. The cases run one after the other, each in a new process by default, so that
+the peak resident memory is measured for every case separately.
+
+The results are stored as JSON and can be compared against a saved baseline.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import dataclasses
+import datetime
+import functools
+import itertools
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import scipy
+
+from ..input.loader import import_data, import_data_mtcov
+from ..model.acd import AnomalyDetection
+from ..model.crep import CRep
+from ..model.dyncrep import DynCRep
+from ..model.jointcrep import JointCRep
+from ..model.mtcov import MTCOV
+from ..model_selection.main import cross_validation
+from ..output.evaluate import calculate_AUC, lambda0_full
+from .datasets import BenchmarkInput, make_input
+
+try:
+    import resource
+except ImportError:  # the resource module is not available on Windows
+    resource = None
+
+ALGORITHMS = ("CRep", "JointCRep", "MTCOV", "DynCRep", "ACD")
+PHASES = ("generate", "import_data", "em_iteration", "fit", "calculate_AUC", "cross_validation")
+
+MODEL_CLASSES = {
+    "CRep": CRep,
+    "JointCRep": JointCRep,
+    "MTCOV": MTCOV,
+    "DynCRep": DynCRep,
+    "ACD": AnomalyDetection,
+}
+
+# Parameters of the fit of every algorithm, besides the data, K and the seed
+FIT_PARAMETERS: Dict[str, Dict[str, Any]] = {
+    "CRep": {"assortative": True, "constrained": True, "eta0": None, "fix_eta": False},
+    "JointCRep": {
+        "assortative": False,
+        "eta0": None,
+        "fix_eta": False,
+        "fix_communities": False,
+        "fix_w": False,
+        "use_approximation": False,
+    },
+    "MTCOV": {"gamma": 0.5, "assortative": False, "batch_size": None},
+    "DynCRep": {
+        "ag": 1.1,
+        "bg": 0.5,
+        "eta0": 0.2,
+        "beta0": 0.2,
+        "flag_data_T": 0,
+        "fix_eta": False,
+        "fix_beta": False,
+        "fix_communities": False,
+        "fix_w": False,
+        "assortative": False,
+        "constrained": False,
+        "constraintU": False,
+        "temporal": True,
+    },
+    "ACD": {
+        "ag": 1.5,
+        "bg": 10.0,
+        "pibr0": None,
+        "mupr0": None,
+        "flag_anomaly": True,
+        "fix_pibr": False,
+        "fix_mupr": False,
+        "assortative": True,
+        "constrained": False,
+        "fix_communities": False,
+    },
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class BenchmarkCase:
+    """
+    Algorithm and point of the grid of a benchmark.
+
+    Attributes
+    ----------
+    algorithm : str
+                Name of the algorithm.
+    N : int
+        Number of nodes of the synthetic network.
+    K : int
+        Number of communities.
+    L : int
+        Number of layers, used by MTCOV.
+    avg_degree : float
+                 Average degree, which sets the density of the network.
+    T : int
+        Number of time steps, used by DynCRep.
+    seed : int
+           Seed of the generator and of the fit.
+    """
+
+    algorithm: str
+    N: int
+    K: int
+    L: int = 1
+    avg_degree: float = 10.0
+    T: int = 0
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        """
+        Identifier of the case, used to match the results against a baseline.
+        """
+        return (
+            f"{self.algorithm}_N{self.N}_K{self.K}_L{self.L}_deg{self.avg_degree:g}_T{self.T}"
+            f"_seed{self.seed}"
+        )
+
+
+def define_cases(
+    algorithms: Sequence[str] = ALGORITHMS,
+    N: Sequence[int] = (200,),
+    K: Sequence[int] = (3,),
+    L: Sequence[int] = (1,),
+    avg_degree: Sequence[float] = (10.0,),
+    T: Sequence[int] = (3,),
+    seed: int = 0,
+) -> List[BenchmarkCase]:
+    """
+    Define the benchmark cases of a grid.
+
+    The number of layers only varies for MTCOV and the number of time steps only for DynCRep, the
+    other algorithms run on a single layer.
+
+    Parameters
+    ----------
+    algorithms : sequence
+                 Names of the algorithms.
+    N : sequence
+        Numbers of nodes.
+    K : sequence
+        Numbers of communities.
+    L : sequence
+        Numbers of layers.
+    avg_degree : sequence
+                 Average degrees.
+    T : sequence
+        Numbers of time steps.
+    seed : int
+           Seed of the generators and of the fits.
+
+    Returns
+    -------
+    cases : list
+            Benchmark cases, without duplicates, in the order of the grid.
+    """
+    cases = []
+    for algorithm in algorithms:
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm: {algorithm}")
+        grid = itertools.product(
+            N,
+            K,
+            L if algorithm == "MTCOV" else (1,),
+            avg_degree,
+            T if algorithm == "DynCRep" else (0,),
+        )
+        for n, k, layers, degree, steps in grid:
+            case = BenchmarkCase(algorithm, n, k, layers, degree, steps, seed)
+            if case not in cases:
+                cases.append(case)
+
+    return cases
+
+
+def peak_rss() -> Optional[float]:
+    """
+    Return the peak resident memory of the process, in MB, or None if it cannot be measured.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
+
+
+@contextlib.contextmanager
+def timed(timings: Dict[str, float], phase: str) -> Iterator[None]:
+    """
+    Store the wall time of the block in `timings[phase]`, in seconds.
+    """
+    start = time.perf_counter()
+    yield
+    timings[phase] = time.perf_counter() - start
+
+
+def _record_calls(method: Callable, durations: List[float]) -> Callable:
+    """
+    Wrap a method to append the wall time of every call to `durations`.
+    """
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+        return result
+
+    return wrapper
+
+
+def _load_input(case: BenchmarkCase, data: BenchmarkInput) -> Dict[str, Any]:
+    """
+    Read the synthetic input with the loaders, and return the data arguments of the fit.
+    """
+    if case.algorithm == "MTCOV":
+        _, B, X, nodes = import_data_mtcov(
+            data.folder,
+            adj_name=data.adj_name,
+            cov_name=data.cov_name,
+            undirected=True,
+            force_dense=False,
+        )
+        return {"data": B, "data_X": np.array(X), "nodes": nodes}
+
+    network = f"{data.folder}/{data.adj_name}"
+    if case.algorithm in ("CRep", "JointCRep"):
+        A, B, B_T, data_T_vals = import_data(network, header=0, force_dense=False)
+        return {"data": B, "data_T": B_T, "data_T_vals": data_T_vals, "nodes": A[0].nodes()}
+
+    A, B, _, _ = import_data(network, header=0, force_dense=False)
+    fit_data = {"data": B, "nodes": A[0].nodes()}
+    if case.algorithm == "DynCRep":
+        fit_data["T"] = B.shape[0] - 1
+
+    return fit_data
+
+
+def _cv_parameters(case: BenchmarkCase, data: BenchmarkInput, NFold: int) -> Dict[str, Any]:
+    """
+    Return the parameters of the cross-validation of a case, on its synthetic input.
+    """
+    cv_parameters = {
+        "in_folder": data.folder + "/",
+        "adj": data.adj_name,
+        "ego": "source",
+        "alter": "target",
+        "NFold": NFold,
+        "out_results": False,
+        "out_mask": False,
+    }
+    if case.algorithm == "MTCOV":
+        cv_parameters.update(cov=data.cov_name, egoX="Name", attr_name="Metadata")
+    if case.algorithm == "DynCRep":
+        cv_parameters["sep"] = "\\s+"
+
+    return cv_parameters
+
+
+def run_case(
+    case: BenchmarkCase,
+    max_iter: int = 100,
+    NFold: int = 5,
+    phases: Iterable[str] = PHASES,
+    raise_errors: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run a benchmark case.
+
+    The fit uses a single realization, and at most `max_iter` EM iterations. The time of one EM
+    iteration is the median over the iterations of the fit, and the AUC is computed on the whole
+    adjacency tensor. The input is always generated and read, since the other phases need it.
+
+    Parameters
+    ----------
+    case : BenchmarkCase
+           Benchmark case.
+    max_iter : int
+               Maximum number of EM iterations of the fits.
+    NFold : int
+            Number of folds of the cross-validation.
+    phases : iterable
+             Phases to time, among `PHASES`.
+    raise_errors : bool
+                   If True, a failure of the cross-validation is raised instead of being stored
+                   in the result.
+
+    Returns
+    -------
+    result : dict
+             Parameters of the case, wall time in seconds, peak resident memory in MB, and wall
+             time of every phase in seconds. If the cross-validation fails and `raise_errors`
+             is False, its error is stored in `errors` and it has no timing.
+    """
+    phases = set(phases)
+    timings: Dict[str, float] = {}
+    result: Dict[str, Any] = {"name": case.name, **dataclasses.asdict(case)}
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as folder:
+        with timed(timings, "generate"):
+            data = make_input(
+                case.algorithm,
+                folder,
+                case.N,
+                case.K,
+                L=case.L,
+                avg_degree=case.avg_degree,
+                T=case.T,
+                seed=case.seed,
+            )
+        result.update(n_nodes=data.n_nodes, n_edges=data.n_edges)
+
+        with timed(timings, "import_data"):
+            fit_data = _load_input(case, data)
+
+        if phases & {"em_iteration", "fit", "calculate_AUC"}:
+            model = MODEL_CLASSES[case.algorithm](max_iter=max_iter, num_realizations=1)
+            iterations: List[float] = []
+            model._update_em = _record_calls(  # pylint: disable=protected-access
+                model._update_em, iterations  # pylint: disable=protected-access
+            )
+            with timed(timings, "fit"):
+                model.fit(
+                    K=case.K,
+                    rseed=case.seed,
+                    initialization=0,
+                    undirected=case.algorithm == "MTCOV",
+                    out_inference=False,
+                    **fit_data,
+                    **FIT_PARAMETERS[case.algorithm],
+                )
+            timings["em_iteration"] = float(np.median(iterations)) if iterations else 0.0
+            result["n_iterations"] = len(iterations)
+
+        if "calculate_AUC" in phases:
+            with timed(timings, "calculate_AUC"):
+                data_dense = fit_data["data"].todense()
+                prediction = lambda0_full(model.u_f, model.v_f, model.w_f)
+                if prediction.shape[0] != data_dense.shape[0]:
+                    prediction = np.broadcast_to(prediction[-1], data_dense.shape)
+                result["auc"] = float(calculate_AUC(prediction, data_dense))
+
+        if "cross_validation" in phases:
+            cv_timings: Dict[str, float] = {}
+            try:
+                with timed(cv_timings, "cross_validation"):
+                    cross_validation(
+                        case.algorithm,
+                        {
+                            "K": case.K,
+                            "rseed": case.seed,
+                            "initialization": 0,
+                            "undirected": case.algorithm == "MTCOV",
+                            "out_inference": False,
+                            "out_folder": f"{folder}/cv/",
+                            "end_file": "",
+                            "files": "",
+                            **({"T": case.T} if case.algorithm == "DynCRep" else {}),
+                            **FIT_PARAMETERS[case.algorithm],
+                        },
+                        _cv_parameters(case, data, NFold),
+                        {"max_iter": max_iter, "num_realizations": 1},
+                    )
+                timings.update(cv_timings)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                if raise_errors:
+                    raise
+                # Some folds of small networks leave nodes without training edges, which the
+                # evaluation of some algorithms rejects; the other phases are still reported
+                logging.warning("Cross-validation of %s failed: %r", case.name, error)
+                result["errors"] = {"cross_validation": repr(error)}
+
+    result["wall_time"] = time.perf_counter() - start
+    result["peak_rss_mb"] = peak_rss()
+    result["timings"] = {phase: timings[phase] for phase in PHASES if phase in timings}
+
+    return result
+
+
+def run_benchmarks(
+    cases: Sequence[BenchmarkCase],
+    isolate: bool = True,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Run benchmark cases one after the other.
+
+    Parameters
+    ----------
+    cases : sequence
+            Benchmark cases.
+    isolate : bool
+              If True, every case runs in a new process, so that its peak resident memory does not
+              include the memory of the previous cases.
+    kwargs : dict
+             Arguments of `run_case`.
+
+    Returns
+    -------
+    report : dict
+             Metadata of the environment and results of the cases.
+    """
+    results = []
+    for case in cases:
+        logging.info("Running benchmark %s", case.name)
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_case, case, **kwargs).result()
+        else:
+            result = run_case(case, **kwargs)
+        logging.info("Benchmark %s: %.2f seconds", case.name, result["wall_time"])
+        results.append(result)
+
+    settings = dict(kwargs)
+    if "phases" in settings:
+        settings["phases"] = list(settings["phases"])
+
+    return {"metadata": environment_metadata(settings), "results": results}
+
+
+def environment_metadata(settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Return the versions and the machine used by the benchmarks, and their settings.
+    """
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "settings": settings or {},
+    }
+
+
+def save_report(report: Dict[str, Any], path: str) -> None:
+    """
+    Save a benchmark report to a JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(report, fp, indent=2)
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    """
+    Load a benchmark report from a JSON file.
+    """
+    with open(path, "r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def compare_reports(
+    report: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.1
+) -> List[Dict[str, Any]]:
+    """
+    Compare the results of a report against a baseline.
+
+    The cases are matched by name. The wall time, the peak resident memory and the time of every
+    phase are compared, and a value is a regression if it exceeds the baseline by more than the
+    relative `threshold`. A phase of the baseline without a timing in the report, and a phase
+    with an error in the report, are regressions without a current value. The cases missing from
+    one of the reports are logged.
+
+    Parameters
+    ----------
+    report : dict
+             Benchmark report.
+    baseline : dict
+               Benchmark report of the baseline.
+    threshold : float
+                Relative tolerance of the comparison.
+
+    Returns
+    -------
+    comparison : list
+                 One dictionary per case and metric, with the baseline and current values, their
+                 ratio and a regression flag. The current value and the ratio of a missing phase
+                 are None.
+    """
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+    missing = set(baseline_results) - {result["name"] for result in report["results"]}
+    for name in sorted(missing):
+        logging.warning("Benchmark %s of the baseline is not in the report", name)
+
+    comparison = []
+    for result in report["results"]:
+        reference = baseline_results.get(result["name"])
+        if reference is None:
+            logging.warning("Benchmark %s is not in the baseline", result["name"])
+            continue
+        metrics = {
+            "wall_time": (reference.get("wall_time"), result.get("wall_time")),
+            "peak_rss_mb": (reference.get("peak_rss_mb"), result.get("peak_rss_mb")),
+        }
+        errors = result.get("errors", {})
+        phases = [
+            phase
+            for phase in PHASES
+            if phase in reference["timings"] or phase in result["timings"] or phase in errors
+        ]
+        for phase in phases:
+            before, after = reference["timings"].get(phase), result["timings"].get(phase)
+            if after is None:
+                comparison.append(
+                    {
+                        "name": result["name"],
+                        "metric": phase,
+                        "baseline": before,
+                        "current": None,
+                        "ratio": None,
+                        "regression": True,
+                    }
+                )
+            else:
+                metrics[phase] = (before, after)
+        for metric, (before, after) in metrics.items():
+            if not before or after is None:
+                continue
+            ratio = after / before
+            comparison.append(
+                {
+                    "name": result["name"],
+                    "metric": metric,
+                    "baseline": before,
+                    "current": after,
+                    "ratio": ratio,
+                    "regression": ratio > 1 + threshold,
+                }
+            )
+
+    return comparison
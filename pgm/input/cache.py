@@ -0,0 +1,225 @@
+"""
+On-disk cache of the preprocessed input tensors.
+
+Parsing a large edge list and building its adjacency tensor is the slowest part of the start-up
+of a run. This module stores the result of `import_data` in a bundle folder of uncompressed `.npy`
+files, i.e. the coordinates and values of the non-zero entries, the transposed tensor, the values
+of the entries A[j, i] and the node IDs, plus a JSON manifest with the shape and the reciprocity
+of the layers. The bundle is keyed by a fingerprint of the input file and by the loader options,
+and later loads memory-map its arrays instead of parsing the file again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+from typing import Any, Dict, List, Optional, Tuple, Union
+import uuid
+
+import numpy as np
+from sparse import COO
+
+BUNDLE_VERSION = 1  # Version of the layout of the bundle
+FINGERPRINT_BYTES = 2**20  # Bytes read at the start and at the end of the input file
+MANIFEST = "manifest.json"
+
+
+def file_fingerprint(path: Union[str, Path]) -> str:
+    """
+    Return a fingerprint of the content of a file.
+
+    The fingerprint hashes the size and the modification time of the file together with its
+    first and last `FINGERPRINT_BYTES` bytes, so it is computed in constant time even for files
+    of several GB.
+
+    Parameters
+    ----------
+    path : str or Path
+           Path of the file.
+
+    Returns
+    -------
+    fingerprint : str
+                  Hexadecimal BLAKE2 digest.
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if stat.st_size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, stat.st_size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def bundle_key(path: Union[str, Path], options: Dict[str, Any]) -> str:
+    """
+    Return the key of the bundle of an input file read with the given loader options.
+
+    Parameters
+    ----------
+    path : str or Path
+           Path of the input file.
+    options : dict
+              Options of the loader that change the tensors, e.g. `undirected` or `binary`.
+
+    Returns
+    -------
+    key : str
+          Hexadecimal SHA-256 digest.
+    """
+    content = json.dumps(
+        {"version": BUNDLE_VERSION, "file": file_fingerprint(path), "options": options},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def bundle_path(cache_folder: Union[str, Path], path: Union[str, Path], key: str) -> Path:
+    """
+    Return the folder of the bundle of an input file.
+    """
+    return Path(cache_folder) / f"{Path(path).stem}-{key[:16]}"
+
+
+def save_bundle(
+    folder: Union[str, Path],
+    key: str,
+    data: COO,
+    data_T: COO,
+    data_T_vals: np.ndarray,
+    nodes: List,
+    rw: List[float],
+) -> None:
+    """
+    Write the preprocessed tensors of an input file to a bundle folder.
+
+    The files are written to a temporary folder that is renamed at the end, so a bundle is
+    either complete or absent. Several processes can share the cache folder: if a bundle with
+    the same key is already in place, or another process renames its bundle into place first,
+    the temporary folder is discarded and the existing bundle is kept.
+
+    Parameters
+    ----------
+    folder : str or Path
+             Folder of the bundle.
+    key : str
+          Key of the bundle.
+    data : COO
+           Graph adjacency tensor.
+    data_T : COO
+             Transposed graph adjacency tensor.
+    data_T_vals : ndarray
+                  Array with values of entries A[j, i] given non-zero entry (i, j).
+    nodes : list
+            List of node IDs.
+    rw : list
+         Reciprocity of each layer.
+    """
+    folder = Path(folder)
+    tmp_folder = folder.with_name(f"{folder.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp_folder.mkdir(parents=True, exist_ok=True)
+
+    arrays = {
+        "coords": data.coords,
+        "vals": data.data,
+        "coords_T": data_T.coords,
+        "vals_T": data_T.data,
+        "data_T_vals": data_T_vals,
+    }
+    for name, array in arrays.items():
+        np.save(tmp_folder / f"{name}.npy", np.ascontiguousarray(array))
+
+    # The node IDs are stored as an object array, which keeps their types
+    np.save(tmp_folder / "nodes.npy", np.asarray(nodes, dtype=object), allow_pickle=True)
+
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "key": key,
+        "shape": list(data.shape),
+        "nnz": int(data.nnz),
+        "rw": [float(r) for r in rw],
+        "files": sorted(list(arrays) + ["nodes"]),
+    }
+    with open(tmp_folder / MANIFEST, "w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, indent=2)
+
+    existing = _read_manifest(folder)
+    if existing is not None:
+        if existing.get("key") == key:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            logging.debug("Input bundle already saved in: %s", folder)
+            return
+        # Outdated bundle, which another process may be removing too
+        shutil.rmtree(folder, ignore_errors=True)
+    try:
+        os.replace(tmp_folder, folder)
+    except OSError:
+        # Another process renamed its bundle into place first
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        logging.debug("Input bundle saved in %s by another process", folder)
+        return
+    logging.debug("Input bundle saved in: %s", folder)
+
+
+def _read_manifest(folder: Path) -> Optional[Dict[str, Any]]:
+    """
+    Return the manifest of a bundle folder, or None if it is missing or incomplete.
+    """
+    try:
+        with open(folder / MANIFEST, encoding="utf-8") as fp:
+            return json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def load_bundle(
+    folder: Union[str, Path], key: str
+) -> Optional[Tuple[COO, COO, np.ndarray, List, List[float]]]:
+    """
+    Memory-map the preprocessed tensors of a bundle folder.
+
+    Parameters
+    ----------
+    folder : str or Path
+             Folder of the bundle.
+    key : str
+          Expected key of the bundle.
+
+    Returns
+    -------
+    bundle : tuple or None
+             Adjacency tensor, transposed tensor, values of the entries A[j, i], node IDs and
+             reciprocity of each layer; None if the bundle does not exist or does not match,
+             or if another process removed it while it was read.
+    """
+    folder = Path(folder)
+    manifest = _read_manifest(folder)
+    if manifest is None:
+        return None
+    if manifest.get("version") != BUNDLE_VERSION or manifest.get("key") != key:
+        return None
+
+    def mmap(name):
+        # Copy-on-write mapping: the arrays are read lazily and the bundle is never modified
+        return np.load(folder / f"{name}.npy", mmap_mode="c")
+
+    shape = tuple(manifest["shape"])
+    try:
+        arrays = {name: mmap(name) for name in ["coords", "vals", "coords_T", "vals_T"]}
+        data_T_vals = mmap("data_T_vals")
+        node_array = np.load(folder / "nodes.npy", allow_pickle=True)
+    except FileNotFoundError:
+        # The mapped files stay readable, but the bundle was removed before all of them were
+        return None
+    data = COO(arrays["coords"], arrays["vals"], shape=shape, has_duplicates=False, sorted=True)
+    data_T = COO(
+        arrays["coords_T"], arrays["vals_T"], shape=shape, has_duplicates=False, sorted=True
+    )
+    logging.debug("Input bundle loaded from: %s", folder)
+
+    return data, data_T, data_T_vals, list(node_array), manifest["rw"]
@@ -2,6 +2,7 @@
 Functions for handling the data.
 """
 
+from collections.abc import Sequence
 from importlib.resources import files
 import logging
 from pathlib import Path
@@ -13,7 +14,8 @@ import numpy as np
 import pandas as pd
 from sparse import COO
 
-from .preprocessing import build_B_from_A, build_sparse_B_from_A
+from .cache import bundle_key, bundle_path, load_bundle, save_bundle
+from .preprocessing import build_sparse_B_from_coords
 from .stats import print_graph_stat, print_graph_stat_MTCOV
 
 
@@ -27,6 +29,7 @@ def import_data(
     sep: str = "\\s+",
     binary: bool = True,
     header: Optional[int] = None,
+    input_cache: Optional[str] = None,
 ) -> tuple[
     Iterable[nx.MultiDiGraph], Union[ndarray, COO], Optional[COO], Optional[ndarray]
 ]:
@@ -55,11 +58,16 @@ def import_data(
         If set to True, the algorithm reads the graph with binary edges.
     header
         Row number to use as the column names, and the start of the data.
+    input_cache
+        Folder of the cache of the preprocessed tensors. If given, the tensors are read from a
+        memory-mapped bundle when the input file has already been read with the same options,
+        and saved to a new bundle otherwise.
 
     Returns
     -------
     A
-        List of MultiDiGraph NetworkX objects representing the layers of the network.
+        Sequence of MultiDiGraph NetworkX objects representing the layers of the network. The
+        graph of a layer is only built when it is accessed.
     B
         Graph adjacency tensor. If `force_dense` is True, returns a dense ndarray. Otherwise, returns a sparse COO tensor.
     B_T
@@ -69,29 +77,55 @@ def import_data(
         `force_dense` is True. # TODO: check if this is correct with Martina
     """
 
-    # Read adjacency file
-    df_adj = pd.read_csv(dataset, sep=sep, header=header)
-    logging.debug(
-        "Read adjacency file from %s. The shape of the data is %s.",
-        dataset,
-        df_adj.shape,
-    )
-    A = read_graph(
-        df_adj=df_adj,
-        ego=ego,
-        alter=alter,
-        undirected=undirected,
-        noselfloop=noselfloop,
-        binary=binary,
-    )
-    nodes = list(A[0].nodes())
+    bundle, key = None, None
+    if input_cache is not None:
+        options = {
+            "ego": ego,
+            "alter": alter,
+            "undirected": undirected,
+            "noselfloop": noselfloop,
+            "sep": sep,
+            "binary": binary,
+            "header": header,
+        }
+        key = bundle_key(dataset, options)
+        bundle = load_bundle(bundle_path(input_cache, dataset, key), key)
+
+    if bundle is not None:
+        B, B_T, data_T_vals, nodes, rw = bundle
+        A = GraphLayers(B.coords, B.data, nodes, B.shape[0], undirected=undirected)
+    else:
+        # Read adjacency file
+        df_adj = pd.read_csv(dataset, sep=sep, header=header)
+        logging.debug(
+            "Read adjacency file from %s. The shape of the data is %s.",
+            dataset,
+            df_adj.shape,
+        )
+        coords, vals, nodes = read_tensor(
+            df_adj=df_adj,
+            ego=ego,
+            alter=alter,
+            undirected=undirected,
+            noselfloop=noselfloop,
+            binary=binary,
+        )
+        shape = (df_adj.shape[1] - 2, len(nodes), len(nodes))
+        # The NetworkX graphs are only built if a layer is accessed
+        A = GraphLayers(coords, vals, nodes, shape[0], undirected=undirected)
+
+        # Save the network in a tensor
+        B, B_T, data_T_vals, rw = build_sparse_B_from_coords(
+            coords, vals, shape, calculate_reciprocity=True
+        )
+        if input_cache is not None:
+            save_bundle(
+                bundle_path(input_cache, dataset, key), key, B, B_T, data_T_vals, nodes, rw
+            )
 
-    # Save the network in a tensor
     if force_dense:
-        B, rw = build_B_from_A(A, nodes=nodes)
+        B = B.todense()
         B_T, data_T_vals = None, None
-    else:
-        B, B_T, data_T_vals, rw = build_sparse_B_from_A(A, calculate_reciprocity=True)
 
     # Get the current logging level
     current_level = logging.getLogger().getEffectiveLevel()
@@ -145,8 +179,9 @@ def import_data_mtcov(
 
     Returns
     -------
-    A : list of nx.MultiDiGraph
-        List of MultiDiGraph NetworkX objects representing the layers of the network.
+    A : GraphLayers
+        Sequence of MultiDiGraph NetworkX objects representing the layers of the network. The
+        graph of a layer is only built when it is accessed.
     B : ndarray or sparse.COO
         Graph adjacency tensor. If `force_dense` is True, returns a dense ndarray. Otherwise, returns a sparse COO tensor.
     X_attr : pd.DataFrame or None
@@ -179,8 +214,8 @@ def import_data_mtcov(
     )  # read the csv file with the covariates
     logging.debug("Indiv shape: %s", df_X.shape)
 
-    # Create the graph adding nodes and edges
-    A = read_graph(
+    # Build the tensor of the edges; the NetworkX graphs are only built if a layer is accessed
+    coords, vals, nodes = read_tensor(
         df_adj=df_adj,
         ego=ego,
         alter=alter,
@@ -188,8 +223,8 @@ def import_data_mtcov(
         noselfloop=noselfloop,
         binary=False,
     )
-
-    nodes = list(A[0].nodes)
+    shape = (df_adj.shape[1] - 2, len(nodes), len(nodes))
+    A = GraphLayers(coords, vals, nodes, shape[0], undirected=undirected)
 
     # Get the current logging level
     current_level = logging.getLogger().getEffectiveLevel()
@@ -199,10 +234,9 @@ def import_data_mtcov(
         print_graph_stat_MTCOV(A)
 
     # Save the multilayer network in a tensor with all layers
+    B = build_sparse_B_from_coords(coords, vals, shape)
     if force_dense:
-        B, _ = build_B_from_A(A, nodes=nodes, calculate_reciprocity=False)
-    else:
-        B = build_sparse_B_from_A(A)
+        B = B.todense()
 
     # Read the design matrix with covariates
     X_attr = read_design_matrix(df_X, nodes, attribute=attr_name, ego=egoX)
@@ -210,6 +244,198 @@ def import_data_mtcov(
     return A, B, X_attr, nodes
 
 
+class GraphLayers(Sequence):
+    """
+    Layers of a network as NetworkX graphs, built only when they are accessed.
+
+    The loaders build the adjacency tensor directly from the edge list, so the graphs are not
+    needed to fit the models. This sequence keeps the edges of the tensor and creates the
+    MultiDiGraph (or MultiGraph if undirected=True) of a layer the first time it is requested,
+    with the same nodes and edge weights that `read_graph` would give.
+
+    Parameters
+    ----------
+    coords : ndarray
+             Coordinates (layer, source, target) of the non-zero entries of the tensor.
+    vals : ndarray
+           Values of the non-zero entries.
+    nodes : list
+            List of node IDs.
+    L : int
+        Number of layers.
+    undirected : bool
+                 If set to True, the layers are MultiGraph objects.
+    label : str
+            Name of the edge weight attribute.
+    """
+
+    def __init__(
+        self,
+        coords: ndarray,
+        vals: ndarray,
+        nodes: List,
+        L: int,
+        undirected: bool = False,
+        label: str = "weight",
+    ):
+        self.coords = coords
+        self.vals = vals
+        self.nodes = nodes
+        self.L = L
+        self.undirected = undirected
+        self.label = label
+        self._graphs: dict = {}
+
+    def __len__(self) -> int:
+        return self.L
+
+    def __getitem__(self, layer):
+        if isinstance(layer, slice):
+            return [self[i] for i in range(*layer.indices(self.L))]
+        if layer < 0:
+            layer += self.L
+        if not 0 <= layer < self.L:
+            raise IndexError("Layer index out of range.")
+        if layer not in self._graphs:
+            self._graphs[layer] = self._build_graph(layer)
+        return self._graphs[layer]
+
+    def _build_graph(self, layer: int) -> nx.MultiDiGraph:
+        """
+        Build the NetworkX graph of a layer.
+        """
+        graph = nx.MultiGraph() if self.undirected else nx.MultiDiGraph()
+        graph.add_nodes_from(self.nodes)
+
+        in_layer = self.coords[0] == layer
+        sources, targets = self.coords[1][in_layer], self.coords[2][in_layer]
+        weights = self.vals[in_layer].astype(int)
+        if self.undirected:
+            # Each undirected edge is stored twice in the symmetric tensor
+            upper = sources <= targets
+            sources, targets, weights = sources[upper], targets[upper], weights[upper]
+        nodes = np.asarray(self.nodes, dtype=object)
+        graph.add_weighted_edges_from(
+            zip(nodes[sources], nodes[targets], weights.tolist()), weight=self.label
+        )
+        return graph
+
+
+def graph_nodes(A: Sequence) -> List:
+    """
+    Return the node IDs of the layers of a network, without building a GraphLayers graph.
+
+    Parameters
+    ----------
+    A : list or GraphLayers
+        Layers of the network.
+
+    Returns
+    -------
+    nodes : list
+            List of node IDs.
+    """
+    if isinstance(A, GraphLayers):
+        return A.nodes
+    return list(A[0].nodes())
+
+
+def read_tensor(
+    df_adj: pd.DataFrame,
+    ego: str = "source",
+    alter: str = "target",
+    undirected: bool = False,
+    noselfloop: bool = True,
+    binary: bool = True,
+) -> Tuple[ndarray, ndarray, List]:
+    """
+    Build the non-zero entries of the adjacency tensor directly from the edge list.
+
+    This is the vectorized counterpart of `read_graph`: the node IDs are factorized, the rows
+    are expanded over the layers with a positive weight, and the duplicated edges are merged by
+    sorting their coordinates. The entries are the same as the ones of the graphs of `read_graph`.
+
+    Parameters
+    ----------
+    df_adj: DataFrame
+            Pandas DataFrame object containing the edges of the graph.
+    ego: str
+         Name of the column to consider as the source of the edge.
+    alter: str
+           Name of the column to consider as the target of the edge.
+    undirected: bool
+                If set to True, the algorithm considers an undirected graph.
+    noselfloop: bool
+                If set to True, the algorithm removes the self-loops.
+    binary: bool
+            If set to True, read the graph with binary edges.
+
+    Returns
+    -------
+    coords: ndarray
+            Coordinates (layer, source, target) of the non-zero entries, sorted and without
+            duplicates. The tensor is symmetric if undirected=True.
+    vals: ndarray
+          Values of the non-zero entries.
+    nodes: list
+           Sorted list of node IDs.
+    """
+    # Factorize the node IDs, in sorted order
+    n_rows = df_adj.shape[0]
+    codes, uniques = pd.factorize(
+        pd.concat([df_adj[ego], df_adj[alter]], ignore_index=True), sort=True
+    )
+    nodes = list(uniques)
+    N = len(nodes)
+    sources, targets = codes[:n_rows].astype(np.int64), codes[n_rows:].astype(np.int64)
+
+    # Expand the rows over the layers where the edge is present
+    weights = df_adj.iloc[:, 2:].to_numpy()
+    rows, layers = np.nonzero(weights > 0)
+    if binary:
+        vals = np.ones(len(rows))
+    else:
+        vals = weights[rows, layers].astype(int).astype(np.float64)
+    sources, targets = sources[rows], targets[rows]
+    if undirected:
+        sources, targets = np.minimum(sources, targets), np.maximum(sources, targets)
+
+    logging.debug("Creating the network ...")
+    # Merge the duplicated edges
+    keys = (layers.astype(np.int64) * N + sources) * N + targets
+    keys, inverse = np.unique(keys, return_inverse=True)
+    if binary:
+        vals = np.ones(len(keys))
+    else:
+        vals = np.bincount(inverse, weights=vals, minlength=len(keys))
+    layers, sources, targets = np.unravel_index(keys, (weights.shape[1], N, N))
+
+    # Remove self-loops
+    if noselfloop:
+        logging.debug("Removing self loops")
+        keep = sources != targets
+        layers, sources, targets, vals = (
+            layers[keep], sources[keep], targets[keep], vals[keep]
+        )
+
+    # Make the tensor symmetric
+    if undirected:
+        off_diagonal = sources != targets
+        layers = np.concatenate([layers, layers[off_diagonal]])
+        sources, targets = (
+            np.concatenate([sources, targets[off_diagonal]]),
+            np.concatenate([targets, sources[off_diagonal]]),
+        )
+        vals = np.concatenate([vals, vals[off_diagonal]])
+        order = np.lexsort((targets, sources, layers))
+        layers, sources, targets, vals = (
+            layers[order], sources[order], targets[order], vals[order]
+        )
+
+    coords = np.stack([layers, sources, targets]).astype(np.int64)
+    return coords, vals, nodes
+
+
 def read_graph(
     df_adj: pd.DataFrame,
     ego: str = "source",
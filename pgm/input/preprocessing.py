@@ -208,3 +208,101 @@ def preprocess_X(X):
         X = scipy.sparse.csr_matrix(X)
 
     return X
+
+
+def _linear_index(coords: ndarray, shape: Tuple[int, ...]) -> ndarray:
+    """
+    Return the row-major linear index of the coordinates `coords` of a tensor of shape `shape`.
+    """
+    return np.ravel_multi_index(tuple(coords), shape)
+
+
+def lookup_sorted(keys: ndarray, vals: ndarray, query: ndarray) -> ndarray:
+    """
+    Return the values of the entries with linear index `query` among sorted entries.
+
+    Parameters
+    ----------
+    keys : ndarray
+           Sorted linear indices of the non-zero entries of a tensor.
+    vals : ndarray
+           Values of the non-zero entries.
+    query : ndarray
+            Linear indices of the entries to look up.
+
+    Returns
+    -------
+    found_vals : ndarray
+                 Values of the entries, 0 for the entries that are not among `keys`.
+    """
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=np.result_type(vals, float))
+    pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[pos] == query, vals[pos], 0)
+
+
+def build_sparse_B_from_coords(
+    coords: ndarray,
+    vals: ndarray,
+    shape: Tuple[int, int, int],
+    calculate_reciprocity: bool = False,
+) -> Union[COO, Tuple[COO, COO, ndarray, List[Any]]]:
+    """
+    Create the sparse adjacency tensor from the coordinates and values of its non-zero entries.
+
+    This is the NetworkX-free counterpart of `build_sparse_B_from_A`: the transposed tensor and
+    the values of the entries A[j, i] are found by sorting the coordinates, instead of converting
+    every layer to a scipy sparse array.
+
+    Parameters
+    ----------
+    coords : ndarray
+             Coordinates (layer, source, target) of the non-zero entries, without duplicates.
+    vals : ndarray
+           Values of the non-zero entries.
+    shape : tuple
+            Shape (L, N, N) of the adjacency tensor.
+    calculate_reciprocity : bool, optional
+                            Whether to calculate and return the transposed tensor, the values of
+                            the entries A[j, i] and the reciprocity values. Default is False.
+
+    Returns
+    -------
+    data : SparseTensor or Tuple[SparseTensor, SparseTensor, ndarray, List[Any]]
+           Graph adjacency tensor. If calculate_reciprocity is True, returns a tuple with the
+           adjacency tensor, its transpose, an array with values of entries A[j, i] given non-zero
+           entry (i, j), and a list of reciprocity values.
+    """
+    coords = np.asarray(coords, dtype=np.int64)
+    vals = np.asarray(vals, dtype=np.float64)
+
+    # Sort the entries by layer, source and target
+    keys = _linear_index(coords, shape)
+    order = np.argsort(keys, kind="stable")
+    keys, coords, vals = keys[order], coords[:, order], vals[order]
+    data = COO(coords, vals, shape=shape, has_duplicates=False, sorted=True)
+    if not calculate_reciprocity:
+        return data
+
+    # Look up the entry (j, i) of every non-zero entry (i, j) among the sorted keys
+    keys_T = _linear_index(coords[[0, 2, 1]], shape)
+    data_T_vals = lookup_sorted(keys, vals, keys_T)
+
+    # The transposed tensor holds the same entries, sorted by layer, target and source
+    order_T = np.argsort(keys_T, kind="stable")
+    data_T = COO(
+        coords[[0, 2, 1]][:, order_T],
+        vals[order_T],
+        shape=shape,
+        has_duplicates=False,
+        sorted=True,
+    )
+
+    # Reciprocity of every layer, weighted by the values of the entries
+    L = shape[0]
+    num = np.bincount(coords[0], weights=vals * data_T_vals, minlength=L)
+    den = np.bincount(coords[0], weights=vals, minlength=L)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rw = list(num / den)
+
+    return data, data_T, data_T_vals, rw
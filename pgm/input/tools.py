@@ -4,13 +4,16 @@ checking if an object can be cast to an integer, normalizing matrices, determini
 tensors, and converting between dense and sparse representations.
 """
 
+import contextlib
+import dataclasses
 import logging
 from pathlib import Path
-from typing import Dict, List, Tuple, Type, Union
+from typing import Dict, List, Optional, Tuple, Type, Union
 
 import networkx as nx
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 from sparse import COO
 
 
@@ -182,6 +185,63 @@ def transpose_ij2(M: np.ndarray) -> np.ndarray:
     return np.einsum("ij->ji", M)
 
 
+def contract_uvw(
+    u: np.ndarray,
+    v: np.ndarray,
+    w: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    n_threads: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Compute the mean lambda0_aij = sum_kq u_ik w_akq v_jq of every layer with matrix products.
+
+    Each layer is computed as (u @ w_a) @ v.T, or (u * w_a) @ v.T if the affinity is
+    assortative, so the only memory needed besides the output is one N x K matrix, instead of
+    the N x N x K x K tensor of the outer product of u and v.
+
+    Parameters
+    ----------
+    u : ndarray
+        Out-going membership matrix.
+    v : ndarray
+        In-coming membership matrix.
+    w : ndarray
+        Affinity tensor, of shape (L, K, K), or (L, K) if it is assortative.
+    out : ndarray, optional
+          Array of shape (L, N, N) where the result is written.
+    n_threads : int, optional
+                Number of BLAS threads used by the matrix products. The default leaves the
+                number of threads of the BLAS library unchanged.
+
+    Returns
+    -------
+    M : ndarray
+        Mean lambda0_aij for all entries.
+    """
+    shape = (w.shape[0], u.shape[0], v.shape[0])
+    if out is None:
+        out = np.empty(shape, dtype=np.result_type(u, v, w))
+    elif out.shape != shape:
+        log_and_raise_error(
+            ValueError, f"The output array has shape {out.shape} instead of {shape}."
+        )
+
+    if n_threads is None:
+        limits = contextlib.nullcontext()
+    else:
+        # threadpoolctl is a dependency of scikit-learn
+        from threadpoolctl import threadpool_limits  # pylint: disable=import-outside-toplevel
+
+        limits = threadpool_limits(limits=n_threads, user_api="blas")
+
+    with limits:
+        for a in range(shape[0]):
+            uw = u * w[a] if w.ndim == 2 else u @ w[a]
+            np.matmul(uw, v.T, out=out[a])
+
+    return out
+
+
 def Exp_ija_matrix(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarray:
     """
     Compute the mean lambda0_ij for all entries.
@@ -201,17 +261,7 @@ def Exp_ija_matrix(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarray:
         Mean lambda0_ij for all entries.
     """
 
-    # Compute the outer product of matrices u and v, resulting in a 4D tensor M.
-    # Dimensions of M: (number of rows in u) x (number of columns in v) x
-    # (number of rows in u) x (number of columns in v)
-    M = np.einsum("ik,jq->ijkq", u, v)
-
-    # Multiply the 4D tensor M element-wise with the 2D tensor w along the last dimension.
-    # Dimensions of w: (number of columns in v) x (number of columns in w)
-    # Resulting tensor after the einsum operation: (number of rows in u) x (number of rows in u)
-    M = np.einsum("ijkq,kq->ij", M, w)
-
-    return M
+    return contract_uvw(u, v, w[np.newaxis])[0]
 
 
 def check_symmetric(
@@ -561,6 +611,592 @@ def sp_uttkrp_assortative(
     return out
 
 
+@dataclasses.dataclass
+class NonzeroIndex:
+    """
+    Sorted views of the non-zero coordinates of a data tensor.
+
+    The coordinates of the non-zero entries do not change during a fit, so they are sorted once
+    by layer, by source and by target. For each mode, `order[mode]` is the permutation that sorts
+    the entries by that mode and `indptr[mode]` delimits the contiguous segment of every index,
+    as in the CSR format. Scatter-adds over a mode then become segment sums over these segments.
+
+    Attributes
+    ----------
+    subs : tuple
+           Indices of the non-zero entries, in their original order.
+    shape : tuple
+            Shape of the data tensor.
+    order : tuple
+            For each mode, the permutation that sorts the non-zero entries by that mode.
+    indptr : tuple
+             For each mode, the boundaries of the segment of every index in the sorted order.
+    """
+
+    subs: Tuple[np.ndarray, ...]
+    shape: Tuple[int, ...]
+    order: Tuple[np.ndarray, ...]
+    indptr: Tuple[np.ndarray, ...]
+
+    @classmethod
+    def from_subs(
+        cls, subs: Union[Tuple[np.ndarray, ...], np.ndarray], shape: Tuple[int, ...]
+    ) -> "NonzeroIndex":
+        """
+        Build the index from the coordinates of the non-zero entries.
+
+        Parameters
+        ----------
+        subs : tuple or ndarray
+               Indices of the non-zero entries, one array per mode.
+        shape : tuple
+                Shape of the data tensor.
+
+        Returns
+        -------
+        NonzeroIndex
+            Index with the coordinates sorted along every mode.
+        """
+        subs = tuple(np.asarray(s, dtype=np.int64) for s in subs)
+        order, indptr = [], []
+        for mode, dim in enumerate(shape):
+            order_mode = np.argsort(subs[mode], kind="stable")
+            order.append(order_mode)
+            indptr.append(
+                np.searchsorted(subs[mode], np.arange(dim + 1), sorter=order_mode)
+            )
+
+        return cls(subs=subs, shape=tuple(shape), order=tuple(order), indptr=tuple(indptr))
+
+    @property
+    def nnz(self) -> int:
+        """
+        Number of non-zero entries.
+        """
+        return self.subs[0].shape[0]
+
+    def sorted_subs(self, mode: int) -> Tuple[np.ndarray, ...]:
+        """
+        Return the coordinates of the non-zero entries sorted by the given mode.
+
+        Parameters
+        ----------
+        mode : int
+               Mode used to sort the coordinates: 0 for the layer, 1 for the source and 2 for the
+               target.
+
+        Returns
+        -------
+        tuple
+            Indices of the non-zero entries sorted by the given mode.
+        """
+        return tuple(s[self.order[mode]] for s in self.subs)
+
+    def segments(self, mode: int):
+        """
+        Iterate over the non-empty segments of the given mode.
+
+        Parameters
+        ----------
+        mode : int
+               Mode of the segments.
+
+        Yields
+        ------
+        index : int
+                Index along the mode.
+        entries : ndarray
+                  Positions of the non-zero entries with that index.
+        """
+        indptr = self.indptr[mode]
+        for index in np.flatnonzero(indptr[:-1] < indptr[1:]):
+            yield index, self.order[mode][indptr[index] : indptr[index + 1]]
+
+    def segment_sum(
+        self, mode: int, X: np.ndarray, weights: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Sum the rows of X, optionally weighted, over the segments of the given mode.
+
+        It is equivalent to one `np.bincount(subs[mode], weights=weights * X[:, k])` per column of
+        X. The stored segments are used as the row pointers of a CSR matrix, so that all the
+        columns are reduced in a single pass without sorting the entries again.
+
+        Parameters
+        ----------
+        mode : int
+               Mode along which the rows are summed.
+        X : ndarray
+            Array of shape (nnz,) or (nnz, K) with the contribution of each non-zero entry.
+        weights : ndarray, optional
+                  Weight of each non-zero entry.
+
+        Returns
+        -------
+        out : ndarray
+              Array of shape (shape[mode],) or (shape[mode], K).
+        """
+        if weights is None:
+            weights = np.ones(self.nnz)
+        P = csr_matrix(
+            (weights[self.order[mode]], self.order[mode], self.indptr[mode]),
+            shape=(self.shape[mode], self.nnz),
+        )
+
+        return np.asarray(P @ X)
+
+
+def entries_at(data: Union[COO, np.ndarray], subs: Tuple[np.ndarray, ...]) -> np.ndarray:
+    """
+    Return the entries of a dense or sparse tensor at the given coordinates.
+
+    The entries of a sparse tensor are found by binary search among the linear indices of its
+    non-zero entries, so the tensor is never made dense.
+
+    Parameters
+    ----------
+    data : ndarray or COO
+           Data tensor.
+    subs : tuple
+           Coordinates of the entries, one array per mode.
+
+    Returns
+    -------
+    vals : ndarray
+           Values of the entries, 0 for the entries that are not stored in a sparse tensor.
+    """
+    if not isinstance(data, COO):
+        return np.asarray(data)[subs]
+
+    keys = np.ravel_multi_index(tuple(data.coords), data.shape)
+    vals = data.data
+    if np.any(keys[1:] < keys[:-1]):
+        order = np.argsort(keys, kind="stable")
+        keys, vals = keys[order], vals[order]
+    query = np.ravel_multi_index(subs, data.shape)
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=np.result_type(vals, float))
+    pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    return np.where(keys[pos] == query, vals[pos], 0)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """
+    Return the SplitMix64 finalizer of unsigned 64-bit integers, a bijection that spreads every
+    input bit over the whole output.
+    """
+    x = np.array(x, dtype=np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def hash_fold(
+    subs: Tuple[np.ndarray, np.ndarray, np.ndarray], N: int, rseed: int, NFold: int
+) -> np.ndarray:
+    """
+    Return the fold of the entries (a, i, j) of the adjacency tensor, computed by hashing their
+    coordinates with the random seed.
+
+    The folds are disjoint and have approximately the same size, like the ones of
+    `pgm.model_selection.masking.extract_mask_kfold`, but the fold of an entry is computed
+    without shuffling all the L x N x N entries.
+
+    Parameters
+    ----------
+    subs : tuple
+           Coordinates (layer, row, column) of the entries.
+    N : int
+        Number of nodes.
+    rseed : int
+            Random seed.
+    NFold : int
+            Number of total folds.
+
+    Returns
+    -------
+    folds : ndarray
+            Fold of each entry.
+    """
+    a, i, j = (np.asarray(s, dtype=np.uint64) for s in subs)
+    key = (a * np.uint64(N) + i) * np.uint64(N) + j
+    seed = _mix64(np.array([rseed], dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15))
+    return (_mix64(key ^ seed) % np.uint64(NFold)).astype(np.int64)
+
+
+@dataclasses.dataclass
+class MaskIndex:
+    """
+    Entries of the held-out set of a fit, with the values of the data and of its transpose there.
+
+    The mask and the data do not change during a fit, so the masked likelihoods can be computed
+    from this index on every convergence check, in O(|mask|) time and without making the data
+    dense.
+
+    Attributes
+    ----------
+    subs : tuple
+           Indices of the entries selected by the mask, sorted by layer, source and target.
+    shape : tuple
+            Shape of the data tensor.
+    data_vals : ndarray
+                Values of the data at the entries of the mask.
+    data_T_vals : ndarray
+                  Values of the transposed data at the entries of the mask.
+    indptr : ndarray
+             Boundaries of the entries of every row (layer, source), as in the CSR format.
+    """
+
+    subs: Tuple[np.ndarray, ...]
+    shape: Tuple[int, ...]
+    data_vals: np.ndarray
+    data_T_vals: np.ndarray
+    indptr: np.ndarray
+
+    @classmethod
+    def from_mask(
+        cls,
+        mask: np.ndarray,
+        data: Union[COO, np.ndarray],
+        data_T: Optional[Union[COO, np.ndarray]] = None,
+    ) -> "MaskIndex":
+        """
+        Build the index of the entries selected by a mask.
+
+        Parameters
+        ----------
+        mask : ndarray
+               Mask for selecting the held out set in the adjacency tensor.
+        data : ndarray or COO
+               Graph adjacency tensor.
+        data_T : ndarray or COO, optional
+                 Transposed graph adjacency tensor. If None, its values are read from `data`.
+
+        Returns
+        -------
+        MaskIndex
+            Index of the entries of the mask.
+        """
+        subs = tuple(np.asarray(s, dtype=np.int64) for s in np.nonzero(np.asarray(mask) > 0))
+        subs_T = (subs[0], subs[2], subs[1])
+        data_T_vals = entries_at(data, subs_T) if data_T is None else entries_at(data_T, subs)
+
+        L, N = mask.shape[0], mask.shape[1]
+        rows = subs[0] * N + subs[1]
+        indptr = np.searchsorted(rows, np.arange(L * N + 1))
+
+        return cls(
+            subs=subs,
+            shape=tuple(mask.shape),
+            data_vals=entries_at(data, subs),
+            data_T_vals=data_T_vals,
+            indptr=indptr,
+        )
+
+    @property
+    def nz(self) -> np.ndarray:
+        """
+        Boolean array marking the entries of the mask where the data is non-zero.
+        """
+        return self.data_vals != 0
+
+    @property
+    def subs_nz(self) -> Tuple[np.ndarray, ...]:
+        """
+        Indices of the entries of the mask where the data is non-zero.
+        """
+        nz = self.nz
+        return tuple(s[nz] for s in self.subs)
+
+    def lambda0_sum(self, u: np.ndarray, v: np.ndarray, w: np.ndarray) -> float:
+        """
+        Sum the mean lambda0_ij over the entries of the mask.
+
+        It is equal to `lambda0_sum(u, v, w, mask=mask)`, with the masked entries of each row
+        summed through a CSR matrix instead of a product with the dense mask.
+
+        Parameters
+        ----------
+        u : ndarray
+            Out-going membership matrix.
+        v : ndarray
+            In-coming membership matrix.
+        w : ndarray
+            Affinity tensor, of shape (L, K, K) or (L, K) in the assortative case.
+
+        Returns
+        -------
+        M_sum : float
+                Sum of the mean lambda0 over the mask.
+        """
+        L, N = self.shape[0], self.shape[1]
+        P = csr_matrix(
+            (np.ones(len(self.subs[2])), self.subs[2], self.indptr), shape=(L * N, v.shape[0])
+        )
+        MV = np.asarray(P @ v).reshape(L, N, -1)
+        if w.ndim == 2:
+            return np.einsum("ik,aik,ak->", u, MV, w)
+        return np.einsum("ik,aiq,akq->", u, MV, w)
+
+
+def _segment_sum(
+    vals: np.ndarray, rows: np.ndarray, X: np.ndarray, D: int
+) -> np.ndarray:
+    """
+    Scatter-add the rows of X, weighted by vals, into a (D, K) matrix.
+
+    The scatter is expressed as the product of a (D, nnz) CSR matrix with X, so that all the
+    columns are accumulated in a single pass over the non-zero entries.
+
+    Parameters
+    ----------
+    vals : ndarray
+           Weights of the rows of X.
+    rows : ndarray
+           Output row of each row of X.
+    X : ndarray
+        Matrix with the contributions of each non-zero entry.
+    D : int
+        Number of rows of the output matrix.
+
+    Returns
+    -------
+    out : ndarray
+          Matrix of shape (D, K) with the weighted sums of the rows of X.
+    """
+    nnz = rows.shape[0]
+    P = csr_matrix((vals, (rows, np.arange(nnz))), shape=(D, nnz))
+
+    return np.asarray(P @ X)
+
+
+def _contract_by_layer(
+    layers: np.ndarray,
+    X: np.ndarray,
+    w: np.ndarray,
+    temporal: bool = True,
+    index: Optional[NonzeroIndex] = None,
+) -> np.ndarray:
+    """
+    Compute X[I] @ w[layers[I]].T for every non-zero entry I, with one matrix product per layer.
+
+    Parameters
+    ----------
+    layers : ndarray
+             Layer index of each row of X.
+    X : ndarray
+        Gathered membership matrix of shape (nnz, K).
+    w : ndarray
+        Affinity tensor of shape (L, K, K).
+    temporal : bool
+        If False, only the first layer of the affinity tensor is used.
+    index : NonzeroIndex, optional
+            Precomputed index of the non-zero entries, used to find the layer segments.
+
+    Returns
+    -------
+    out : ndarray
+          Matrix of shape (nnz, K).
+    """
+    if not temporal or w.shape[0] == 1:
+        return X @ w[0].T
+
+    out = np.empty((X.shape[0], w.shape[1]), dtype=np.result_type(X, w))
+    if index is None:
+        index = NonzeroIndex.from_subs((layers,), (w.shape[0],))
+    for a, idx in index.segments(0):
+        out[idx] = X[idx] @ w[a].T
+
+    return out
+
+
+def sp_uttkrp_fused(
+    vals: np.ndarray,
+    subs: Tuple[np.ndarray],
+    m: int,
+    u: np.ndarray,
+    v: np.ndarray,
+    w: np.ndarray,
+    temporal: bool = True,
+    index: Optional[NonzeroIndex] = None,
+) -> np.ndarray:
+    """
+    Compute the Khatri-Rao product (sparse version) with a single pass over the non-zero entries.
+
+    It returns the same result as `sp_uttkrp`, but the membership matrix is gathered once, the
+    contraction with the affinity tensor is done for all the communities at once and the
+    scatter-add is a single CSR segment-sum.
+
+    Parameters
+    ----------
+    vals : ndarray
+           Values of the non-zero entries.
+    subs : tuple
+           Indices of elements that are non-zero. It is a n-tuple of array-likes and the length
+           of tuple n must be equal to the dimension of tensor.
+    m : int
+        Mode in which the Khatri-Rao product of the membership matrix is multiplied with the
+        tensor: if 1 it works with the matrix u; if 2 it works with v.
+    u : ndarray
+        Out-going membership matrix.
+    v : ndarray
+        In-coming membership matrix.
+    w : ndarray
+        Affinity tensor.
+    temporal : bool
+        Flag to determine if the function should behave in a temporal manner.
+    index : NonzeroIndex, optional
+            Precomputed index of subs. If given, its segments are used for the scatter-add.
+
+    Returns
+    -------
+    out : ndarray
+          Matrix which is the result of the matrix product of the unfolding of the tensor and
+          the Khatri-Rao product of the membership matrix.
+    """
+
+    if len(subs) < 3:
+        log_and_raise_error(ValueError, "subs_nz should have at least 3 elements.")
+    if m not in (1, 2):
+        log_and_raise_error(ValueError, "m should be 1 or 2.")
+
+    D = u.shape[0] if m == 1 else v.shape[0]
+
+    # Gather the membership matrix of the other mode once
+    X = v[subs[2], :] if m == 1 else u[subs[1], :]
+    # Orient the affinity tensor so that its last axis multiplies the gathered matrix
+    w_m = w if m == 1 else np.swapaxes(w, 1, 2)
+
+    XW = _contract_by_layer(subs[0], X, w_m, temporal=temporal, index=index)
+
+    if index is not None:
+        return index.segment_sum(m, XW, vals)
+    return _segment_sum(vals, subs[m], XW, D)
+
+
+def sp_uttkrp_assortative_fused(
+    vals: np.ndarray,
+    subs: Tuple[np.ndarray],
+    m: int,
+    u: np.ndarray,
+    v: np.ndarray,
+    w: np.ndarray,
+    temporal: bool = False,
+    index: Optional[NonzeroIndex] = None,
+) -> np.ndarray:
+    """
+    Compute the Khatri-Rao product (sparse version) with the assumption of assortativity, with a
+    single pass over the non-zero entries.
+
+    It returns the same result as `sp_uttkrp_assortative`.
+
+    Parameters
+    ----------
+    vals : ndarray
+           Values of the non-zero entries.
+    subs : tuple
+           Indices of elements that are non-zero. It is a n-tuple of array-likes and the length
+           of tuple n must be equal to the dimension of tensor.
+    m : int
+        Mode in which the Khatri-Rao product of the membership matrix is multiplied with the
+        tensor: if 1 it works with the matrix u; if 2 it works with v.
+    u : ndarray
+        Out-going membership matrix.
+    v : ndarray
+        In-coming membership matrix.
+    w : ndarray
+        Affinity tensor.
+    temporal : bool
+        If True, use the layer of each non-zero entry to select the affinity tensor slice.
+    index : NonzeroIndex, optional
+            Precomputed index of subs. If given, its segments are used for the scatter-add.
+
+    Returns
+    -------
+    out : ndarray
+          Matrix which is the result of the matrix product of the unfolding of the tensor and
+          the Khatri-Rao product of the membership matrix.
+    """
+
+    if len(subs) < 3:
+        log_and_raise_error(ValueError, "subs_nz should have at least 3 elements.")
+    if m not in (1, 2):
+        log_and_raise_error(ValueError, "m should be 1 or 2.")
+
+    D = u.shape[0] if m == 1 else v.shape[0]
+
+    # Gather the membership matrix of the other mode once and weight it by the affinity tensor
+    X = v[subs[2], :] if m == 1 else u[subs[1], :]
+    X = X * (w[subs[0], :] if temporal else w[0, :][np.newaxis, :])
+
+    if index is not None:
+        return index.segment_sum(m, X, vals)
+    return _segment_sum(vals, subs[m], X, D)
+
+
+def uttkrp_w(
+    vals: np.ndarray,
+    subs: Tuple[np.ndarray],
+    u: np.ndarray,
+    v: np.ndarray,
+    L: int,
+    assortative: bool = False,
+    index: Optional[NonzeroIndex] = None,
+) -> np.ndarray:
+    """
+    Compute the statistic of the non-zero entries used in the update of the affinity tensor.
+
+    For every layer a < L, it returns sum_I vals_I u[i_I] (x) v[j_I] over the non-zero entries
+    I = (a, i_I, j_I) of the layer, i.e. (vals * u[src]).T @ v[dst] with one matrix product per
+    layer. Only an (nnz_a, K) block is gathered for each layer a, so the memory is O(nnz K)
+    instead of the O(nnz K^2) of the outer products of all the entries.
+
+    Parameters
+    ----------
+    vals : ndarray
+           Values of the non-zero entries.
+    subs : tuple
+           Indices of elements that are non-zero. It is a n-tuple of array-likes and the length
+           of tuple n must be equal to the dimension of tensor.
+    u : ndarray
+        Out-going membership matrix.
+    v : ndarray
+        In-coming membership matrix.
+    L : int
+        Number of layers of the affinity tensor. The entries of the layers a >= L are ignored.
+    assortative : bool
+                  If True, only the diagonal of the statistic of each layer is computed.
+    index : NonzeroIndex, optional
+            Precomputed index of subs. If given, its layer segments are used.
+
+    Returns
+    -------
+    out : ndarray
+          Array of shape (L, K, K), or (L, K) if assortative.
+    """
+    K = u.shape[1]
+    shape = (L, K) if assortative else (L, K, K)
+    out = np.zeros(shape, dtype=np.result_type(vals, u, v))
+    if index is None:
+        n_layers = int(subs[0].max()) + 1 if len(subs[0]) > 0 else L
+        index = NonzeroIndex.from_subs(tuple(subs[:1]), (max(L, n_layers),))
+
+    for a, idx in index.segments(0):
+        if a >= L:
+            break
+        Uv = u[subs[1][idx]] * vals[idx, np.newaxis]
+        V = v[subs[2][idx]]
+        if assortative:
+            out[a] = np.einsum("Ik,Ik->k", Uv, V)
+        else:
+            out[a] = Uv.T @ V
+
+    return out
+
+
 def log_and_raise_error(error_type: Type[BaseException], message: str) -> None:
     """
     Logs an error message and raises an exception of the specified type.
@@ -10,13 +10,14 @@ import time
 import numpy as np
 from sparse import COO
 
-from .input.loader import import_data, import_data_mtcov
+from .input.loader import graph_nodes, import_data, import_data_mtcov
 from .input.tools import log_and_raise_error
 from .model.acd import AnomalyDetection
 from .model.crep import CRep
 from .model.dyncrep import DynCRep
 from .model.jointcrep import JointCRep
 from .model.mtcov import MTCOV
+from .model.profiling import save_profile
 
 
 def parse_args():
@@ -95,6 +96,34 @@ def parse_args():
     shared_parser.add_argument(
         "--initialization", type=int, default=0, help="Initialization method"
     )
+    shared_parser.add_argument(
+        "--n_jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to run the realizations (-1 uses all the CPUs)",
+    )
+    shared_parser.add_argument(
+        "--input_cache",
+        type=str,
+        default=None,
+        help="Folder where the preprocessed input tensors are cached and memory-mapped",
+    )
+    shared_parser.add_argument(
+        "--adaptive_check",
+        action="store_true",
+        help="Flag to adapt the interval between the checks of the log-likelihood to its cost",
+    )
+    shared_parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Path of the JSON file where the profile of the EM phases is saved",
+    )
+    shared_parser.add_argument(
+        "--profile_memory",
+        action="store_true",
+        help="Flag to also profile the peak memory of the EM phases (slower)",
+    )
     shared_parser.add_argument(
         "--out_inference",
         action="store_true",
@@ -334,6 +363,12 @@ def parse_args():
     acd_parser.add_argument(
         "--fix_mupr", type=bool, default=False, help="Flag to fix mupr"
     )
+    acd_parser.add_argument(
+        "--implicit_q",
+        action="store_true",
+        default=False,
+        help="Flag to avoid storing the dense posterior Q",
+    )
     acd_parser.add_argument(
         "-A",
         "--adj_name",
@@ -380,7 +415,6 @@ def main():
     if args.algorithm != "MTCOV":
         if args.algorithm == "DynCRep":
             binary = True  # exactly this in source
-            args.force_dense = True  # exactly this in source
 
         network = args.files + "/" + args.adj_name
         if args.algorithm != "ACD":
@@ -393,15 +427,17 @@ def main():
                 noselfloop=noselfloop,
                 binary=binary,
                 header=0,
+                input_cache=args.input_cache,
             )
         else:
             A, B, B_T, data_T_vals = import_data(
                 network,
                 header=0,
+                input_cache=args.input_cache,
             )
         logging.debug("Data looks like this: %s", B)
         logging.debug("Data loaded successfully from %s", network)
-        nodes = A[0].nodes()
+        nodes = graph_nodes(A)
         Xs = None
 
         if args.algorithm == "DynCRep":
@@ -442,6 +478,10 @@ def main():
             "convergence_tol",
             "plot_loglikelihood",
             "flag_conv",
+            "n_jobs",
+            "profile",
+            "profile_memory",
+            "adaptive_check",
         ]
         # Define the args that are related to data loading
         data_loading_args = [
@@ -454,6 +494,7 @@ def main():
             "noselfloop",
             "binary",
             "adj_name",
+            "input_cache",
         ]
         filtered_args = {
             k: v
@@ -507,7 +548,12 @@ def main():
     # Create the model
     if args.algorithm in algorithm_classes:
         model = algorithm_classes[args.algorithm](
-            flag_conv=args.flag_conv, num_realizations=args.num_realizations
+            flag_conv=args.flag_conv,
+            num_realizations=args.num_realizations,
+            n_jobs=args.n_jobs,
+            profile=args.profile is not None,
+            profile_memory=args.profile_memory,
+            adaptive_check=args.adaptive_check,
         )
 
     else:
@@ -521,3 +567,7 @@ def main():
 
     # Print the time elapsed
     logging.info("Time elapsed: %.2f seconds.", time.time() - time_start)
+
+    if args.profile is not None:
+        save_profile(model.profile_, args.profile)
+        logging.info("Profile of the EM phases saved in: %s", args.profile)
@@ -6,7 +6,7 @@ The latent variables are related to community memberships and anomaly parameters
 import logging
 from pathlib import Path
 import time
-from typing import List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -15,10 +15,11 @@ from sparse import COO
 
 from pgm.input.preprocessing import preprocess
 from pgm.input.tools import (
-    get_item_array_from_subs, inherit_docstring, log_and_raise_error, sp_uttkrp,
-    sp_uttkrp_assortative, transpose_tensor)
+    get_item_array_from_subs, inherit_docstring, log_and_raise_error, NonzeroIndex,
+    sp_uttkrp_assortative_fused, sp_uttkrp_fused, transpose_tensor, uttkrp_w)
 from pgm.model.base import ModelBase, ModelUpdateMixin
-from pgm.model.constants import EPS_
+from pgm.model.constants import BLOCK_ENTRIES_, EPS_
+from pgm.model.profiling import profiled
 from pgm.output.evaluate import lambda0_full, lambda0_nz
 
 
@@ -28,6 +29,8 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
     detection on networks with reciprocity.
     """
 
+    _delta_names = ("u", "v", "w", "pibr", "mupr")
+
     @inherit_docstring(ModelBase)
     def __init__(
         self,
@@ -65,6 +68,9 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         self.fix_mupr = kwargs.get("fix_mupr", False)
         self.pibr = kwargs.get("pibr0", None)  # pi: anomaly parameter
         self.mupr = kwargs.get("mupr0", None)  # mu: prior
+        self.implicit_q = kwargs.get(
+            "implicit_q", False
+        )  # if True, never store the dense tensors Q and lambda0
 
         if self.pibr is not None:
             if (self.pibr < 0) or (self.pibr > 1):
@@ -116,6 +122,7 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         out_folder: Path = Path("outputs"),
         end_file: str = None,
         files: Union[str, Path] = None,
+        implicit_q: bool = False,
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float, float, float]:
         """
         Fit the AnomalyDetection model to the provided data.
@@ -166,6 +173,10 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             Suffix for the output file, by default None.
         files : Union[str, Path], optional
             Path to the file for initialization, by default None.
+        implicit_q : bool, optional
+            If True, the posterior Q and the mean lambda0 are never stored as dense (L, N, N)
+            tensors. Q is kept only on the non-zero entries, and the sums over all the entries are
+            computed block by block. By default False.
 
         Returns
         -------
@@ -204,6 +215,7 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             out_folder=out_folder,
             end_file=end_file,
             files=files,
+            implicit_q=implicit_q,
         )
         self.rseed = rseed  # random seed
         logging.debug("Fixing random seed to: %s", self.rseed)
@@ -224,18 +236,14 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         self.mask = mask
         self.subs_nz = subs_nz
         self.subs_nz_mask = subs_nz_mask
+        # Sort the non-zero entries once, to reuse the segments in every EM iteration
+        self.nz_index = NonzeroIndex.from_subs(subs_nz, data.shape)
+        if self.implicit_q:
+            self.nz_T_pos = self._transpose_positions(subs_nz, data.shape)
 
         # Run the Expectation-Maximization (EM) algorithm for a specified number of realizations
-        for r in range(self.num_realizations):
-
-            # Initialize the parameters for the current realization
-            coincide, convergence, it, loglik, loglik_values = (
-                self._initialize_realization()
-            )
-            # Update the parameters for the current realization
-            it, loglik, coincide, convergence, loglik_values = self._update_realization(
-                r, it, loglik, coincide, convergence, loglik_values
-            )
+        # (the realizations run on a pool of processes when n_jobs > 1)
+        for r, (it, loglik, convergence, loglik_values) in self._realizations():
 
             # If the current log-likelihood is greater than the maximum log-likelihood so far,
             # update the optimal parameters and the maximum log-likelihood
@@ -389,6 +397,18 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             max_entry = np.max(self.w)
             self.w += max_entry * self.err * np.random.random_sample(self.w.shape)
 
+    def _realization_state(self) -> Dict[str, Any]:
+        """
+        Return the parameters of the current realization read by `_update_optimal_parameters`.
+        """
+        state = super()._realization_state()
+        state.update(pibr=self.pibr, mupr=self.mupr)
+        if self.flag_anomaly and self.implicit_q:
+            state["Qij_nz"] = self.Qij_nz
+        elif self.flag_anomaly:
+            state["Qij_dense"] = self.Qij_dense
+        return state
+
     def _copy_variables(self, source_suffix: str, target_suffix: str) -> None:
         """
         Copy variables from source to target.
@@ -408,6 +428,7 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             source_var = getattr(self, f"{var_name}{source_suffix}")
             setattr(self, f"{var_name}{target_suffix}", float(source_var))
 
+    @profiled()
     def _update_cache(
         self,
         data: Union[COO, np.ndarray],
@@ -436,8 +457,20 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             self.lambda0_nzT = lambda0_nz(
                 subs_nz, self.v, self.u, self.w, self.assortative
             )
+        if self.implicit_q:
+            # Parameters used to recompute the blocks of lambda0 and Q until the next update
+            self.theta_cache = {
+                "u": self.u.copy(),
+                "v": self.v.copy(),
+                "w": self.w.copy(),
+                "pibr": float(self.pibr),
+                "mupr": float(self.mupr),
+            }
         if self.flag_anomaly == True:
-            self.Qij_dense, self.Qij_nz = self._QIJ(data, data_T_vals, subs_nz)
+            if self.implicit_q:
+                self.Qij_nz = self._QIJ_nz(data, data_T_vals, subs_nz)
+            else:
+                self.Qij_dense, self.Qij_nz = self._QIJ(data, data_T_vals, subs_nz)
         self.M_nz = self.lambda0_nz
         self.M_nz[self.M_nz == 0] = 1
 
@@ -477,6 +510,46 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         nz_recon_I : ndarray
                      Mean lambda0_ij for only non-zero entries.
         """
+        nz_recon_I = self._Q_nz_recon(data, data_T_vals, subs_nz)
+
+        lambda0_ija = lambda0_full(self.u, self.v, self.w)
+        Q_ij_dense = self._Q_zero(
+            lambda0_ija + transpose_tensor(lambda0_ija), self.pibr, self.mupr
+        )
+        assert np.allclose(Q_ij_dense[0], Q_ij_dense[0].T, rtol=1e-05, atol=1e-08)
+        Q_ij_dense[subs_nz] = nz_recon_I
+
+        Q_ij_dense = np.maximum(
+            Q_ij_dense, transpose_tensor(Q_ij_dense)
+        )  # make it symmetric
+        np.fill_diagonal(Q_ij_dense[0], 0.0)
+
+        assert (Q_ij_dense > 1).sum() == 0
+        return Q_ij_dense, Q_ij_dense[subs_nz]
+
+    def _Q_nz_recon(
+        self,
+        data: Union[COO, np.ndarray],
+        data_T_vals: np.ndarray,
+        subs_nz: Tuple[int, int, int],
+    ) -> np.ndarray:
+        """
+        Compute the posterior Q on the non-zero entries, before it is made symmetric.
+
+        Parameters
+        ----------
+        data : Union[COO, np.ndarray]
+               Graph adjacency tensor.
+        data_T_vals : ndarray
+                      Array with values of entries A[j, i] given non-zero entry (i, j).
+        subs_nz : tuple
+                  Indices of elements of data that are non-zero.
+
+        Returns
+        -------
+        nz_recon_I : ndarray
+                     Posterior Q on the non-zero entries.
+        """
         if isinstance(data, np.ndarray):
             nz_recon_I = np.power(1 - self.pibr, data[subs_nz])
         elif isinstance(data, COO):
@@ -492,25 +565,187 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             non_zeros = nz_recon_Id > 0
             nz_recon_I[non_zeros] /= nz_recon_Id[non_zeros]
 
-        lambda0_ija = lambda0_full(self.u, self.v, self.w)
-        Q_ij_dense = np.ones(lambda0_ija.shape)
-        Q_ij_dense *= self.mupr * np.exp(-self.pibr * 2)
-        Q_ij_dense_d = Q_ij_dense + (1 - self.mupr) * np.exp(
-            -(lambda0_ija + transpose_tensor(lambda0_ija))
-        )
-        non_zeros = Q_ij_dense_d > 0
-        Q_ij_dense[non_zeros] /= Q_ij_dense_d[non_zeros]
-        assert np.allclose(Q_ij_dense[0], Q_ij_dense[0].T, rtol=1e-05, atol=1e-08)
-        Q_ij_dense[subs_nz] = nz_recon_I
+        return nz_recon_I
 
-        Q_ij_dense = np.maximum(
-            Q_ij_dense, transpose_tensor(Q_ij_dense)
-        )  # make it symmetric
-        np.fill_diagonal(Q_ij_dense[0], 0.0)
+    @staticmethod
+    def _Q_zero(lambda0_sym: np.ndarray, pibr: float, mupr: float) -> np.ndarray:
+        """
+        Compute the posterior Q of the entries where A_ij = A_ji = 0.
 
-        assert (Q_ij_dense > 1).sum() == 0
-        return Q_ij_dense, Q_ij_dense[subs_nz]
+        For these entries, Q only depends on lambda0_ij + lambda0_ji.
+
+        Parameters
+        ----------
+        lambda0_sym : ndarray
+                      Sum of the mean lambda0_ij and its transpose lambda0_ji.
+        pibr : float
+               Anomaly parameter pi.
+        mupr : float
+               Prior mu.
+
+        Returns
+        -------
+        Q : ndarray
+            Posterior Q, with the same shape as lambda0_sym.
+        """
+        Q = np.ones(lambda0_sym.shape)
+        Q *= mupr * np.exp(-pibr * 2)
+        Q_d = Q + (1 - mupr) * np.exp(-lambda0_sym)
+        non_zeros = Q_d > 0
+        Q[non_zeros] /= Q_d[non_zeros]
+
+        return Q
+
+    @staticmethod
+    def _transpose_positions(
+        subs_nz: Tuple[np.ndarray, ...], shape: Tuple[int, ...]
+    ) -> np.ndarray:
+        """
+        For every non-zero entry (a, i, j), find the position of (a, j, i) among the non-zero
+        entries.
+
+        Parameters
+        ----------
+        subs_nz : tuple
+                  Indices of elements of data that are non-zero.
+        shape : tuple
+                Shape of the data tensor.
+
+        Returns
+        -------
+        pos_T : ndarray
+                Position of the transposed entry, or -1 if the transposed entry is zero.
+        """
+        lin = np.ravel_multi_index(subs_nz, shape)
+        lin_T = np.ravel_multi_index((subs_nz[0], subs_nz[2], subs_nz[1]), shape)
+        order = np.argsort(lin)
+        pos = np.minimum(np.searchsorted(lin, lin_T, sorter=order), len(lin) - 1)
+        found = lin[order[pos]] == lin_T
+
+        return np.where(found, order[pos], -1)
+
+    def _QIJ_nz(
+        self,
+        data: Union[COO, np.ndarray],
+        data_T_vals: np.ndarray,
+        subs_nz: Tuple[int, int, int],
+    ) -> np.ndarray:
+        """
+        Compute the posterior Q only on the non-zero entries, without building the dense tensor.
+
+        The entries of Q outside the non-zero entries and their transposes are given in closed
+        form by `_Q_zero`, so they are recomputed when needed by `_iter_blocks`.
 
+        Parameters
+        ----------
+        data : Union[COO, np.ndarray]
+               Graph adjacency tensor.
+        data_T_vals : ndarray
+                      Array with values of entries A[j, i] given non-zero entry (i, j).
+        subs_nz : tuple
+                  Indices of elements of data that are non-zero.
+
+        Returns
+        -------
+        Qij_nz : ndarray
+                 Posterior Q on the non-zero entries, equal to `_QIJ(...)[1]`.
+        """
+        self.Q0_nz = self._Q_nz_recon(data, data_T_vals, subs_nz)
+
+        # Value of Q at (a, j, i) before symmetrization
+        Q0_nz_T = self._Q_zero(self.lambda0_nz + self.lambda0_nzT, self.pibr, self.mupr)
+        has_T = self.nz_T_pos >= 0
+        Q0_nz_T[has_T] = self.Q0_nz[self.nz_T_pos[has_T]]
+
+        Qij_nz = np.maximum(self.Q0_nz, Q0_nz_T)
+        Qij_nz[np.logical_and(subs_nz[0] == 0, subs_nz[1] == subs_nz[2])] = 0.0
+
+        return Qij_nz
+
+    def _iter_blocks(self, with_q: bool = True):
+        """
+        Iterate over blocks of rows of the dense (L, N, N) tensors used in the updates.
+
+        Only one block of lambda0 and Q is in memory at a time. The entries of Q are computed as
+        in `_QIJ`: the closed form of `_Q_zero`, overwritten on the non-zero entries, and made
+        symmetric. The blocks are computed with the parameters of the last call to
+        `_update_cache`, as the dense tensors would have been.
+
+        Parameters
+        ----------
+        with_q : bool
+                 If False, only the blocks of lambda0 are computed.
+
+        Yields
+        ------
+        rows : slice
+               Rows of the block.
+        lambda0_b : ndarray
+                    Block of the mean lambda0.
+        Q_b : ndarray or None
+              Block of the posterior Q.
+        mask_b : ndarray or None
+                 Block of the mask.
+        """
+        u, v, w = self.theta_cache["u"], self.theta_cache["v"], self.theta_cache["w"]
+        step = max(1, BLOCK_ENTRIES_ // (self.L * self.N))
+        for r0 in range(0, self.N, step):
+            r1 = min(r0 + step, self.N)
+            rows = slice(r0, r1)
+            lambda0_b = lambda0_full(u[rows], v, w)
+            Q_b = None
+            if with_q:
+                lambda0_b_T = transpose_tensor(lambda0_full(u, v[rows], w))
+                Q_b = self._Q_zero(
+                    lambda0_b + lambda0_b_T,
+                    self.theta_cache["pibr"],
+                    self.theta_cache["mupr"],
+                )
+                Q_b_T = Q_b.copy()
+                # Non-zero entries (a, i, j) with source i in the block
+                idx = self.nz_index.order[1][
+                    self.nz_index.indptr[1][r0] : self.nz_index.indptr[1][r1]
+                ]
+                Q_b[self.subs_nz[0][idx], self.subs_nz[1][idx] - r0, self.subs_nz[2][idx]] = (
+                    self.Q0_nz[idx]
+                )
+                # Non-zero entries (a, j, i) with target i in the block
+                idx = self.nz_index.order[2][
+                    self.nz_index.indptr[2][r0] : self.nz_index.indptr[2][r1]
+                ]
+                Q_b_T[self.subs_nz[0][idx], self.subs_nz[2][idx] - r0, self.subs_nz[1][idx]] = (
+                    self.Q0_nz[idx]
+                )
+                Q_b = np.maximum(Q_b, Q_b_T)
+                diag = np.arange(r0, r1)
+                Q_b[0, diag - r0, diag] = 0.0
+            mask_b = None if self.mask is None else self.mask[:, rows]
+            yield rows, lambda0_b, Q_b, mask_b
+
+    def _Q_sum(self, masked: bool = True) -> float:
+        """
+        Sum the posterior Q over all the entries, block by block.
+
+        Parameters
+        ----------
+        masked : bool
+                 If True and a mask is given, sum only over the entries in the mask.
+
+        Returns
+        -------
+        Q_sum : float
+                Sum of Q.
+        """
+        Q_sum = 0.0
+        for _, _, Q_b, mask_b in self._iter_blocks():
+            if masked and mask_b is not None:
+                Q_sum += Q_b[mask_b > 0].sum()
+            else:
+                Q_sum += Q_b.sum()
+
+        return Q_sum
+
+    @profiled()
     def _update_em(
         self,
     ):
@@ -577,6 +812,7 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
 
         return d_u, d_v, d_w, d_pibr, d_mupr
 
+    @profiled()
     def _update_pibr(
         self,
         data: Union[COO, np.ndarray],
@@ -607,7 +843,9 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             Adata = (data[subs_nz] * self.Qij_nz).sum()
         elif isinstance(data, COO):
             Adata = (data.data * self.Qij_nz).sum()
-        if mask is None:
+        if self.implicit_q:
+            self.pibr = Adata / self._Q_sum()
+        elif mask is None:
             self.pibr = Adata / self.Qij_dense.sum()
         else:
             self.pibr = Adata / self.Qij_dense[subs_nz_mask].sum()
@@ -617,6 +855,7 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
 
         return dist_pibr
 
+    @profiled()
     def _update_mupr(
         self,
         mask: Optional[np.ndarray] = None,
@@ -637,7 +876,9 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         dist_mupr : float
                    Maximum distance between the old and the new rprior mu.
         """
-        if mask is None:
+        if self.implicit_q:
+            self.mupr = self._Q_sum() / (self.N * (self.N - 1))
+        elif mask is None:
             self.mupr = self.Qij_dense.sum() / (self.N * (self.N - 1))
         else:
             self.mupr = self.Qij_dense[subs_nz_mask].sum() / (self.N * (self.N - 1))
@@ -661,7 +902,12 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
 
         if not self.constrained:
             if self.flag_anomaly == True:
-                if self.mask is None:
+                if self.implicit_q:
+                    Du = np.zeros((self.N, self.v.shape[1]))
+                    for rows, _, Q_b, mask_b in self._iter_blocks():
+                        R_b = 1 - Q_b if mask_b is None else mask_b * (1 - Q_b)
+                        Du[rows] = np.einsum("aij,jq->iq", R_b, self.v)
+                elif self.mask is None:
                     Du = np.einsum("aij,jq->iq", 1 - self.Qij_dense, self.v)
                 else:
                     Du = np.einsum(
@@ -710,7 +956,12 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
 
         if not self.constrained:
             if self.flag_anomaly == True:
-                if self.mask is None:
+                if self.implicit_q:
+                    Dv = np.zeros((self.N, self.u.shape[1]))
+                    for rows, _, Q_b, mask_b in self._iter_blocks():
+                        R_b = 1 - Q_b if mask_b is None else mask_b * (1 - Q_b)
+                        Dv += np.einsum("aij,ik->jk", R_b, self.u[rows])
+                elif self.mask is None:
                     Dv = np.einsum("aij,ik->jk", 1 - self.Qij_dense, self.u)
                 else:
                     Dv = np.einsum(
@@ -756,20 +1007,20 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         subs_nz : tuple
                   Indices of elements of data that are non-zero.
         """
-        sub_w_nz = self.w.nonzero()
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum("Ik,Iq->Ikq", self.u[subs_nz[1], :], self.v[subs_nz[2], :])
-        uttkrp_I = self.data_M_nz_Q[:, np.newaxis, np.newaxis] * UV
-        for _, k, q in zip(*sub_w_nz):
-            uttkrp_DKQ[:, k, q] += np.bincount(
-                subs_nz[0], weights=uttkrp_I[:, k, q], minlength=self.L
-            )
+        # The entries where w is zero stay zero after the multiplicative update
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz_Q, subs_nz, self.u, self.v, self.w.shape[0], index=self.nz_index
+        )
 
         self.w = self.ag - 1 + self.w * uttkrp_DKQ
 
         if self.flag_anomaly == True:
-            if not mask:
+            if self.implicit_q:
+                UQk = np.zeros((self.L, self.N, self.u.shape[1]))
+                for rows, _, Q_b, _ in self._iter_blocks():
+                    R_b = 1 - Q_b if mask is None else mask[:, rows] * (1 - Q_b)
+                    UQk += np.einsum("aij,ik->ajk", R_b, self.u[rows])
+            elif not mask:
                 UQk = np.einsum("aij,ik->ajk", (1 - self.Qij_dense), self.u)
             else:
                 UQk = np.einsum("aij,ik->ajk", mask * (1 - self.Qij_dense), self.u)
@@ -800,30 +1051,37 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         dist_w : float
                  Maximum distance between the old and the new affinity tensor w.
         """
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Ik->Ik", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz_Q,
+            self.subs_nz,
+            self.u,
+            self.v,
+            self.w.shape[0],
+            assortative=True,
+            index=self.nz_index,
         )
-        uttkrp_I = self.data_M_nz_Q[:, np.newaxis] * UV
-        for k in range(self.K):
-            uttkrp_DKQ[:, k] += np.bincount(
-                self.subs_nz[0], weights=uttkrp_I[:, k], minlength=self.L
-            )
 
         self.w = self.ag - 1 + self.w * uttkrp_DKQ
 
         if self.flag_anomaly == True:
-            if self.mask is None:
+            if self.implicit_q:
+                Zk = np.zeros((1 if self.mask is None else self.L, self.K))
+                for rows, _, Q_b, mask_b in self._iter_blocks():
+                    if mask_b is None:
+                        UQk = np.einsum("aij,ik->jk", (1 - Q_b), self.u[rows])
+                        Zk[0] += np.einsum("jk,jk->k", UQk, self.v)
+                    else:
+                        Zk += np.einsum(
+                            "aij,ik,jk->ak", mask_b * (1 - Q_b), self.u[rows], self.v
+                        )
+            elif self.mask is None:
                 UQk = np.einsum("aij,ik->jk", (1 - self.Qij_dense), self.u)
                 Zk = np.einsum("jk,jk->k", UQk, self.v)
                 Zk = Zk[np.newaxis, :]
             else:
-                Zk = np.einsum(
-                    "aij,ijk->ak",
-                    self.mask * (1 - self.Qij_dense),
-                    np.einsum("ik,jk->ijk", self.u, self.v),
-                )
+                # sum_ij X_aij u_ik v_jk, without the (N, N, K) outer product of u and v
+                X = self.mask * (1 - self.Qij_dense)
+                Zk = np.stack([((X[a] @ self.v) * self.u).sum(axis=0) for a in range(X.shape[0])])
         else:  # flag_anomaly == False
             Zk = np.einsum("ik,jk->k", self.u, self.v)
             Zk = Zk[np.newaxis, :]
@@ -868,12 +1126,17 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
         """
 
         if not self.assortative:
-            uttkrp_DK = sp_uttkrp(self.data_M_nz_Q, subs_nz, m, u, v, w)
+            uttkrp_DK = sp_uttkrp_fused(
+                self.data_M_nz_Q, subs_nz, m, u, v, w, index=self.nz_index
+            )
         else:
-            uttkrp_DK = sp_uttkrp_assortative(self.data_M_nz_Q, subs_nz, m, u, v, w)
+            uttkrp_DK = sp_uttkrp_assortative_fused(
+                self.data_M_nz_Q, subs_nz, m, u, v, w, index=self.nz_index
+            )
 
         return uttkrp_DK
 
+    @profiled()
     def compute_likelihood(self):
         return self._ELBO(self.data, self.mask, self.subs_nz_mask)
 
@@ -901,13 +1164,16 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
             The computed ELBO value.
         """
 
+        if self.implicit_q:
+            return self._ELBO_implicit(data, mask)
+
         self.lambda0_ija = lambda0_full(self.u, self.v, self.w)
 
         if mask is not None:
-            if isinstance(data, COO):
-                Adense = data.todense()
-            else:
-                raise ValueError("Mask is not None but data is not a COO tensor.")
+            # Non-zero entries of the data in the held out set, without making the data dense
+            index = self._mask_index(mask, data)
+            subs_nz = index.subs_nz
+            data_nz = index.data_vals[index.nz]
 
         if self.flag_anomaly == False:
             l = (data.data * np.log(self.lambda0_ija[data.coords] + EPS_)).sum()
@@ -932,10 +1198,9 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
                         * (self.Qij_dense[coords_tuple] * data.data).sum()
                     )
                 else:
-                    subs_nz = np.logical_and(mask > 0, Adense > 0)
                     l += (
                         np.log(self.pibr + EPS_)
-                        * (self.Qij_dense[subs_nz] * (Adense[subs_nz])).sum()
+                        * (self.Qij_dense[subs_nz] * data_nz).sum()
                     )
 
             # Entropy of Bernoulli in Q
@@ -976,10 +1241,9 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
                 l -= (
                     (1 - self.Qij_dense[subs_nz_mask]) * self.lambda0_ija[subs_nz_mask]
                 ).sum()
-                subs_nz = np.logical_and(mask > 0, Adense > 0)
                 l += (
                     ((1 - self.Qij_dense)[subs_nz])
-                    * data.data
+                    * data_nz
                     * np.log(self.lambda0_ija[subs_nz] + EPS_)
                 ).sum()
 
@@ -1002,6 +1266,105 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
                 log_and_raise_error(ValueError, "ELBO is NaN!")
             return l
 
+    def _ELBO_implicit(
+        self, data: Union[COO, np.ndarray], mask: Optional[np.ndarray] = None
+    ) -> float:
+        """
+        Compute the Evidence Lower BOund (ELBO) of the data without the dense tensors Q and
+        lambda0.
+
+        The terms on the non-zero entries are computed from `Qij_nz`, and the sums over all the
+        entries with a single pass of `_iter_blocks`.
+
+        Parameters
+        ----------
+        data : Union[COO, np.ndarray]
+               Graph adjacency tensor.
+        mask : ndarray, optional
+               Mask for selecting the held out set in the adjacency tensor in case of cross-validation.
+
+        Returns
+        -------
+        l : float
+            The computed ELBO value.
+        """
+        data_nz = data[self.subs_nz] if isinstance(data, np.ndarray) else data.data
+        log_lambda0_nz = np.log(self._lambda_nz(self.subs_nz) + EPS_)
+        # Non-zero entries that are in the mask
+        in_mask = (
+            np.ones(len(data_nz), dtype=bool) if mask is None else mask[self.subs_nz] > 0
+        )
+
+        if self.flag_anomaly == False:
+            l = (data_nz[in_mask] * log_lambda0_nz[in_mask]).sum()
+            if mask is None:
+                if not self.assortative:
+                    l -= np.einsum("k,akq,q->", self.u.sum(axis=0), self.w, self.v.sum(axis=0))
+                else:
+                    l -= np.einsum("k,ak,k->", self.u.sum(axis=0), self.w, self.v.sum(axis=0))
+            else:
+                for _, lambda0_b, _, mask_b in self._iter_blocks(with_q=False):
+                    l -= lambda0_b[mask_b > 0].sum()
+            return l
+
+        # Sums over all the entries: Q, Q restricted to the mask, the entropy of Q, (1 - Q) *
+        # lambda0 and 1 - Q
+        Q_sum = Q_sum_mask = entropy = lambda0_Q_sum = one_minus_Q_sum = 0.0
+        for _, lambda0_b, Q_b, mask_b in self._iter_blocks():
+            Q_sum += Q_b.sum()
+            if mask_b is not None:
+                in_mask_b = mask_b > 0
+                Q_b, lambda0_b = Q_b[in_mask_b], lambda0_b[in_mask_b]
+                Q_sum_mask += Q_b.sum()
+            non_zeros = Q_b > 0
+            non_zeros1 = (1 - Q_b) > 0
+            entropy -= (Q_b[non_zeros] * np.log(Q_b[non_zeros] + EPS_)).sum()
+            entropy -= ((1 - Q_b)[non_zeros1] * np.log((1 - Q_b)[non_zeros1] + EPS_)).sum()
+            lambda0_Q_sum += ((1 - Q_b) * lambda0_b).sum()
+            one_minus_Q_sum += (1 - Q_b).sum()
+
+        l = 0.0
+
+        # Term containing Q, pi and A
+        l -= self.pibr * Q_sum
+        if self.pibr >= 0:
+            l += (
+                np.log(self.pibr + EPS_)
+                * (self.Qij_nz[in_mask] * data_nz[in_mask]).sum()
+            )
+
+        # Entropy of Bernoulli in Q
+        l += entropy
+
+        # Term containing Q, M and A
+        l -= lambda0_Q_sum
+        l += (
+            (1 - self.Qij_nz[in_mask]) * data_nz[in_mask] * log_lambda0_nz[in_mask]
+        ).sum()
+
+        # Term containing Q and mu
+        if mask is None:
+            if 1 - self.mupr >= 0:
+                l += np.log(1 - self.mupr + EPS_) * one_minus_Q_sum
+            if self.mupr >= 0:
+                l += np.log(self.mupr + EPS_) * Q_sum
+        else:
+            if 1 - self.mupr > 0:
+                l += np.log(1 - self.mupr + EPS_) * one_minus_Q_sum
+            if self.mupr > 0:
+                l += np.log(self.mupr + EPS_) * Q_sum_mask
+
+        if self.ag > 1.0:
+            l += (self.ag - 1) * np.log(self.u + EPS_).sum()
+            l += (self.ag - 1) * np.log(self.v + EPS_).sum()
+        if self.bg > 0.0:
+            l -= self.bg * self.u.sum()
+            l -= self.bg * self.v.sum()
+
+        if np.isnan(l):
+            log_and_raise_error(ValueError, "ELBO is NaN!")
+        return l
+
     def _log_realization_info(
         self,
         r: int,
@@ -1046,7 +1409,10 @@ class AnomalyDetection(ModelBase, ModelUpdateMixin):
 
         self.pibr_f = np.copy(self.pibr)
         self.mupr_f = np.copy(self.mupr)
-        if self.flag_anomaly == True:
+        if self.flag_anomaly == True and self.implicit_q:
+            self.Q_ij_dense_f = None
+            self.Q_ij_nz_f = np.copy(self.Qij_nz)
+        elif self.flag_anomaly == True:
             self.Q_ij_dense_f = np.copy(self.Qij_dense)
         else:
             self.Q_ij_dense_f = np.zeros((1, self.N, self.N))
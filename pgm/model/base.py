@@ -8,13 +8,18 @@ from functools import singledispatchmethod
 import logging
 from pathlib import Path
 import time
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 from sparse import COO
 
-from pgm.input.tools import inherit_docstring, log_and_raise_error
-from pgm.model.constants import CONVERGENCE_TOL_, DECISION_, ERR_, ERR_MAX_, INF_
+from pgm.input.tools import inherit_docstring, log_and_raise_error, MaskIndex
+from pgm.model.callbacks import resolve_stop, Stop
+from pgm.model.constants import CHECK_INTERVAL_, CONVERGENCE_TOL_, DECISION_, ERR_, ERR_MAX_, INF_
+from pgm.model.parallel import resolve_n_jobs, run_realizations
+from pgm.model.profiling import PhaseProfiler, profiled
+from pgm.model.schedule import LikelihoodSchedule
+from pgm.output.evaluate import lambda0_full
 from pgm.output.plot import plot_L
 
 
@@ -41,6 +46,18 @@ class ModelBaseParameters:
         Flag to plot the log-likelihood.
     flag_conv : str
         Flag to choose the convergence criterion.
+    n_jobs : int
+        Number of processes used to run the realizations. A value of -1 uses all the CPUs.
+    profile : bool
+        Flag to profile the phases of the EM updates; the profile is stored in `profile_`.
+    profile_memory : bool
+        Flag to also trace the peak memory of the phases with tracemalloc, when profiling.
+    callbacks : list, optional
+        Callables invoked after every EM iteration, which can request to stop the fit (see
+        `pgm.model.callbacks`).
+    adaptive_check : bool
+        Flag to adapt the interval between the checks of the log-likelihood to its cost and
+        slope, instead of checking it every 10 iterations (see `pgm.model.schedule`).
     """
 
     inf: float = INF_  # initial value of the log-likelihood
@@ -54,6 +71,11 @@ class ModelBaseParameters:
     max_iter: int = 500  # maximum number of EM steps before aborting
     plot_loglik: bool = False  # flag to plot the log-likelihood
     flag_conv: str = "log"  # flag to choose the convergence criterion
+    n_jobs: int = 1  # number of processes used to run the realizations
+    profile: bool = False  # flag to profile the phases of the EM updates
+    profile_memory: bool = False  # flag to trace the peak memory of the phases
+    callbacks: Optional[List[Callable]] = None  # callables invoked after every EM iteration
+    adaptive_check: bool = False  # flag to adapt the interval of the log-likelihood checks
 
 
 class ModelBase(ModelBaseParameters):
@@ -95,6 +117,19 @@ class ModelBase(ModelBaseParameters):
         self.beta_hat: np.ndarray = np.array([])
         self.best_r: int = 0
         self.final_it: int = 0
+        # Profiler of the phases of the EM updates, set during a fit with profile=True
+        self._profiler: Optional[PhaseProfiler] = None
+        self.profile_: Dict[str, Dict[str, Any]] = {}
+        # Start time of the fit and flag set by a callback to skip the remaining realizations
+        self._fit_start: float = 0.0
+        self._stop_fit = False
+        # Index of the realization that stopped the fit, shared by the worker processes of a
+        # parallel fit, or -1
+        self._stop_realization: Optional[Any] = None
+        # Adaptive schedule of the log-likelihood checks of the current realization, and number of
+        # likelihood evaluations of the fit and of those of the fixed schedule for its iterations
+        self._schedule: Optional[LikelihoodSchedule] = None
+        self.likelihood_checks_: Dict[str, int] = {"evaluations": 0, "fixed_schedule": 0}
 
     def _check_fit_params(self, *args, **kwargs) -> None:
         """
@@ -497,6 +532,54 @@ class ModelBase(ModelBaseParameters):
 
         return nz_recon_I
 
+    def compute_lambda0_ija(self) -> np.ndarray:
+        """
+        Compute the mean lambda0 for all entries and store it in `lambda0_ija`.
+
+        The likelihoods only need the sum of lambda0, which they compute in factorized form, so
+        the dense (L, N, N) tensor is built only when it is requested here.
+
+        Returns
+        -------
+        lambda0_ija : ndarray
+                      Mean lambda0 for all entries.
+        """
+        self.lambda0_ija = lambda0_full(self.u, self.v, self.w)
+
+        return self.lambda0_ija
+
+    def _mask_index(
+        self,
+        mask: np.ndarray,
+        data: Union[COO, np.ndarray],
+        data_T: Optional[Union[COO, np.ndarray]] = None,
+    ) -> MaskIndex:
+        """
+        Return the index of the entries of the held out set, built once per fit.
+
+        The index is cached with the mask and the data it was built from, and it is built again
+        only when the likelihood is called with a different mask or data.
+
+        Parameters
+        ----------
+        mask : ndarray
+               Mask for selecting the held out set in the adjacency tensor.
+        data : ndarray or COO
+               Graph adjacency tensor.
+        data_T : ndarray or COO, optional
+                 Transposed graph adjacency tensor.
+
+        Returns
+        -------
+        index : MaskIndex
+                Index of the entries of the mask.
+        """
+        cached = getattr(self, "_mask_index_cache", None)
+        if cached is None or cached[0] is not mask or cached[1] is not data:
+            cached = (mask, data, MaskIndex.from_mask(mask, data, data_T))
+            self._mask_index_cache = cached
+        return cached[2]
+
     def _ps_likelihood(
         self,
         data: Union[COO, np.ndarray],
@@ -557,8 +640,21 @@ class ModelBase(ModelBaseParameters):
                       Updated flag for convergence.
         """
 
+        if self._schedule is not None:
+            # Adaptive schedule, where coincide counts the consecutive stable iterations
+            if self._schedule.due(it):
+                old_L = loglik
+                start = time.perf_counter()
+                loglik = self.compute_likelihood()
+                coincide = self._schedule.record_check(
+                    it, loglik - old_L, time.perf_counter() - start, coincide
+                )
+            convergence = self._schedule.converged(coincide) or convergence
+            it += 1
+            return it, loglik, coincide, convergence
+
         # Check for convergence
-        if it % 10 == 0:
+        if it % CHECK_INTERVAL_ == 0:
             old_L = loglik
             loglik = self.compute_likelihood()
             if abs(loglik - old_L) < self.convergence_tol:
@@ -718,6 +814,101 @@ class ModelBase(ModelBaseParameters):
         if np.logical_and(self.plot_loglik, self.flag_conv == "log"):
             plot_L(best_loglik_values, int_ticks=True)
 
+    def _run_realization(self, r: int) -> Tuple[int, float, bool, list]:
+        """
+        Initialize the parameters and run the EM updates of one realization.
+
+        Parameters
+        ----------
+        r : int
+            Index of the realization.
+
+        Returns
+        -------
+        it : int
+            Number of iterations.
+        loglik : float
+            Final log-likelihood.
+        convergence : bool
+            Flag for convergence.
+        loglik_values : list
+            Log-likelihood values of the iterations.
+        """
+        coincide, convergence, it, loglik, loglik_values = (
+            self._initialize_realization()  # type: ignore
+        )
+        if self.adaptive_check and self.flag_conv == "log":
+            self._schedule = LikelihoodSchedule(self.convergence_tol, self.decision)
+        it, loglik, coincide, convergence, loglik_values = self._update_realization(  # type: ignore
+            r, it, loglik, coincide, convergence, loglik_values
+        )
+        if self._schedule is not None:
+            self.likelihood_checks_["evaluations"] += self._schedule.evaluations
+            self.likelihood_checks_["fixed_schedule"] += self._schedule.fixed_evaluations(it)
+            self._schedule = None
+        return it, loglik, convergence, loglik_values
+
+    def _realizations(self) -> Iterator[Tuple[int, Tuple[int, float, bool, list]]]:
+        """
+        Run the realizations of the EM algorithm, one after the other or on a pool of processes.
+
+        With `n_jobs` greater than one, each realization is seeded with a seed derived from `rseed`
+        and its parameters are set on the model before its results are yielded, so the fit loop
+        can store them as in the serial case. The serial results are therefore not reproduced
+        exactly by a parallel fit.
+
+        With `profile` set, the phases of all the realizations are profiled together and the
+        profile is stored in `profile_` at the end of the fit. If a callback stops the fit, the
+        realizations that have not started are skipped. The callbacks with a `close` method, such
+        as `JSONLinesProgress`, are closed at the end of the fit. With `adaptive_check` set, the
+        number of likelihood evaluations, and the number of those of checking the
+        log-likelihood every 10 iterations, are stored in `likelihood_checks_`. The adaptive
+        schedule may check more often than every 10 iterations near the convergence.
+
+        Yields
+        ------
+        r : int
+            Index of the realization.
+        results : tuple
+            Number of iterations, log-likelihood, convergence flag and log-likelihood values.
+        """
+        self._profiler = PhaseProfiler(self.profile_memory) if self.profile else None
+        self._fit_start = time.time()
+        self._stop_fit = False
+        self.likelihood_checks_ = {"evaluations": 0, "fixed_schedule": 0}
+        try:
+            n_jobs = resolve_n_jobs(self.n_jobs)
+            if n_jobs == 1 or self.num_realizations == 1:
+                for r in range(self.num_realizations):
+                    yield r, self._run_realization(r)
+                    if self._stop_fit:
+                        logging.debug("Fit stopped by a callback after realization %s", r)
+                        break
+            else:
+                yield from run_realizations(self, n_jobs)
+        finally:
+            self._close_callbacks()
+            if self._profiler is not None:
+                self._profiler.stop()
+                self.profile_ = self._profiler.to_dict()
+                self._profiler = None
+            if self.adaptive_check:
+                logging.debug(
+                    "Likelihood evaluations: %s - with the fixed schedule: %s",
+                    self.likelihood_checks_["evaluations"],
+                    self.likelihood_checks_["fixed_schedule"],
+                )
+
+    def _close_callbacks(self) -> None:
+        """
+        Close the callbacks that hold resources, such as the file of `JSONLinesProgress`, which
+        is opened again if the callback is invoked later.
+        """
+        for callback in self.callbacks or []:
+            close = getattr(callback, "close", None)
+            if callable(close):
+                close()
+
     def _log_realization_info(
         self,
         r,
@@ -786,6 +977,9 @@ class ModelUpdateMixin(ABC):
 
     not_implemented_message = "This method should be overridden in the derived class"
 
+    # Names of the parameters whose maximum changes are returned by `_update_em`
+    _delta_names: Tuple[str, ...] = ("u", "v", "w", "eta")
+
     def _finalize_update(
         self, matrix: np.ndarray, matrix_old: np.ndarray
     ) -> Tuple[float, np.ndarray, np.ndarray]:
@@ -797,6 +991,7 @@ class ModelUpdateMixin(ABC):
 
         return dist, matrix, matrix_old
 
+    @profiled()
     def _update_U(self) -> float:
         # A generic function here that will do what each class needs
         self._specific_update_U()
@@ -812,6 +1007,7 @@ class ModelUpdateMixin(ABC):
         Update the membership matrix U.
         """
 
+    @profiled()
     def _update_V(self) -> float:
         # a generic function here that will do what each class needs
         self._specific_update_V()  # subs_nz, subs_X_nz, mask, subs_nz_mask)
@@ -828,6 +1024,7 @@ class ModelUpdateMixin(ABC):
         This is an abstract method that must be implemented in each derived class.
         """
 
+    @profiled()
     def _update_W(self) -> float:
         # a generic function here that will do what each class needs
         self._specific_update_W()
@@ -843,6 +1040,7 @@ class ModelUpdateMixin(ABC):
         This is an abstract method that must be implemented in each derived class.
         """
 
+    @profiled()
     def _update_W_assortative(self) -> float:
         # a generic function here that will do what each class needs
 
@@ -900,6 +1098,9 @@ class ModelUpdateMixin(ABC):
         """
         Perform the EM update and check for convergence.
 
+        After every iteration the callbacks are invoked, and the loop also ends if one of them
+        requests a stop.
+
         Parameters
         ----------
         r : int
@@ -929,6 +1130,7 @@ class ModelUpdateMixin(ABC):
             Updated list of log-likelihood values.
         """
         logging.debug("Updating realization %s ...", r)
+        stopped = False
 
         # It enters a while loop that continues until either convergence is achieved or the
         # maximum number of iterations (self.max_iter) is reached.
@@ -936,7 +1138,12 @@ class ModelUpdateMixin(ABC):
             # It performs the main EM update (self._update_em()
             # which updates the memberships and calculates the maximum difference
             # between new and old parameters.
-            self._update_em()
+            start = time.perf_counter()
+            update = self._update_em()
+            if self._schedule is not None:
+                self._schedule.record_step(
+                    time.perf_counter() - start, self._iteration_deltas(update)
+                )
             # Depending on the convergence flag (self.flag_conv), it checks for convergence using
             # either the  log-likelihood values (self._check_for_convergence(data, it,
             # loglik,  coincide, convergence, data_T=data_T, mask=mask)) or the maximum distances
@@ -977,14 +1184,91 @@ class ModelUpdateMixin(ABC):
                 log_and_raise_error(
                     ValueError, "flag_conv can be either log or deltas!"
                 )
+
+            if self.callbacks and self._run_callbacks(r, it, loglik, update) is not None:
+                logging.debug("Realization %s stopped by a callback at iteration %s", r, it)
+                stopped = True
+                break
         # After the while loop, it checks if the current  log-likelihood is the maximum
         # so far. If it is, it updates the optimal parameters (
         # self._update_optimal_parameters()) and sets maxL to the current log-likelihood.
-        if self.flag_conv == "deltas":
+        # The log-likelihood of a stopped realization, or one the adaptive schedule last checked
+        # before the final iteration, is computed for its current parameters.
+        stale = self._schedule is not None and self._schedule.stale(it)
+        if self.flag_conv == "deltas" or stopped or stale:
             loglik = self.compute_likelihood()  # data, data_T, mask
+            if stale:
+                self._schedule.evaluations += 1
 
         return it, loglik, coincide, convergence, loglik_values
 
+    def _iteration_deltas(self, update: Optional[Tuple[float, ...]]) -> Dict[str, float]:
+        """
+        Return the maximum changes of the parameters in the last EM iteration, keyed by name.
+
+        Parameters
+        ----------
+        update : tuple, optional
+            Maximum changes of the parameters returned by `_update_em`. If None, they are read
+            from the `delta_` attributes.
+
+        Returns
+        -------
+        deltas : dict
+            Maximum change of every parameter.
+        """
+        if update is None:
+            return {name: getattr(self, f"delta_{name}") for name in self._delta_names}
+        return dict(zip(self._delta_names, update))
+
+    def _run_callbacks(
+        self, r: int, it: int, loglik: float, update: Optional[Tuple[float, ...]]
+    ) -> Optional[Stop]:
+        """
+        Invoke the callbacks after an EM iteration.
+
+        Parameters
+        ----------
+        r : int
+            Index of the realization.
+        it : int
+            Number of iterations.
+        loglik : float
+            Last log-likelihood computed.
+        update : tuple, optional
+            Maximum changes of the parameters returned by `_update_em`.
+
+        Returns
+        -------
+        stop : Stop, optional
+            Stop requested by the callbacks, if any. A stop of the fit sets `_stop_fit`, and
+            `_stop_realization` in a parallel fit. In a parallel fit, a realization after the
+            one that stopped the fit is stopped too, since its results are discarded.
+        """
+        stopped = self._stop_realization
+        if stopped is not None and 0 <= stopped.value < r:
+            self._stop_fit = True
+            return Stop.FIT
+
+        deltas = self._iteration_deltas(update)
+        # Without the log-likelihood criterion, the log-likelihood is not computed in the loop
+        reported = loglik if self.flag_conv == "log" else None
+        elapsed = time.time() - self._fit_start
+
+        # Invoke all the callbacks, even if one of them already requested a stop
+        stops = [
+            resolve_stop(callback(r, it, reported, deltas, elapsed))
+            for callback in self.callbacks
+        ]
+        if Stop.FIT in stops:
+            self._stop_fit = True
+            if stopped is not None:
+                with stopped.get_lock():
+                    if not 0 <= stopped.value < r:
+                        stopped.value = r
+            return Stop.FIT
+        return Stop.REALIZATION if Stop.REALIZATION in stops else None
+
     @abstractmethod
     def _update_em(self, *args, **kwargs):
         """
@@ -993,6 +1277,17 @@ class ModelUpdateMixin(ABC):
         This is an abstract method that must be implemented in each derived class.
         """
 
+    def _realization_state(self) -> Dict[str, Any]:
+        """
+        Return the parameters of the current realization read by `_update_optimal_parameters`.
+
+        Returns
+        -------
+        state : dict
+                Values of the parameters, keyed by attribute name.
+        """
+        return {var: getattr(self, var) for var in ["u", "v", "w"]}
+
     def _copy_variables(self, source_suffix: str, target_suffix: str) -> None:
         # of derived classes
         """
@@ -0,0 +1,174 @@
+"""
+Callbacks invoked after every iteration of the EM algorithm.
+
+A callback is any callable passed in the `callbacks` list of a model. After every EM update it is
+called as `callback(realization, iteration, loglik, deltas, elapsed)`, where `loglik` is the last
+log-likelihood computed (it is refreshed every 10 iterations with `flag_conv="log"`, and is None
+with `flag_conv="deltas"`), `deltas` maps the name of every parameter to its maximum change in the
+iteration and `elapsed` is the wall time in seconds since the start of the fit.
+
+A callback requests a clean stop by returning `Stop.REALIZATION`, which ends the current
+realization, or `Stop.FIT` (or True), which also skips the realizations that have not started. The
+parameters of a stopped realization compete with the others for the best ones, as if it had
+converged.
+"""
+
+import enum
+import json
+import math
+from typing import Any, Dict, Optional, Union
+
+
+class Stop(enum.Enum):
+    """
+    Stop requested by a callback.
+    """
+
+    REALIZATION = "realization"
+    FIT = "fit"
+
+
+def resolve_stop(request: Union[Stop, bool, None]) -> Optional[Stop]:
+    """
+    Return the stop requested by the return value of a callback, if any.
+
+    Parameters
+    ----------
+    request : Stop, bool or None
+              Return value of the callback. True stops the fit.
+
+    Returns
+    -------
+    stop : Stop or None
+           Requested stop, or None to continue.
+    """
+    if isinstance(request, Stop):
+        return request
+    return Stop.FIT if request is True else None
+
+
+class TimeBudget:
+    """
+    Stop the fit once its wall time exceeds a budget.
+
+    Parameters
+    ----------
+    seconds : float
+              Budget of wall time of the fit, in seconds.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def __call__(
+        self,
+        realization: int,
+        iteration: int,
+        loglik: Optional[float],
+        deltas: Dict[str, float],
+        elapsed: float,
+    ) -> Optional[Stop]:
+        return Stop.FIT if elapsed >= self.seconds else None
+
+
+class PlateauStop:
+    """
+    Stop a realization when its log-likelihood has not improved for a number of iterations.
+
+    As the log-likelihood is refreshed every 10 iterations, `patience` should be larger than 10.
+    Without a log-likelihood (`flag_conv="deltas"`), the realizations are never stopped.
+
+    Parameters
+    ----------
+    patience : int
+               Number of iterations without improvement after which the realization stops.
+    min_delta : float
+                Minimum increase of the log-likelihood counted as an improvement.
+    """
+
+    def __init__(self, patience: int = 100, min_delta: float = 0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self._realization: Optional[int] = None
+        self._best = -math.inf
+        self._best_iteration = 0
+
+    def __call__(
+        self,
+        realization: int,
+        iteration: int,
+        loglik: Optional[float],
+        deltas: Dict[str, float],
+        elapsed: float,
+    ) -> Optional[Stop]:
+        if realization != self._realization:
+            self._realization = realization
+            self._best = -math.inf
+            self._best_iteration = iteration
+        if loglik is None:
+            return None
+        if loglik > self._best + self.min_delta:
+            self._best = loglik
+            self._best_iteration = iteration
+        elif iteration - self._best_iteration >= self.patience:
+            return Stop.REALIZATION
+        return None
+
+
+class JSONLinesProgress:
+    """
+    Append the progress of the fit to a JSON-lines file, one object per reported iteration.
+
+    The file is opened in append mode, so the realizations run in other processes write to the same
+    file. Every line has the keys `realization`, `iteration`, `loglik`, `deltas` and `elapsed`.
+    The fit closes the file at its end, and in the worker processes after every realization.
+
+    Parameters
+    ----------
+    path : str
+           Path of the JSON-lines file.
+    every : int
+            Report one iteration out of `every`.
+    """
+
+    def __init__(self, path: str, every: int = 1):
+        self.path = path
+        self.every = every
+        self._fp: Optional[Any] = None
+
+    def __call__(
+        self,
+        realization: int,
+        iteration: int,
+        loglik: Optional[float],
+        deltas: Dict[str, float],
+        elapsed: float,
+    ) -> None:
+        if iteration % self.every:
+            return
+        if self._fp is None:
+            self._fp = open(self.path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+        record = {
+            "realization": realization,
+            "iteration": iteration,
+            "loglik": None if loglik is None else float(loglik),
+            "deltas": {name: float(delta) for name, delta in deltas.items()},
+            "elapsed": elapsed,
+        }
+        # Write whole lines, so the lines of different processes do not interleave
+        self._fp.write(json.dumps(record) + "\n")
+        self._fp.flush()
+
+    def close(self) -> None:
+        """
+        Close the file.
+        """
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The file is opened again by the copies sent to other processes
+        state = self.__dict__.copy()
+        state["_fp"] = None
+        return state
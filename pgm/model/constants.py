@@ -9,3 +9,9 @@ ERR_MAX_ = 1e-12  # Maximum error allowed in the optimization algorithm
 CONVERGENCE_TOL_ = 1e-4  # Convergence threshold for the optimization algorithm
 ERR_ = 0.1  # Noise for the initialization
 DECISION_ = 10  # Convergence parameter
+BLOCK_ENTRIES_ = 2**22  # Number of dense entries processed at once by the memory-lean updates
+SHARED_MIN_BYTES_ = 2**16  # Arrays smaller than this are pickled instead of shared between processes
+CHECK_INTERVAL_ = 10  # Number of iterations between the log-likelihood checks of the fixed schedule
+MAX_CHECK_INTERVAL_ = 100  # Maximum number of iterations between the adaptive checks
+CHECK_OVERHEAD_ = 0.1  # Target time of the adaptive checks, relative to the time of the EM steps
+PRECHECK_DELTA_ = 1e-2  # Change of the memberships below which the adaptive checks are run
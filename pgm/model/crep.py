@@ -6,7 +6,7 @@ The latent variables are related to community memberships and reciprocity value.
 import logging
 from pathlib import Path
 import time
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from numpy import dtype, ndarray
 import numpy as np
@@ -14,10 +14,11 @@ from sparse import COO
 
 from ..input.preprocessing import preprocess
 from ..input.tools import (
-    get_item_array_from_subs, inherit_docstring, log_and_raise_error, sp_uttkrp,
-    sp_uttkrp_assortative)
-from ..output.evaluate import lambda0_full
+    get_item_array_from_subs, inherit_docstring, log_and_raise_error, NonzeroIndex,
+    sp_uttkrp_assortative_fused, sp_uttkrp_fused, uttkrp_w)
+from ..output.evaluate import lambda0_sum
 from .base import ModelBase, ModelUpdateMixin
+from .profiling import profiled
 
 
 class CRep(ModelBase, ModelUpdateMixin):
@@ -170,21 +171,14 @@ class CRep(ModelBase, ModelUpdateMixin):
         self.data_T = data_T
         self.data_T_vals = data_T_vals
         self.subs_nz = subs_nz
+        # Sort the non-zero entries once, to reuse the segments in every EM iteration
+        self.nz_index = NonzeroIndex.from_subs(subs_nz, data.shape)
         self.denominator = E
         self.mask = mask
 
         # Run the Expectation-Maximization (EM) algorithm for a specified number of realizations
-        for r in range(self.num_realizations):
-
-            # Initialize the parameters for the current realization
-            coincide, convergence, it, loglik, loglik_values = (
-                self._initialize_realization()
-            )
-
-            # Update the parameters for the current realization
-            it, loglik, coincide, convergence, loglik_values = self._update_realization(
-                r, it, loglik, coincide, convergence, loglik_values
-            )
+        # (the realizations run on a pool of processes when n_jobs > 1)
+        for r, (it, loglik, convergence, loglik_values) in self._realizations():
 
             # If the current log-likelihood is greater than the maximum log-likelihood so far,
             # update the optimal parameters and the maximum log-likelihood
@@ -289,6 +283,7 @@ class CRep(ModelBase, ModelUpdateMixin):
 
         return E, data, data_T, data_T_vals, subs_nz  # type: ignore
 
+    @profiled()
     def compute_likelihood(self) -> float:
         """
         Compute the pseudo log-likelihood of the data.
@@ -300,6 +295,7 @@ class CRep(ModelBase, ModelUpdateMixin):
         """
         return self._ps_likelihood(self.data, self.data_T, self.mask)
 
+    @profiled()
     def _update_cache(
         self,
         data: Union[COO, np.ndarray],
@@ -328,6 +324,7 @@ class CRep(ModelBase, ModelUpdateMixin):
             self.data_M_nz = data.data / self.M_nz
         self.data_M_nz[self.M_nz == 0] = 0
 
+    @profiled()
     def _update_em(self):
         """
         Update parameters via EM procedure.
@@ -385,6 +382,7 @@ class CRep(ModelBase, ModelUpdateMixin):
         self.delta_w = d_w
         self.delta_eta = d_eta
 
+    @profiled()
     def _update_eta(
         self,
         data: Union[COO, np.ndarray],
@@ -469,17 +467,9 @@ class CRep(ModelBase, ModelUpdateMixin):
 
     def _specific_update_W(self):
 
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Iq->Ikq", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz, self.subs_nz, self.u, self.v, self.w.shape[0], index=self.nz_index
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis, np.newaxis] * UV
-        for k in range(self.K):
-            for q in range(self.K):
-                uttkrp_DKQ[:, k, q] += np.bincount(
-                    self.subs_nz[0], weights=uttkrp_I[:, k, q], minlength=self.L
-                )
 
         self.w *= uttkrp_DKQ
 
@@ -490,16 +480,15 @@ class CRep(ModelBase, ModelUpdateMixin):
         self.w[non_zeros] /= Z[non_zeros]
 
     def _specific_update_W_assortative(self):
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Ik->Ik", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz,
+            self.subs_nz,
+            self.u,
+            self.v,
+            self.w.shape[0],
+            assortative=True,
+            index=self.nz_index,
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis] * UV
-        for k in range(self.K):
-            uttkrp_DKQ[:, k] += np.bincount(
-                self.subs_nz[0], weights=uttkrp_I[:, k], minlength=self.L
-            )
 
         self.w *= uttkrp_DKQ
 
@@ -530,10 +519,12 @@ class CRep(ModelBase, ModelUpdateMixin):
         """
 
         if not self.assortative:
-            uttkrp_DK = sp_uttkrp(self.data_M_nz, subs_nz, m, self.u, self.v, self.w)
+            uttkrp_DK = sp_uttkrp_fused(
+                self.data_M_nz, subs_nz, m, self.u, self.v, self.w, index=self.nz_index
+            )
         else:
-            uttkrp_DK = sp_uttkrp_assortative(
-                self.data_M_nz, subs_nz, m, self.u, self.v, self.w
+            uttkrp_DK = sp_uttkrp_assortative_fused(
+                self.data_M_nz, subs_nz, m, self.u, self.v, self.w, index=self.nz_index
             )
 
         return uttkrp_DK
@@ -563,25 +554,16 @@ class CRep(ModelBase, ModelUpdateMixin):
             Pseudo log-likelihood value.
         """
 
-        self.lambda0_ija = lambda0_full(self.u, self.v, self.w)
-
         if mask is not None:
-            sub_mask_nz = mask.nonzero()
-            if isinstance(data, np.ndarray):
-                loglik = (
-                    -self.lambda0_ija[sub_mask_nz].sum()
-                    - self.eta * data_T[sub_mask_nz].sum()
-                )
-            elif isinstance(data, COO):
-                loglik = (
-                    -self.lambda0_ija[sub_mask_nz].sum()
-                    - self.eta * data_T.toarray()[sub_mask_nz].sum()
-                )
+            index = self._mask_index(mask, data, data_T)
+            loglik = (
+                -index.lambda0_sum(self.u, self.v, self.w) - self.eta * index.data_T_vals.sum()
+            )
         else:
             if isinstance(data, np.ndarray):
-                loglik = -self.lambda0_ija.sum() - self.eta * data_T.sum()
+                loglik = -lambda0_sum(self.u, self.v, self.w) - self.eta * data_T.sum()
             elif isinstance(data, COO):
-                loglik = -self.lambda0_ija.sum() - self.eta * data_T.data.sum()
+                loglik = -lambda0_sum(self.u, self.v, self.w) - self.eta * data_T.data.sum()
         logM = np.log(self.M_nz)
         if isinstance(data, np.ndarray):
             Alog = data[data.nonzero()] * logM
@@ -594,6 +576,14 @@ class CRep(ModelBase, ModelUpdateMixin):
             log_and_raise_error(ValueError, "PSLikelihood is NaN!!!!")
         return loglik
 
+    def _realization_state(self) -> Dict[str, Any]:
+        """
+        Return the parameters of the current realization read by `_update_optimal_parameters`.
+        """
+        state = super()._realization_state()
+        state["eta"] = self.eta
+        return state
+
     def _copy_variables(self, source_suffix: str, target_suffix: str) -> None:
         """
         Copy variables from source to target.
@@ -5,19 +5,21 @@ Class definition of DynCRep, the algorithm to perform inference in temporal netw
 import logging
 from pathlib import Path
 import time
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 from scipy.optimize import brentq, root
 from sparse import COO
 
-from ..input.preprocessing import preprocess
+from ..input.preprocessing import build_sparse_B_from_coords, lookup_sorted, preprocess
 from ..input.tools import (
-    get_item_array_from_subs, inherit_docstring, log_and_raise_error, sp_uttkrp,
-    sp_uttkrp_assortative)
-from ..output.evaluate import func_lagrange_multiplier, lambda0_full, u_with_lagrange_multiplier
+    inherit_docstring, log_and_raise_error, NonzeroIndex, sp_uttkrp_assortative_fused,
+    sp_uttkrp_fused, uttkrp_w)
+from ..output.evaluate import (
+    func_lagrange_multiplier, lambda0_sum, solve_lagrange_multipliers, u_with_lagrange_multiplier)
 from .base import ModelBase, ModelUpdateMixin
 from .constants import EPS_
+from .profiling import profiled
 
 
 class DynCRep(ModelBase, ModelUpdateMixin):
@@ -26,6 +28,8 @@ class DynCRep(ModelBase, ModelUpdateMixin):
     with reciprocity.
     """
 
+    _delta_names = ("u", "v", "w", "eta", "beta")
+
     @inherit_docstring(ModelBase)
     def __init__(
         self,
@@ -257,23 +261,16 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         self.data_Tm1 = data_Tm1
         self.data_T_vals = data_T_vals
         self.subs_nzp = subs_nzp
+        # Sort the non-zero entries once, to reuse the segments in every EM iteration
+        self.nz_index = NonzeroIndex.from_subs(subs_nzp, data_AtAtm1.shape)
         self.data = data
         self.data_T = data_T
         self.T = T
         self.mask = mask
 
         # Run the Expectation-Maximization (EM) algorithm for a specified number of realizations
-        for r in range(self.num_realizations):
-
-            # Initialize the parameters for the current realization
-            coincide, convergence, it, loglik, loglik_values = (
-                self._initialize_realization()
-            )
-
-            # Update the parameters for the current realization
-            it, loglik, coincide, convergence, loglik_values = self._update_realization(
-                r, it, loglik, coincide, convergence, loglik_values
-            )
+        # (the realizations run on a pool of processes when n_jobs > 1)
+        for r, (it, loglik, convergence, loglik_values) in self._realizations():
 
             # If the current log-likelihood is greater than the maximum log-likelihood so far,
             # update the optimal parameters and the maximum log-likelihood
@@ -329,10 +326,10 @@ class DynCRep(ModelBase, ModelUpdateMixin):
     def _preprocess_data_for_fit(self, T: int, data: Union[COO, np.ndarray]) -> Tuple[
         int,
         Union[COO, np.ndarray],
+        Union[COO, np.ndarray],
+        Union[COO, np.ndarray],
         np.ndarray,
-        np.ndarray,
-        np.ndarray,
-        np.ndarray,
+        Union[COO, np.ndarray],
         tuple,
     ]:
         """
@@ -363,66 +360,82 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         # Limit the data to the number of time steps
         data = data[: T + 1, :, :]
 
-        # Initialize the data for calculating the numerator containing Aij(t)*(1-Aij(t-1))
-        data_AtAtm1 = np.zeros(data.shape)
-        data_AtAtm1[0, :, :] = data[0, :, :]
+        # Sort the non-zero entries of the snapshots by time, source and target. The entries of
+        # consecutive snapshots are then matched by looking up their linear indices, so no dense
+        # (T, N, N) array is built when the input is sparse
+        data_sp = COO.from_numpy(data) if isinstance(data, np.ndarray) else COO(data)
+        shape = data_sp.shape
+        NN = shape[1] * shape[2]
+        keys = np.ravel_multi_index(tuple(data_sp.coords), shape)
+        order = np.argsort(keys, kind="stable")
+        keys, coords = keys[order], data_sp.coords[:, order]
+        vals = data_sp.data[order].astype(float)
+        t, i, j = coords
+
+        # Values of the same entries at time t-1 and at time t+1
+        prev_vals = np.where(t > 0, lookup_sorted(keys, vals, keys - NN), 0.0)
+        next_vals = np.where(t < T, lookup_sorted(keys, vals, keys + NN), 0.0)
+        layer_sums = np.bincount(t, weights=vals, minlength=T + 1)
 
         if self.flag_data_T == 1:  # same time step
-            self.E0 = np.sum(data[0])  # to calculate denominator eta
-            self.Etg0 = np.sum(data[1:])  # to calculate denominator eta
+            self.E0 = layer_sums[0]  # to calculate denominator eta
+            self.Etg0 = layer_sums[1:].sum()  # to calculate denominator eta
+            # Aji(t) is the transposed entry at the same time step
+            coords_Tm1, vals_Tm1 = coords[[0, 2, 1]], vals
         else:  # previous time step
             self.E0 = 0.0  # to calculate denominator eta
-            self.Etg0 = np.sum(data[:-1])  # to calculate denominator eta
-        self.bAtAtm1 = 0
-        self.Atm11At = 0
-        data_T = np.einsum(
-            "aij->aji", data
-        )  # to calculate denominator containing Aji(t)
-        if self.flag_data_T == 1:
-            # Copy the data at time t to the array data_Tm1
-            data_Tm1 = data_T.copy()
-        if self.flag_data_T == 0:
-            # Create data at time t-1 as an array of zeros
-            data_Tm1 = np.zeros_like(data)
-            # Copy the data at time t-1 to the array
-            for i in range(T):
-                data_Tm1[i + 1, :, :] = data_T[i, :, :]
-        self.sum_datatm1 = data_Tm1[1:].sum()
+            self.Etg0 = layer_sums[:-1].sum()  # to calculate denominator eta
+            # Aji(t) is the transposed entry at the previous time step
+            shift = t < T
+            coords_Tm1 = np.stack([t[shift] + 1, j[shift], i[shift]])
+            vals_Tm1 = vals[shift]
+        data_Tm1 = build_sparse_B_from_coords(coords_Tm1, vals_Tm1, shape)
+        self.sum_datatm1 = data_Tm1.data[data_Tm1.coords[0] > 0].sum()
 
         # Calculate Aij(t)*Aij(t-1) and (1-Aij(t))*Aij(t-1)
+        self.bAtAtm1 = 0
+        self.Atm11At = 0
         if T > 0:
             logging.debug(
                 "T is greater than 0. Proceeding with calculations that require "
                 "multiple time steps."
             )
-            # Calculate Aij(t)*Aij(t-1) and (1-Aij(t))*Aij(t-1)
-            bAtAtm1_l = 0
-            Atm11At_l = 0
-            for i in range(T):
-                data_AtAtm1[i + 1, :, :] = data[i + 1, :, :] * (1 - data[i, :, :])
-                # Calculate the expression Aij(t)*Aij(t-1)
-                sub_nz_and = np.logical_and(data[i + 1, :, :] > 0, data[i, :, :] > 0)
-                bAtAtm1_l += (
-                    (data[i + 1, :, :][sub_nz_and] * data[i, :, :][sub_nz_and])
-                ).sum()
-                # Calculate the expression (1-Aij(t))*Aij(t-1)
-                sub_nz_and = np.logical_and(
-                    data[i, :, :] > 0, (1 - data[i + 1, :, :]) > 0
-                )
-                Atm11At_l += (
-                    ((1 - data[i + 1, :, :])[sub_nz_and] * data[i, :, :][sub_nz_and])
-                ).sum()
-            self.bAtAtm1 = bAtAtm1_l
-            self.Atm11At = Atm11At_l
-
+            # Calculate the expression Aij(t)*Aij(t-1)
+            sub_nz_and = (t > 0) & (vals > 0) & (prev_vals > 0)
+            self.bAtAtm1 = (vals[sub_nz_and] * prev_vals[sub_nz_and]).sum()
+            # Calculate the expression (1-Aij(t))*Aij(t-1), with Aij(t-1) as the current entry
+            sub_nz_and = (t < T) & (vals > 0) & (1 - next_vals > 0)
+            self.Atm11At = ((1 - next_vals[sub_nz_and]) * vals[sub_nz_and]).sum()
+
+        # Calculate the numerator containing Aij(t)*(1-Aij(t-1))
+        vals_hat = np.where(t > 0, vals * (1 - prev_vals), vals)
         # Calculate the sum of the data hat from 1 to T
-        self.sum_data_hat = data_AtAtm1[1:].sum()
+        self.sum_data_hat = vals_hat[t > 0].sum()
+        vals_hat = vals_hat.astype(int)
+        nz_hat = vals_hat != 0
+        data_AtAtm1 = COO(
+            coords[:, nz_hat],
+            vals_hat[nz_hat],
+            shape=shape,
+            has_duplicates=False,
+            sorted=True,
+        )
 
         # Calculate the denominator containing Aji(t)
-        data_T_vals = get_item_array_from_subs(data_Tm1, data_AtAtm1.nonzero())  # type: ignore
+        data_T_vals = lookup_sorted(
+            np.ravel_multi_index(tuple(data_Tm1.coords), shape),
+            data_Tm1.data,
+            keys[nz_hat],
+        )
 
         # Preprocess the data to handle the sparsity
-        data_AtAtm1 = preprocess(data_AtAtm1)
+        if isinstance(data, np.ndarray):
+            # Dense inputs keep the dense tensors, unless they are sparse
+            data_T = np.einsum("aij->aji", data)
+            data_Tm1 = data_Tm1.todense()
+            data_AtAtm1 = preprocess(data_AtAtm1.todense())
+        else:
+            data_T = data_sp.transpose((0, 2, 1))
         data = preprocess(data)
 
         # Save the indices of the non-zero entries
@@ -439,6 +452,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
 
         return T, data, data_AtAtm1, data_T, data_T_vals, data_Tm1, subs_nzp
 
+    @profiled()
     def compute_likelihood(self) -> float:
         """
         Compute the likelihood of the model.
@@ -483,6 +497,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         # Randomize beta
         self._randomize_beta(1)  # Generates a single random number
 
+    @profiled()
     def _update_cache(
         self,
         data: Union[COO, np.ndarray],
@@ -514,6 +529,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
             self.data_M_nz = data.data / self.M_nz
             self.data_rho2 = ((data.data * self.eta * data_T_vals) / self.M_nz).sum()
 
+    @profiled()
     def _update_em(self) -> Tuple[float, float, float, float, float]:
         """
         Update parameters via EM procedure.
@@ -578,6 +594,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
 
         return d_u, d_v, d_w, d_eta, d_beta
 
+    @profiled()
     def _update_eta(self, denominator: float) -> float:
         """
         Update reciprocity coefficient eta.
@@ -606,6 +623,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
 
         return dist_eta
 
+    @profiled()
     def _update_beta(self):
         """
         Update beta.
@@ -622,6 +640,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
 
         return dist_beta
 
+    @profiled()
     def _update_U(self, subs_nz):
         """
         Update out-going membership matrix.
@@ -665,9 +684,10 @@ class DynCRep(ModelBase, ModelUpdateMixin):
                 w_k = np.einsum("a,ak->k", self.beta_hat, self.w)
                 Z_uk = np.einsum("k,k->k", Du, w_k)
 
-            for i in range(self.u.shape[0]):
-                lambda_i = self.enforce_constraintU(u_tmp[i], Z_uk)
-                self.u[i] = abs(u_tmp[i] / (lambda_i + Z_uk))
+            lambdas, converged = solve_lagrange_multipliers(u_tmp, Z_uk)
+            for i in np.flatnonzero(~converged):
+                lambdas[i] = self.enforce_constraintU(u_tmp[i], Z_uk)
+            self.u = abs(u_tmp / (lambdas[:, np.newaxis] + Z_uk))
 
         else:
 
@@ -694,15 +714,9 @@ class DynCRep(ModelBase, ModelUpdateMixin):
                 else:
                     w_k = np.einsum("a,ak->k", self.beta_hat, self.w)
                     Z_uk = np.einsum("k,k->k", Du, w_k)
-                for i in range(self.u.shape[0]):
-                    if self.u[i].sum() > self.err_max:
-                        u_root = root(
-                            u_with_lagrange_multiplier,
-                            self.u_old[i],
-                            args=(self.u[i], Z_uk),
-                        )
-                        self.u[i] = u_root.x
+                self._enforce_constraint(self.u, self.u_old, Z_uk)
 
+    @profiled()
     def _update_V(self, subs_nz):
         """
         Update in-coming membership matrix.
@@ -758,23 +772,39 @@ class DynCRep(ModelBase, ModelUpdateMixin):
                 w_k = np.einsum("a,ak->k", self.beta_hat, self.w)
                 Z_vk = np.einsum("k,k->k", Dv, w_k)
 
-            for i in range(self.v.shape[0]):
-                if self.v[i].sum() > self.err_max:
-                    v_root = root(
-                        u_with_lagrange_multiplier,
-                        self.v_old[i],
-                        args=(self.v[i], Z_vk),
-                    )
-                    self.v[i] = v_root.x
+            self._enforce_constraint(self.v, self.v_old, Z_vk)
 
-    def _specific_update_W_dyn(self, subs_nz: tuple):
+    def _enforce_constraint(self, x: np.ndarray, x_old: np.ndarray, Z_k: np.ndarray) -> None:
+        """
+        Normalize in place the rows of a membership matrix whose sum exceeds `err_max`.
 
-        uttkrp_DKQ = np.zeros_like(self.w)
+        The Lagrange multipliers of all the rows are found at once; the rows where the batched
+        solver does not converge fall back to the root finding on the single row.
 
-        for idx, (a, i, j) in enumerate(zip(*subs_nz)):
-            uttkrp_DKQ[a, :, :] += self.data_M_nz[idx] * np.einsum(
-                "k,q->kq", self.u[i], self.v[j]
-            )
+        Parameters
+        ----------
+        x : ndarray
+            Membership matrix after the multiplicative update.
+        x_old : ndarray
+                Membership matrix at the previous iteration, used as the starting point of the
+                fallback.
+        Z_k : ndarray
+              Normalization of each community.
+        """
+        rows = np.flatnonzero(x.sum(axis=1) > self.err_max)
+        if rows.size == 0:
+            return
+        lambdas, converged = solve_lagrange_multipliers(x[rows], Z_k)
+        solved = rows[converged]
+        x[solved] /= lambdas[converged, np.newaxis] + Z_k
+        for i in rows[~converged]:
+            x[i] = root(u_with_lagrange_multiplier, x_old[i], args=(x[i], Z_k)).x
+
+    def _specific_update_W_dyn(self, subs_nz: tuple):
+
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz, subs_nz, self.u, self.v, self.w.shape[0], index=self.nz_index
+        )
 
         self.w = self.w * uttkrp_DKQ
 
@@ -784,6 +814,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         non_zeros = Z > 0
         self.w[non_zeros] /= Z[non_zeros]
 
+    @profiled()
     def _update_W_dyn(self, subs_nz):
         """
         Update affinity tensor.
@@ -810,16 +841,10 @@ class DynCRep(ModelBase, ModelUpdateMixin):
 
     def _specific_update_W_stat(self, subs_nz: tuple):
 
-        sub_w_nz = self.w.nonzero()
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum("Ik,Iq->Ikq", self.u[subs_nz[1], :], self.v[subs_nz[2], :])
-        uttkrp_I = self.data_M_nz[:, np.newaxis, np.newaxis] * UV
-
-        for _a, k, q in zip(*sub_w_nz):
-            uttkrp_DKQ[:, k, q] += np.bincount(
-                subs_nz[0], weights=uttkrp_I[:, k, q], minlength=1
-            )[0]
+        # Only the contribution of the first time step enters the static update
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz, subs_nz, self.u, self.v, 1, index=self.nz_index
+        )
 
         self.w = (self.ag - 1) + self.w * uttkrp_DKQ
 
@@ -832,6 +857,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         non_zeros = Z > 0
         self.w[non_zeros] /= Z[non_zeros]
 
+    @profiled()
     def _update_W_stat(self, subs_nz):
         """
         Update affinity tensor.
@@ -852,10 +878,16 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         return dist_w
 
     def _specific_update_W_assortative(self, subs_nz: tuple, temporal: bool):
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        for idx, (a, i, j) in enumerate(zip(*subs_nz)):
-            uttkrp_DKQ[a, :] += self.data_M_nz[idx] * self.u[i] * self.v[j]
+        # The static update only uses the contribution of the first time step
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz,
+            subs_nz,
+            self.u,
+            self.v,
+            self.w.shape[0] if temporal else 1,
+            assortative=True,
+            index=self.nz_index,
+        )
 
         self.w = (self.ag - 1) + self.w * uttkrp_DKQ
 
@@ -870,6 +902,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         non_zeros = Z > 0
         self.w[non_zeros] /= Z[non_zeros]
 
+    @profiled()
     def _update_W_assortative_dyn(self, subs_nz):
         """
         Update affinity tensor (assuming assortativity).
@@ -889,6 +922,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
 
         return dist_w
 
+    @profiled()
     def _update_W_assortative_stat(self, subs_nz):
         """
         Update affinity tensor (assuming assortativity).
@@ -902,7 +936,7 @@ class DynCRep(ModelBase, ModelUpdateMixin):
                  Maximum distance between the old and the new affinity tensor w.
         """
 
-        self._specific_update_W_assortative_stat(subs_nz, self.temporal)
+        self._specific_update_W_assortative(subs_nz, self.temporal)
 
         dist_w, self.w, self.w_old = self._finalize_update(self.w, self.w_old)
 
@@ -931,12 +965,12 @@ class DynCRep(ModelBase, ModelUpdateMixin):
                     Khatri-Rao product of the membership matrix.
         """
         if not self.assortative:
-            uttkrp_DK = sp_uttkrp(
-                self.data_M_nz, subs_nz, m, u, v, w, temporal=self.temporal
+            uttkrp_DK = sp_uttkrp_fused(
+                self.data_M_nz, subs_nz, m, u, v, w, temporal=self.temporal, index=self.nz_index
             )
         else:
-            uttkrp_DK = sp_uttkrp_assortative(
-                self.data_M_nz, subs_nz, m, u, v, w, temporal=self.temporal
+            uttkrp_DK = sp_uttkrp_assortative_fused(
+                self.data_M_nz, subs_nz, m, u, v, w, temporal=self.temporal, index=self.nz_index
             )
         return uttkrp_DK
 
@@ -989,35 +1023,26 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         else:
             w_k = np.einsum("a,ak->ak", self.beta_hat, self.w)
 
-        lambda0_ija_loc = lambda0_full(self.u, self.v, w_k)
-
         if mask is not None:
-            sub_mask_nz = mask.nonzero()
-            if isinstance(data, np.ndarray):
-                loglik = (
-                    -(1 + self.beta0) * self.lambda0_ija[sub_mask_nz].sum()  # type: ignore #
-                    # TODO: Ask Hadiseh why this is not defined
-                    - self.eta
-                    * (data_T[sub_mask_nz] * self.beta_hat[sub_mask_nz[0]]).sum()
-                )
-            elif isinstance(data, COO):
-                loglik = (
-                    -(1 + self.beta0) * self.lambda0_ija[sub_mask_nz].sum()
-                    # TODO: Ask Hadiseh why this is not defined
-                    - self.eta
-                    * (
-                        data_T.todense()[sub_mask_nz] * self.beta_hat[sub_mask_nz[0]]
-                    ).sum()
-                )
+            index = self._mask_index(mask, data, data_T)
+            loglik = (
+                -(1 + self.beta0) * index.lambda0_sum(self.u, self.v, self.w)
+                - self.eta * (index.data_T_vals * self.beta_hat[index.subs[0]]).sum()
+            )
         else:
             if isinstance(data, np.ndarray):
-                loglik = -(1 + self.beta0) * self.lambda0_ija.sum() - self.eta * (  # type: ignore
+                loglik = -(1 + self.beta0) * lambda0_sum(self.u, self.v, self.w) - self.eta * (
                     data_T[0].sum() + self.beta0 * data_T[1:].sum()
                 )
             elif isinstance(data, COO):
+                data_T_sums = (
+                    np.bincount(data_T.coords[0], weights=data_T.data, minlength=data_T.shape[0])
+                    if isinstance(data_T, COO)
+                    else data_T.sum(axis=(1, 2))
+                )
                 loglik = (
-                    -lambda0_ija_loc.sum()
-                    - self.eta * (data_T.sum(axis=(1, 2)) * self.beta_hat).sum()
+                    -lambda0_sum(self.u, self.v, w_k)
+                    - self.eta * (data_T_sums * self.beta_hat).sum()
                 )
 
         logM = np.log(self.M_nz)
@@ -1100,6 +1125,14 @@ class DynCRep(ModelBase, ModelUpdateMixin):
         bt += self.Atm11At / beta_t  # adding Aij(t-1)*(1-Aij(t))
         return bt
 
+    def _realization_state(self) -> Dict[str, Any]:
+        """
+        Return the parameters of the current realization read by `_update_optimal_parameters`.
+        """
+        state = super()._realization_state()
+        state.update(eta=self.eta, beta=self.beta, beta_hat=self.beta_hat)
+        return state
+
     def _copy_variables(self, source_suffix: str, target_suffix: str) -> None:
         """
         Copy variables from source to target.
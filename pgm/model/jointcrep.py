@@ -6,17 +6,18 @@ The latent variables are related to community memberships and a pair interaction
 import logging
 from pathlib import Path
 import time
-from typing import Any, List, Tuple, Union
+from typing import Any, Dict, List, Tuple, Union
 
 import numpy as np
 from sparse import COO
 
 from ..input.preprocessing import preprocess
 from ..input.tools import (
-    check_symmetric, get_item_array_from_subs, inherit_docstring, log_and_raise_error, sp_uttkrp,
-    sp_uttkrp_assortative, transpose_tensor)
+    check_symmetric, get_item_array_from_subs, inherit_docstring, log_and_raise_error, NonzeroIndex,
+    sp_uttkrp_assortative_fused, sp_uttkrp_fused, transpose_tensor, uttkrp_w)
 from ..output.evaluate import lambda0_full
 from .base import ModelBase, ModelUpdateMixin
+from .profiling import profiled
 
 
 class JointCRep(ModelBase, ModelUpdateMixin):
@@ -190,19 +191,12 @@ class JointCRep(ModelBase, ModelUpdateMixin):
         # Store the preprocessed data and the indices of its non-zero elements
         self.data = data
         self.subs_nz = subs_nz
+        # Sort the non-zero entries once, to reuse the segments in every EM iteration
+        self.nz_index = NonzeroIndex.from_subs(subs_nz, data.shape)
 
         # Run the Expectation-Maximization (EM) algorithm for a specified number of realizations
-        for r in range(self.num_realizations):
-
-            # Initialize the parameters for the current realization
-            coincide, convergence, it, loglik, loglik_values = (
-                self._initialize_realization(data, subs_nz)
-            )
-
-            # Update the parameters for the current realization
-            it, loglik, coincide, convergence, loglik_values = self._update_realization(
-                r, it, loglik, coincide, convergence, loglik_values
-            )
+        # (the realizations run on a pool of processes when n_jobs > 1)
+        for r, (it, loglik, convergence, loglik_values) in self._realizations():
 
             # If the current log-likelihood is greater than the maximum log-likelihood so far,
             # update the optimal parameters and the maximum log-likelihood
@@ -233,7 +227,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
         # Return the final parameters and the maximum log-likelihood
         return self.u_f, self.v_f, self.w_f, self.eta_f, maxL  # type: ignore
 
-    def _initialize_realization(self, data, subs_nz):
+    def _initialize_realization(self):
         """
         This method initializes the parameters for each realization of the EM algorithm.
         It also sets up local variables for convergence checking.
@@ -248,7 +242,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
         super()._update_old_variables()
 
         # Update the cache used in the EM update
-        self._update_cache(data, subs_nz)
+        self._update_cache(self.data, self.subs_nz)
 
         # Set up local variables for convergence checking
         # coincide and it are counters, convergence is a boolean flag
@@ -304,6 +298,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
 
         return data, data_T_vals, subs_nz  # type: ignore
 
+    @profiled()
     def compute_likelihood(self) -> float:
         """
         Compute the log-likelihood of the data.
@@ -315,6 +310,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
         """
         return self._likelihood()
 
+    @profiled()
     def _update_cache(self, data: Union[COO, np.ndarray], subs_nz: tuple) -> None:
         """
         Update the cache used in the em_update.
@@ -327,7 +323,15 @@ class JointCRep(ModelBase, ModelUpdateMixin):
                   Indices of elements of data that are non-zero.
         """
 
-        self.lambda_aij = lambda0_full(self.u, self.v, self.w)  # full matrix lambda
+        # Full matrix lambda, written in place of the one of the previous update
+        buffer = getattr(self, "lambda_aij", None)
+        if not (
+            isinstance(buffer, np.ndarray)
+            and buffer.shape == (self.L, self.N, self.N)
+            and buffer.flags.writeable
+        ):
+            buffer = None
+        self.lambda_aij = lambda0_full(self.u, self.v, self.w, out=buffer)
 
         self.lambda_nz = super()._lambda_nz(
             subs_nz
@@ -368,6 +372,21 @@ class JointCRep(ModelBase, ModelUpdateMixin):
 
         return Z
 
+    def _den_updates_over_Z(self) -> np.ndarray:
+        """
+        Return the ratio between den_updates and Z, shared by the exact updates.
+
+        The denominators of the exact updates are contracted from this (L, N, N) tensor with
+        matrix products, instead of building temporaries with L x N x N x K (x K) entries.
+
+        Returns
+        -------
+        G : ndarray
+            Ratio den_updates / Z.
+        """
+        return self.den_updates / self.Z
+
+    @profiled()
     def _update_em(self) -> tuple:
         """
         Update parameters via EM procedure.
@@ -437,6 +456,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
 
         return d_u, d_v, d_w, d_eta
 
+    @profiled()
     def _update_U_approx(self) -> float:
         """
         Update out-going membership matrix by using an approximation.
@@ -475,13 +495,14 @@ class JointCRep(ModelBase, ModelUpdateMixin):
             VW = np.einsum("jq,akq->ajk", self.v, self.w)
         else:
             VW = np.einsum("jk,ak->ajk", self.v, self.w)
-        VWL = np.einsum("aji,ajk->aijk", self.den_updates, VW)
-        den = np.einsum("aijk,aij->ik", VWL, 1.0 / self.Z)
+        # Z is symmetric, so (den_updates / Z)[a].T holds den_updates[a, j, i] / Z[a, i, j]
+        den = np.matmul(self._den_updates_over_Z().transpose(0, 2, 1), VW).sum(axis=0)
 
         non_zeros = den > 0.0
         self.u[den == 0] = 0.0
         self.u[non_zeros] /= den[non_zeros]
 
+    @profiled()
     def _update_V_approx(self) -> float:
         """
         Update in-coming membership matrix by using an approximation.
@@ -523,8 +544,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
             UW = np.einsum("jq,aqk->ajk", self.u, self.w)
         else:
             UW = np.einsum("jk,ak->ajk", self.u, self.w)
-        UWL = np.einsum("aij,ajk->aijk", self.den_updates, UW)
-        den = np.einsum("aijk,aij->ik", UWL, 1.0 / self.Z)
+        den = np.matmul(self._den_updates_over_Z(), UW).sum(axis=0)
 
         non_zeros = den > 0.0
         self.v[den == 0] = 0.0
@@ -532,50 +552,41 @@ class JointCRep(ModelBase, ModelUpdateMixin):
 
     def _specific_update_W(self):
 
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Iq->Ikq", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz, self.subs_nz, self.u, self.v, self.w.shape[0], index=self.nz_index
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis, np.newaxis] * UV
-        for k in range(self.K):
-            for q in range(self.K):
-                uttkrp_DKQ[:, k, q] += np.bincount(
-                    self.subs_nz[0], weights=uttkrp_I[:, k, q], minlength=self.L
-                )
 
         self.w = self.w_old * uttkrp_DKQ
 
-        UL = np.einsum("ik,aji->aijk", self.u, self.den_updates)
-        num = np.einsum("jq,aijk->aijkq", self.v, UL)
-        den = np.einsum("aijkq,aij->akq", num, 1.0 / self.Z)
+        # Z is symmetric, so GU[a, j, k] = sum_i u_ik den_updates[a, j, i] / Z[a, i, j]
+        GU = np.matmul(self._den_updates_over_Z(), self.u)
+        den = np.matmul(GU.transpose(0, 2, 1), self.v)
 
         non_zeros = den > 0.0
         self.w[den == 0] = 0.0
         self.w[non_zeros] /= den[non_zeros]
 
     def _specific_update_W_assortative(self):
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Ik->Ik", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz,
+            self.subs_nz,
+            self.u,
+            self.v,
+            self.w.shape[0],
+            assortative=True,
+            index=self.nz_index,
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis] * UV
-        for k in range(self.K):
-            uttkrp_DKQ[:, k] += np.bincount(
-                self.subs_nz[0], weights=uttkrp_I[:, k], minlength=self.L
-            )
 
         self.w = self.w_old * uttkrp_DKQ
 
-        UL = np.einsum("ik,aji->aijk", self.u, self.den_updates)
-        num = np.einsum("jk,aijk->aijk", self.v, UL)
-        den = np.einsum("aijk,aij->ak", num, 1.0 / self.Z)
+        GU = np.matmul(self._den_updates_over_Z(), self.u)
+        den = np.einsum("ajk,jk->ak", GU, self.v)
 
         non_zeros = den > 0.0
         self.w[den == 0] = 0.0
         self.w[non_zeros] /= den[non_zeros]
 
+    @profiled()
     def _update_W_approx(self) -> float:
         """
         Update affinity tensor.
@@ -591,22 +602,14 @@ class JointCRep(ModelBase, ModelUpdateMixin):
                  Maximum distance between the old and the new affinity tensor w.
         """
 
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Iq->Ikq", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz, self.subs_nz, self.u, self.v, self.w.shape[0], index=self.nz_index
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis, np.newaxis] * UV
-        for k in range(self.K):
-            for q in range(self.K):
-                uttkrp_DKQ[:, k, q] += np.bincount(
-                    self.subs_nz[0], weights=uttkrp_I[:, k, q], minlength=self.L
-                )
 
         self.w = self.w_old * uttkrp_DKQ
 
-        UL = np.einsum("ik,aji->aijk", self.u, self.den_updates)
-        den = np.einsum("jq,aijk->akq", self.v, UL)
+        UL = np.matmul(self.den_updates, self.u)
+        den = np.matmul(UL.transpose(0, 2, 1), self.v)
 
         non_zeros = den > 0.0
         self.w[den == 0] = 0.0
@@ -620,6 +623,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
 
         return dist_w
 
+    @profiled()
     def _update_W_assortative_approx(self) -> float:
         """
         Update affinity tensor (assuming assortativity).
@@ -635,21 +639,20 @@ class JointCRep(ModelBase, ModelUpdateMixin):
                  Maximum distance between the old and the new affinity tensor w.
         """
 
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Ik->Ik", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz,
+            self.subs_nz,
+            self.u,
+            self.v,
+            self.w.shape[0],
+            assortative=True,
+            index=self.nz_index,
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis] * UV
-        for k in range(self.K):
-            uttkrp_DKQ[:, k] += np.bincount(
-                self.subs_nz[0], weights=uttkrp_I[:, k], minlength=self.L
-            )
 
         self.w = self.w_old * uttkrp_DKQ
 
-        UL = np.einsum("ik,aji->aijk", self.u, self.den_updates)
-        den = np.einsum("jk,aijk->ak", self.v, UL)
+        UL = np.matmul(self.den_updates, self.u)
+        den = np.einsum("ajk,jk->ak", UL, self.v)
 
         non_zeros = den > 0.0
         self.w[den == 0] = 0.0
@@ -663,6 +666,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
 
         return dist_w
 
+    @profiled()
     def _update_eta_approx(self) -> float:
         """
         Update pair interaction coefficient eta by using an approximation.
@@ -701,6 +705,7 @@ class JointCRep(ModelBase, ModelUpdateMixin):
             log_and_raise_error(ValueError, "eta fix point has zero denominator!")
         return self.AAtSum / st
 
+    @profiled()
     def _update_eta(self) -> float:
         """
         Update pair interaction coefficient eta.
@@ -742,10 +747,12 @@ class JointCRep(ModelBase, ModelUpdateMixin):
         """
 
         if not self.assortative:
-            uttkrp_DK = sp_uttkrp(self.data_M_nz, subs_nz, m, self.u, self.v, self.w)
+            uttkrp_DK = sp_uttkrp_fused(
+                self.data_M_nz, subs_nz, m, self.u, self.v, self.w, index=self.nz_index
+            )
         else:
-            uttkrp_DK = sp_uttkrp_assortative(
-                self.data_M_nz, subs_nz, m, self.u, self.v, self.w
+            uttkrp_DK = sp_uttkrp_assortative_fused(
+                self.data_M_nz, subs_nz, m, self.u, self.v, self.w, index=self.nz_index
             )
 
         return uttkrp_DK
@@ -779,6 +786,14 @@ class JointCRep(ModelBase, ModelUpdateMixin):
 
         return loglik
 
+    def _realization_state(self) -> Dict[str, Any]:
+        """
+        Return the parameters of the current realization read by `_update_optimal_parameters`.
+        """
+        state = super()._realization_state()
+        state["eta"] = self.eta
+        return state
+
     def _copy_variables(self, source_suffix: str, target_suffix: str) -> None:
         """
         Copy variables from source to target.
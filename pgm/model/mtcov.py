@@ -7,16 +7,18 @@ import logging
 from pathlib import Path
 import sys
 import time
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import scipy.sparse
 from sparse import COO
 
 from ..input.preprocessing import preprocess, preprocess_X
-from ..input.tools import inherit_docstring, sp_uttkrp, sp_uttkrp_assortative
-from ..output.evaluate import lambda0_full
+from ..input.tools import (
+    inherit_docstring, NonzeroIndex, sp_uttkrp_assortative_fused, sp_uttkrp_fused, uttkrp_w)
+from ..output.evaluate import lambda0_sum
 from .base import ModelBase, ModelUpdateMixin
+from .profiling import profiled
 
 
 class MTCOV(ModelBase, ModelUpdateMixin):
@@ -25,6 +27,8 @@ class MTCOV(ModelBase, ModelUpdateMixin):
     node attributes to extract overlapping communities in directed and undirected multilayer networks.
     """
 
+    _delta_names = ("u", "v", "w", "beta")
+
     @inherit_docstring(ModelBase)
     def __init__(
         self,
@@ -178,6 +182,8 @@ class MTCOV(ModelBase, ModelUpdateMixin):
         self.data_X = data_X
         self.subs_nz = subs_nz
         self.subs_X_nz = subs_X_nz
+        # Sort the non-zero entries once, to reuse the segments in every EM iteration
+        self.nz_index = NonzeroIndex.from_subs(subs_nz, data.shape)
         self.batch_size = batch_size
         self.subset_N = subset_N
         self.Subs = Subs
@@ -185,17 +191,8 @@ class MTCOV(ModelBase, ModelUpdateMixin):
 
         # The following part of the code is responsible for running the Expectation-Maximization
         # (EM)  algorithm for a specified number of realizations (self.num_realizations):
-        for r in range(self.num_realizations):
-
-            # Initialize the parameters for the current realization
-            coincide, convergence, it, loglik, loglik_values = (
-                self._initialize_realization()
-            )
-
-            # Update the parameters for the current realization
-            it, loglik, coincide, convergence, loglik_values = self._update_realization(
-                r, it, loglik, coincide, convergence, loglik_values
-            )
+        # (the realizations run on a pool of processes when n_jobs > 1)
+        for r, (it, loglik, convergence, loglik_values) in self._realizations():
 
             # If the current log-likelihood is greater than the maximum log-likelihood so far,
             # update the optimal parameters and the maximum log-likelihood
@@ -338,6 +335,7 @@ class MTCOV(ModelBase, ModelUpdateMixin):
         # Return the initial state of the realization
         return coincide, convergence, it, loglik, loglik_values
 
+    @profiled()
     def compute_likelihood(self):
         """
         Compute the pseudo log-likelihood of the data.
@@ -354,6 +352,7 @@ class MTCOV(ModelBase, ModelUpdateMixin):
                 self.data, self.data_X, self.subset_N, self.Subs, self.SubsX
             )
 
+    @profiled()
     def _update_em(self):
         """
         Update parameters via EM procedure.
@@ -416,6 +415,7 @@ class MTCOV(ModelBase, ModelUpdateMixin):
         if self.gamma != 1:
             self._randomize_w()
 
+    @profiled()
     def _update_cache(
         self,
         data: Union[COO, np.ndarray],
@@ -486,18 +486,9 @@ class MTCOV(ModelBase, ModelUpdateMixin):
 
     def _specific_update_W(self):
 
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Iq->Ikq", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz, self.subs_nz, self.u, self.v, self.w.shape[0], index=self.nz_index
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis, np.newaxis] * UV
-
-        for k in range(self.K):
-            for q in range(self.K):
-                uttkrp_DKQ[:, k, q] += np.bincount(
-                    self.subs_nz[0], weights=uttkrp_I[:, k, q], minlength=self.L
-                )
         self.w *= uttkrp_DKQ
         Z = np.einsum("k,q->kq", self.u.sum(axis=0), self.v.sum(axis=0))
         non_zeros = Z > 0
@@ -505,17 +496,15 @@ class MTCOV(ModelBase, ModelUpdateMixin):
         self.w[:, non_zeros] /= Z[non_zeros]
 
     def _specific_update_W_assortative(self):
-        uttkrp_DKQ = np.zeros_like(self.w)
-
-        UV = np.einsum(
-            "Ik,Ik->Ik", self.u[self.subs_nz[1], :], self.v[self.subs_nz[2], :]
+        uttkrp_DKQ = uttkrp_w(
+            self.data_M_nz,
+            self.subs_nz,
+            self.u,
+            self.v,
+            self.w.shape[0],
+            assortative=True,
+            index=self.nz_index,
         )
-        uttkrp_I = self.data_M_nz[:, np.newaxis] * UV
-
-        for k in range(self.K):
-            uttkrp_DKQ[:, k] += np.bincount(
-                self.subs_nz[0], weights=uttkrp_I[:, k], minlength=self.L
-            )
 
         self.w *= uttkrp_DKQ
 
@@ -524,6 +513,7 @@ class MTCOV(ModelBase, ModelUpdateMixin):
         for a in range(self.L):
             self.w[a, non_zeros] /= Z[non_zeros]
 
+    @profiled()
     def _update_beta(self, subs_X_nz: Tuple[np.ndarray]) -> float:
         """
         Update beta matrix.
@@ -614,9 +604,11 @@ class MTCOV(ModelBase, ModelUpdateMixin):
         """
 
         if not self.assortative:
-            uttkrp_DK = sp_uttkrp(self.data_M_nz, subs_nz, m, u, v, w)
+            uttkrp_DK = sp_uttkrp_fused(self.data_M_nz, subs_nz, m, u, v, w, index=self.nz_index)
         else:
-            uttkrp_DK = sp_uttkrp_assortative(self.data_M_nz, subs_nz, m, u, v, w)
+            uttkrp_DK = sp_uttkrp_assortative_fused(
+                self.data_M_nz, subs_nz, m, u, v, w, index=self.nz_index
+            )
 
         if m == 1:
             uttkrp_DK *= u
@@ -646,8 +638,7 @@ class MTCOV(ModelBase, ModelUpdateMixin):
             Log-likelihood value.
         """
 
-        self.lambda0_ija = lambda0_full(self.u, self.v, self.w)
-        lG = -self.lambda0_ija.sum()
+        lG = -lambda0_sum(self.u, self.v, self.w)
         logM = np.log(self.lambda0_nz)
         if isinstance(self.data, np.ndarray):
             Alog = self.data[self.data.nonzero()] * logM
@@ -704,9 +695,8 @@ class MTCOV(ModelBase, ModelUpdateMixin):
         """
 
         size = len(subset_N)
-        self.lambda0_ija = lambda0_full(self.u, self.v, self.w)
-        assert self.lambda0_ija.shape == (self.L, size, size)
-        lG = -self.lambda0_ija.sum()
+        assert self.u.shape[0] == self.v.shape[0] == size
+        lG = -lambda0_sum(self.u, self.v, self.w)
         logM = np.log(self.lambda0_nz)
         IDXs = [
             i for i, e in enumerate(Subs) if (e[1] in subset_N) and (e[2] in subset_N)
@@ -783,6 +773,14 @@ class MTCOV(ModelBase, ModelUpdateMixin):
 
         return it, coincide, convergence
 
+    def _realization_state(self) -> Dict[str, Any]:
+        """
+        Return the parameters of the current realization read by `_update_optimal_parameters`.
+        """
+        state = super()._realization_state()
+        state["beta"] = self.beta
+        return state
+
     def _copy_variables(self, source_suffix: str, target_suffix: str) -> None:
         """
         Copy variables from source to target.
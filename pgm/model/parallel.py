@@ -0,0 +1,279 @@
+"""
+Run the realizations of the EM algorithm on a pool of processes.
+
+The data a model keeps for a fit is placed in shared memory once, so the worker processes read it
+without receiving a copy per realization. Every realization is seeded with a seed derived from the
+random seed of the fit, which makes the results independent of the number of processes and of the
+order in which the realizations complete.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import dataclasses
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sparse import COO
+
+from ..input.tools import log_and_raise_error, NonzeroIndex
+from .constants import SHARED_MIN_BYTES_
+from .profiling import PhaseProfiler
+
+# Model of the worker process and the shared memory blocks it is attached to
+_WORKER_MODEL: Optional[Any] = None
+_WORKER_BLOCKS: List[shared_memory.SharedMemory] = []
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedArray:
+    """
+    Reference to an array stored in a shared memory block.
+
+    Attributes
+    ----------
+    name : str
+           Name of the shared memory block.
+    shape : tuple
+            Shape of the array.
+    dtype : str
+            Data type of the array.
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedCOO:
+    """
+    Reference to a sparse COO tensor whose coordinates and values are stored in shared memory.
+
+    Attributes
+    ----------
+    coords : SharedArray
+             Coordinates of the non-zero entries.
+    data : SharedArray
+           Values of the non-zero entries.
+    shape : tuple
+            Shape of the tensor.
+    """
+
+    coords: Any
+    data: Any
+    shape: Tuple[int, ...]
+
+
+def resolve_n_jobs(n_jobs: int) -> int:
+    """
+    Return the number of processes to use.
+
+    Parameters
+    ----------
+    n_jobs : int
+             Number of processes requested. A value of -1 uses all the available CPUs.
+
+    Returns
+    -------
+    n_jobs : int
+             Number of processes to use.
+    """
+    if n_jobs == -1:
+        return os.cpu_count() or 1
+    if not isinstance(n_jobs, (int, np.integer)) or n_jobs < 1:
+        log_and_raise_error(
+            ValueError, "The number of jobs must be a positive integer or -1."
+        )
+    return int(n_jobs)
+
+
+def derive_seeds(rseed: Optional[int], n: int) -> List[int]:
+    """
+    Derive independent seeds for `n` realizations from the random seed of the fit.
+
+    Parameters
+    ----------
+    rseed : int or None
+            Random seed of the fit.
+    n : int
+        Number of realizations.
+
+    Returns
+    -------
+    seeds : list
+            Seed of every realization.
+    """
+    children = np.random.SeedSequence(rseed).spawn(n)
+    return [int(child.generate_state(1, dtype=np.uint32)[0]) for child in children]
+
+
+def _share(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    """
+    Move the large arrays contained in `value` to shared memory and return a reference to them.
+    """
+    if isinstance(value, np.ndarray):
+        if value.nbytes < SHARED_MIN_BYTES_ or value.dtype.hasobject:
+            return value
+        block = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        blocks.append(block)
+        np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+        return SharedArray(block.name, value.shape, value.dtype.str)
+    if isinstance(value, COO):
+        return SharedCOO(
+            _share(value.coords, blocks),
+            _share(value.data, blocks),
+            value.shape,
+        )
+    if isinstance(value, NonzeroIndex):
+        return dataclasses.replace(
+            value,
+            subs=_share(value.subs, blocks),
+            order=_share(value.order, blocks),
+            indptr=_share(value.indptr, blocks),
+        )
+    if isinstance(value, tuple):
+        return tuple(_share(item, blocks) for item in value)
+    return value
+
+
+def _attach(value: Any, blocks: List[shared_memory.SharedMemory]) -> Any:
+    """
+    Replace the references to shared memory contained in `value` with read-only arrays.
+    """
+    if isinstance(value, SharedArray):
+        block = shared_memory.SharedMemory(name=value.name)
+        blocks.append(block)
+        array = np.ndarray(value.shape, dtype=np.dtype(value.dtype), buffer=block.buf)
+        array.flags.writeable = False
+        return array
+    if isinstance(value, SharedCOO):
+        return COO(
+            _attach(value.coords, blocks),
+            _attach(value.data, blocks),
+            shape=value.shape,
+            has_duplicates=False,
+        )
+    if isinstance(value, NonzeroIndex):
+        return dataclasses.replace(
+            value,
+            subs=_attach(value.subs, blocks),
+            order=_attach(value.order, blocks),
+            indptr=_attach(value.indptr, blocks),
+        )
+    if isinstance(value, tuple):
+        return tuple(_attach(item, blocks) for item in value)
+    return value
+
+
+def _init_worker(template: Any, stop_realization: Any) -> None:
+    """
+    Attach the worker process to the shared data of the model and to the index of the realization
+    that stops the fit.
+    """
+    global _WORKER_MODEL  # pylint: disable=global-statement
+    template.__dict__.update(
+        {name: _attach(value, _WORKER_BLOCKS) for name, value in vars(template).items()}
+    )
+    template._stop_realization = stop_realization
+    _WORKER_MODEL = template
+
+
+def _run_worker_realization(r: int, seed: int) -> Dict[str, Any]:
+    """
+    Run one realization in the worker process and return its results, or a skipped marker if a
+    callback already stopped the fit in a previous realization.
+    """
+    model = _WORKER_MODEL
+    if 0 <= model._stop_realization.value < r:
+        return {"skipped": True}
+    model.rseed = seed
+    model.rng = np.random.RandomState(seed)
+    if model._profiler is not None:
+        # Profile every realization separately, to be merged in the main process
+        model._profiler = PhaseProfiler(model._profiler.trace_memory)
+    model._stop_fit = False
+    model.likelihood_checks_ = {"evaluations": 0, "fixed_schedule": 0}
+    try:
+        it, loglik, convergence, loglik_values = model._run_realization(r)
+    finally:
+        # The worker may stay idle until the end of the fit
+        model._close_callbacks()
+    return {
+        "skipped": False,
+        "results": (it, loglik, convergence, loglik_values),
+        "state": model._realization_state(),
+        "time_start": model.time_start,
+        "profile": model._profiler,
+        "stop_fit": model._stop_fit,
+        "likelihood_checks": model.likelihood_checks_,
+    }
+
+
+def run_realizations(
+    model: Any, n_jobs: int
+) -> Iterator[Tuple[int, Tuple[int, float, bool, list]]]:
+    """
+    Run the realizations of a model on a pool of processes.
+
+    The results are yielded in the order of the realizations. Before yielding the results of a
+    realization, its parameters are set on `model`, so the caller can store them as the optimal
+    ones exactly as in a serial fit. When a callback stops the fit in a realization, the following
+    realizations that have not started are skipped, and those already running stop at their next
+    iteration and are not yielded, so the best parameters are chosen among the same realizations
+    as in a serial fit. The previous realizations still run to the end.
+
+    Parameters
+    ----------
+    model : ModelBase
+            Model with the data of the fit already stored.
+    n_jobs : int
+             Number of processes.
+
+    Yields
+    ------
+    r : int
+        Index of the realization.
+    results : tuple
+              Number of iterations, log-likelihood, convergence flag and log-likelihood values.
+    """
+    seeds = derive_seeds(model.rseed, model.num_realizations)
+    blocks: List[shared_memory.SharedMemory] = []
+    stop_realization = multiprocessing.Value("i", -1)
+    try:
+        template = copy.copy(model)
+        template.__dict__ = {
+            name: _share(value, blocks) for name, value in vars(model).items()
+        }
+        with ProcessPoolExecutor(
+            max_workers=min(n_jobs, model.num_realizations),
+            initializer=_init_worker,
+            initargs=(template, stop_realization),
+        ) as executor:
+            futures = [
+                executor.submit(_run_worker_realization, r, seed)
+                for r, seed in enumerate(seeds)
+            ]
+            for r, future in enumerate(futures):
+                outcome = future.result()
+                if outcome["skipped"]:
+                    continue
+                for name, value in outcome["state"].items():
+                    setattr(model, name, value)
+                model.time_start = outcome["time_start"]
+                if model._profiler is not None:
+                    model._profiler.merge(outcome["profile"])
+                for name, count in outcome["likelihood_checks"].items():
+                    model.likelihood_checks_[name] += count
+                yield r, outcome["results"]
+                if outcome["stop_fit"]:
+                    model._stop_fit = True
+                    for pending in futures[r + 1 :]:
+                        pending.cancel()
+                    break
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
@@ -0,0 +1,177 @@
+"""
+Opt-in profiling of the phases of the EM algorithm.
+
+The update methods of the models are decorated with `profiled`. Unless the model is fitted with
+`profile=True`, the decorator only looks up the profiler of the model and calls the method. When
+profiling, the number of calls and the wall time of every phase are accumulated, together with
+the peak of the memory traced by tracemalloc if `profile_memory=True`.
+
+The phases nest: `update_em` covers a whole EM iteration and the times of the inner phases are
+also included in it.
+"""
+
+import contextlib
+import dataclasses
+import functools
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+@dataclasses.dataclass
+class PhaseStats:
+    """
+    Statistics of a phase of the EM algorithm.
+
+    Attributes
+    ----------
+    calls : int
+            Number of calls.
+    time : float
+           Total wall time, in seconds.
+    peak_memory : int, optional
+                  Largest increase of the traced memory during a call, in bytes. None if the
+                  memory is not traced.
+    """
+
+    calls: int = 0
+    time: float = 0.0
+    peak_memory: Optional[int] = None
+
+    def merge(self, other: "PhaseStats") -> None:
+        """
+        Add the statistics of another profile of the same phase.
+        """
+        self.calls += other.calls
+        self.time += other.time
+        if other.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, other.peak_memory)
+
+
+class PhaseProfiler:
+    """
+    Accumulate the number of calls, the wall time and optionally the peak traced memory of the
+    phases of a fit.
+
+    Parameters
+    ----------
+    trace_memory : bool
+                   If True, trace the memory allocations with tracemalloc, which is started if it
+                   is not already tracing. Tracing slows down the fit noticeably.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.phases: Dict[str, PhaseStats] = {}
+        # Traced memory at the start and peak so far of the phases being run
+        self._stack: List[List[int]] = []
+        self._started_tracing = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Profile the block as a call of the phase `name`.
+        """
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is reset for the inner phase, so the enclosing phases keep the one so far
+            self._fold_peak(peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, current])
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, PhaseStats())
+            stats.calls += 1
+            stats.time += time.perf_counter() - start
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                start_memory, peak_so_far = self._stack.pop()
+                peak = max(peak, peak_so_far)
+                self._fold_peak(peak)
+                stats.peak_memory = max(stats.peak_memory or 0, peak - start_memory)
+
+    def _fold_peak(self, peak: int) -> None:
+        for frame in self._stack:
+            frame[1] = max(frame[1], peak)
+
+    def stop(self) -> None:
+        """
+        Stop tracing the memory, if the profiler started it.
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def merge(self, other: "PhaseProfiler") -> None:
+        """
+        Add the phases of another profiler, e.g. of a realization run in another process.
+        """
+        for name, stats in other.phases.items():
+            self.phases.setdefault(name, PhaseStats()).merge(stats)
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the statistics of the phases, sorted by decreasing total time.
+
+        Returns
+        -------
+        profile : dict
+                  For every phase, the number of calls, the total and mean wall time in seconds
+                  and, if the memory is traced, the peak traced memory in MB.
+        """
+        profile = {}
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1].time):
+            profile[name] = {
+                "calls": stats.calls,
+                "time": stats.time,
+                "mean_time": stats.time / stats.calls,
+            }
+            if stats.peak_memory is not None:
+                profile[name]["peak_memory_mb"] = stats.peak_memory / 2**20
+        return profile
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """
+    Decorate a method of a model as a phase of the EM algorithm.
+
+    Parameters
+    ----------
+    name : str, optional
+           Name of the phase. By default, the name of the method without the leading underscore.
+
+    Returns
+    -------
+    decorator : callable
+                Decorator of the method.
+    """
+
+    def decorator(method: Callable) -> Callable:
+        phase = name or method.__name__.lstrip("_")
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = getattr(self, "_profiler", None)
+            if profiler is None:
+                return method(self, *args, **kwargs)
+            with profiler.phase(phase):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def save_profile(profile: Dict[str, Dict[str, Any]], path: str) -> None:
+    """
+    Save the profile of a fit to a JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump(profile, fp, indent=2)
@@ -0,0 +1,131 @@
+"""
+Adaptive schedule of the log-likelihood checks of the convergence.
+
+With the fixed schedule, the log-likelihood is computed every `CHECK_INTERVAL_` iterations and the
+realization converges after `decision + 1` consecutive checks whose change is smaller than the
+tolerance. The adaptive schedule keeps the same criterion, expressed as a number of stable
+iterations: a check covering `gap` iterations is stable if the change of the log-likelihood, scaled
+to `CHECK_INTERVAL_` iterations, is smaller than the tolerance, and it adds `gap` stable iterations.
+
+The interval to the next check follows a cost model:
+
+- the likelihood is computed at most as often as keeps its time below `CHECK_OVERHEAD_` of the time
+  of the EM steps, and never less often than every `MAX_CHECK_INTERVAL_` iterations;
+- while the recent slope of the log-likelihood is above the tolerance, the checks are at least
+  `CHECK_INTERVAL_` iterations apart, and they are postponed as long as the memberships still move
+  by more than `PRECHECK_DELTA_` in an iteration;
+- once the slope is below the tolerance, the next check is placed no later than the iteration at
+  which the realization would converge, so the convergence is detected without overshooting.
+"""
+
+import math
+from typing import Dict
+
+from .constants import CHECK_INTERVAL_, CHECK_OVERHEAD_, MAX_CHECK_INTERVAL_, PRECHECK_DELTA_
+
+# Weight of the last measure in the running averages of the times
+_SMOOTHING = 0.2
+# Parameters of the pre-check, as the memberships have the same scale in all the models
+_PRECHECK_PARAMETERS = ("u", "v")
+
+
+class LikelihoodSchedule:
+    """
+    Schedule of the log-likelihood checks of a realization.
+
+    Parameters
+    ----------
+    convergence_tol : float
+                      Tolerance on the change of the log-likelihood over `CHECK_INTERVAL_`
+                      iterations.
+    decision : int
+               Convergence parameter of the fixed schedule.
+    """
+
+    def __init__(self, convergence_tol: float, decision: int):
+        self.convergence_tol = convergence_tol
+        self.stable_iterations = (decision + 1) * CHECK_INTERVAL_
+        self.step_time = 0.0
+        self.loglik_time = 0.0
+        self.max_delta = math.inf
+        self.last_check = 0
+        self.next_check = 0
+        self.evaluations = 0
+
+    def record_step(self, seconds: float, deltas: Dict[str, float]) -> None:
+        """
+        Record the wall time and the maximum changes of the parameters of an EM step.
+        """
+        self.step_time = _average(self.step_time, seconds)
+        self.max_delta = max(deltas.get(name, 0.0) for name in _PRECHECK_PARAMETERS)
+
+    def due(self, it: int) -> bool:
+        """
+        Return whether the log-likelihood has to be computed at iteration `it`.
+        """
+        if self.evaluations == 0 or it - self.last_check >= MAX_CHECK_INTERVAL_:
+            return True
+        return it >= self.next_check and self.max_delta <= PRECHECK_DELTA_
+
+    def record_check(self, it: int, change: float, seconds: float, coincide: int) -> int:
+        """
+        Record a check of the log-likelihood and schedule the next one.
+
+        Parameters
+        ----------
+        it : int
+             Iteration of the check.
+        change : float
+                 Change of the log-likelihood since the previous check.
+        seconds : float
+                  Wall time of the computation of the log-likelihood.
+        coincide : int
+                   Number of consecutive stable iterations before the check.
+
+        Returns
+        -------
+        coincide : int
+                   Updated number of consecutive stable iterations.
+        """
+        gap = max(it - self.last_check, 1)
+        first = self.evaluations == 0
+        self.evaluations += 1
+        self.loglik_time = _average(self.loglik_time, seconds)
+        self.last_check = it
+
+        # The first change is from the initial value of the log-likelihood
+        stable = not first and abs(change) * CHECK_INTERVAL_ / gap < self.convergence_tol
+        coincide = coincide + gap if stable else 0
+
+        # Interval at which the likelihood takes CHECK_OVERHEAD_ of the time of the EM steps
+        cost_interval = math.ceil(self.loglik_time / (CHECK_OVERHEAD_ * max(self.step_time, 1e-9)))
+        interval = max(cost_interval, CHECK_INTERVAL_)
+        if stable:
+            interval = min(interval, self.stable_iterations - coincide)
+        self.next_check = it + min(max(interval, 1), MAX_CHECK_INTERVAL_)
+
+        return coincide
+
+    def stale(self, it: int) -> bool:
+        """
+        Return whether the log-likelihood was last computed before the last of `it` iterations.
+        """
+        return self.last_check < it - 1
+
+    def converged(self, coincide: int) -> bool:
+        """
+        Return whether the number of consecutive stable iterations reaches the convergence.
+        """
+        return coincide >= self.stable_iterations
+
+    def fixed_evaluations(self, n_iterations: int) -> int:
+        """
+        Return the number of likelihood evaluations of the fixed schedule over `n_iterations`
+        iterations, which can be lower than `evaluations` when the checks are close to the
+        convergence.
+        """
+        return math.ceil(n_iterations / CHECK_INTERVAL_)
+
+
+def _average(mean: float, value: float) -> float:
+    return value if mean == 0.0 else (1 - _SMOOTHING) * mean + _SMOOTHING * value
@@ -3,14 +3,13 @@ This module contains the ACDCrossValidation class, which is used to perform cros
 """
 
 import logging
-import pickle
 
 import numpy as np
 
-from pgm.input.loader import import_data
+from pgm.input.loader import graph_nodes, import_data
 from pgm.model.acd import AnomalyDetection
 from pgm.model_selection.cross_validation import CrossValidation
-from pgm.model_selection.masking import extract_mask_kfold
+from pgm.model_selection.masking import extract_mask_kfold, save_mask
 from pgm.output.evaluate import (
     calculate_AUC, calculate_expectation_acd, calculate_Q_dense, lambda0_full)
 
@@ -20,6 +19,11 @@ class ACDCrossValidation(CrossValidation):
     Class for cross-validation of the ACD algorithm.
     """
 
+    # The folds are evaluated on every entry of the held-out set
+    supports_auc_samples = False
+    # The masks are extracted without hashing the coordinates of the entries
+    mask_schemes = ("shuffle",)
+
     def __init__(self, algorithm, parameters, input_cv_params, numerical_parameters=None):
         """
         Constructor for the ACDCrossValidation class.
@@ -42,12 +46,11 @@ class ACDCrossValidation(CrossValidation):
         # If the out_mask attribute is set, save the mask to a file
         if self.out_mask:
             # Construct the output file path for the mask
-            outmask = self.out_folder + "mask_f" + str(fold) + "_" + self.adj + ".pkl"
+            outmask = self.out_folder + "mask_f" + str(fold) + "_" + self.adj + ".npz"
             logging.debug("Mask saved in: %s", outmask)
 
-            # Save the mask to a pickle file
-            with open(outmask, "wb") as f:
-                pickle.dump(np.where(mask > 0), f)
+            # Save the coordinates of the held-out entries
+            save_mask(outmask, mask)
 
         # Return the mask
         return mask
@@ -60,9 +63,10 @@ class ACDCrossValidation(CrossValidation):
             alter=self.alter,
             force_dense=True,
             header=0,
+            input_cache=self.input_cache,
         )
         # Get the nodes
-        self.nodes = self.A[0].nodes()
+        self.nodes = graph_nodes(self.A)
 
     def prepare_and_run(self, mask):
         # Create a copy of the adjacency matrix B to use for training
@@ -0,0 +1,129 @@
+"""
+Content-addressed cache of the results of the cross-validation tasks.
+
+Each task, i.e. one fold of one grid point, is identified by a hash of the algorithm, of the data,
+of the parameters, of the fold and of the random seed. Its comparison dictionary and the parameters
+fitted on the fold are stored in a pickle file named after that hash, so a sweep that is
+interrupted can be resumed by skipping the tasks already in the cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import pickle
+from typing import Any, Dict, Optional
+
+import numpy as np
+from sparse import COO
+
+
+def dataset_hash(*arrays: Any) -> str:
+    """
+    Return a hash of the content of the data arrays.
+
+    Parameters
+    ----------
+    arrays : ndarray
+             Data used by the cross-validation, e.g. the adjacency tensor and the design matrix.
+
+    Returns
+    -------
+    digest : str
+             Hexadecimal SHA-256 digest of the shapes, types and values of the arrays.
+    """
+    sha = hashlib.sha256()
+    for array in arrays:
+        if isinstance(array, COO):
+            # A sparse tensor is hashed through its shape, coordinates and values
+            sha.update(str(("COO", array.shape)).encode())
+            sha.update(np.ascontiguousarray(array.coords).tobytes())
+            array = array.data
+        array = np.ascontiguousarray(array)
+        sha.update(str((array.shape, array.dtype.str)).encode())
+        sha.update(array.tobytes())
+    return sha.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache of the results of the cross-validation tasks, stored in a folder.
+
+    Parameters
+    ----------
+    folder : str
+             Folder where the results are stored. It is created if it does not exist.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(**fields: Any) -> str:
+        """
+        Return the key of a task.
+
+        Parameters
+        ----------
+        fields : Any
+                 Values identifying the task, e.g. algorithm, dataset hash, parameters, fold
+                 and random seed.
+
+        Returns
+        -------
+        key : str
+              Hexadecimal SHA-256 digest of the fields.
+        """
+        content = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / f"{key}.pkl"
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached entry of a task, or None if the task has not been completed.
+
+        Parameters
+        ----------
+        key : str
+              Key of the task.
+
+        Returns
+        -------
+        entry : dict or None
+                Dictionary with the `comparison` dictionary and the fitted `parameters`.
+        """
+        path = self._path(key)
+        if not path.is_file():
+            return None
+        try:
+            with path.open("rb") as f:
+                return pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            logging.warning("Ignoring the corrupted cache entry %s", path)
+            return None
+
+    def store(self, key: str, comparison: Dict[str, Any], parameters: Any) -> None:
+        """
+        Store the results of a task.
+
+        The entry is written to a temporary file and then renamed, so an interrupted run never
+        leaves a partial entry behind.
+
+        Parameters
+        ----------
+        key : str
+              Key of the task.
+        comparison : dict
+                     Comparison dictionary of the task.
+        parameters : Any
+                     Parameters fitted on the fold, as returned by the fit method.
+        """
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp_path.open("wb") as f:
+            pickle.dump({"comparison": comparison, "parameters": parameters}, f)
+        os.replace(tmp_path, path)
@@ -12,31 +12,64 @@ from itertools import product
 import logging
 import os
 from pathlib import Path
-import pickle
 import time
 
 import numpy as np
+from sparse import COO
 
-from pgm.input.loader import import_data
-from pgm.model_selection.masking import extract_mask_kfold, shuffle_indices_all_matrix
+from pgm.input.loader import graph_nodes, import_data
+from pgm.input.preprocessing import build_sparse_B_from_coords
+from pgm.model_selection.cache import dataset_hash
+from pgm.model_selection.masking import (
+    extract_mask_kfold, HashedFoldMask, save_mask, shuffle_indices_all_matrix)
 from pgm.output.evaluate import (
-    calculate_AUC, calculate_conditional_expectation, calculate_expectation)
-from pgm.output.likelihood import calculate_opt_func
+    calculate_AUC, calculate_AUC_sampled, calculate_conditional_expectation,
+    calculate_conditional_expectation_at, calculate_expectation, calculate_expectation_at,
+    sample_heldout_pairs)
+from pgm.output.likelihood import calculate_opt_func, PSloglikelihood_sampled
 
 # TODO: optimize for big matrices (so when the input would be done with force_dense=False)
 
 
 class CrossValidation(ABC):
+    # Cache used to skip the folds completed by a previous run, set when resuming a sweep
+    result_cache = None
+    # Folder of the cache of the preprocessed input tensors, set through the cv_parameters
+    input_cache = None
+    # Number of zero entries sampled to evaluate each fold, set through the cv_parameters. If
+    # None, every entry of the adjacency tensor is scored.
+    auc_samples = None
+    # Confidence level of the intervals of the sampled AUCs
+    auc_confidence = 0.95
+    # Whether the algorithm can be evaluated on a sample of the zero entries
+    supports_auc_samples = True
+    # Assignment of the entries to the folds, set through the cv_parameters: "shuffle" shuffles
+    # all the entries, "hash" hashes their coordinates and never materializes them
+    mask_scheme = "shuffle"
+    # Mask schemes implemented by the extraction of the masks of the algorithm
+    mask_schemes = ("shuffle", "hash")
+
     def __init__(
         self, algorithm, model_parameters, cv_parameters, numerical_parameters=None
     ):
         self.algorithm = algorithm
+        # Parameters of the grid point, before they are modified fold by fold
+        self.task_parameters = {**model_parameters, **numerical_parameters}
         for key, value in model_parameters.items():
             setattr(self, key, value)
         for key, value in cv_parameters.items():
             setattr(self, key, value)
         for key, value in numerical_parameters.items():
             setattr(self, key, value)
+        if self.auc_samples is not None and not self.supports_auc_samples:
+            raise ValueError(
+                f"auc_samples is not supported by the cross-validation of {algorithm}"
+            )
+        if self.mask_scheme not in self.mask_schemes:
+            raise ValueError(
+                f"mask_scheme {self.mask_scheme!r} is not supported by the cross-validation of "
+                f"{algorithm}, use one of {self.mask_schemes}"
+            )
 
     def prepare_output_directory(self):
         if not os.path.exists(self.out_folder):
@@ -52,17 +85,40 @@ class CrossValidation(ABC):
         """
         Auxiliary method to extract the mask for the current fold using k-fold cross-validation.
         """
-        mask = extract_mask_kfold(self.indices, self.N, fold=fold, NFold=self.NFold)
+        if self.mask_scheme == "hash":
+            mask = HashedFoldMask(self.B.shape, fold, self.NFold, self.rseed)
+            if self.auc_samples is None:
+                # The exact evaluation scores every entry
+                mask = mask.to_dense()
+        else:
+            mask = extract_mask_kfold(self.indices, self.N, fold=fold, NFold=self.NFold)
 
         if self.out_mask:
-            outmask = self.out_folder + "mask_f" + str(fold) + "_" + self.adj + ".pkl"
+            outmask = self.out_folder + "mask_f" + str(fold) + "_" + self.adj + ".npz"
             logging.debug("Mask saved in: %s", outmask)
-
-            with open(outmask, "wb") as f:
-                pickle.dump(np.where(mask > 0), f)
+            save_mask(outmask, mask)
 
         return mask
 
+    def _training_inputs(self, mask):
+        """
+        Return the adjacency tensor where the entries of the held-out set are set to zero, with
+        the transposed tensor and the values of the entries A[j, i] to pass to the fit.
+        """
+        if isinstance(mask, HashedFoldMask):
+            B_train = mask.remove_from(self.B)
+        else:
+            B_train = self.B.copy()
+            B_train[mask > 0] = 0
+        if not isinstance(B_train, COO):
+            return B_train, self.B_T, self.data_T_vals
+
+        # The transposed tensor of the sparse training data is built from its entries
+        B_train, B_T, data_T_vals, _ = build_sparse_B_from_coords(
+            B_train.coords, B_train.data, B_train.shape, calculate_reciprocity=True
+        )
+        return B_train, B_T, data_T_vals
+
     @staticmethod
     def define_grid(**kwargs):
         """
@@ -92,16 +148,18 @@ class CrossValidation(ABC):
         """
         Auxiliary method to load data from the input folder.
         """
-        # Load data
+        # Load data, keeping it sparse when no step of the cross-validation needs it dense
+        sparse_folds = self.mask_scheme == "hash" and self.auc_samples is not None
         self.A, self.B, self.B_T, self.data_T_vals = import_data(
             self.in_folder + self.adj,
             ego=self.ego,
             alter=self.alter,
-            force_dense=True,
+            force_dense=not sparse_folds,
             header=0,
+            input_cache=self.input_cache,
         )
         # Get the nodes
-        self.nodes = self.A[0].nodes()
+        self.nodes = graph_nodes(self.A)
 
     @abstractmethod
     def prepare_and_run(self):
@@ -126,6 +184,12 @@ class CrossValidation(ABC):
             "final_it": algorithm_object.final_it,
         }
 
+        if self.auc_samples is not None:
+            comparison.update(
+                self._calculate_sampled_performance(u, v, w, eta, mask, fold)
+            )
+            return comparison
+
         # Calculate the expected matrix M using the parameters u, v, w, and eta
         M = calculate_expectation(u, v, w, eta=eta)
 
@@ -157,6 +221,45 @@ class CrossValidation(ABC):
         # Store the comparison list in the instance variable
         return comparison
 
+    def _calculate_sampled_performance(self, u, v, w, eta, mask, fold):
+        """
+        Evaluate a fold on the positive entries and on a uniform sample of `auc_samples` zero
+        entries of the training and of the test set, computing the expectations only at those
+        entries. The AUCs are reported with their confidence intervals, and the pseudo
+        log-likelihood of the test set is estimated from the same sample.
+        """
+        rng = np.random.default_rng([self.rseed, fold])
+        train = ~mask if isinstance(mask, HashedFoldMask) else np.logical_not(mask)
+        results = {}
+        for suffix, selected in (("train", train), ("test", mask)):
+            subs_pos, subs_neg, n_neg = sample_heldout_pairs(
+                self.B, selected, self.auc_samples, rng
+            )
+            for name, expectation in (
+                ("auc", lambda subs: calculate_expectation_at(subs, u, v, w, eta)),
+                (
+                    "auc_cond",
+                    lambda subs: calculate_conditional_expectation_at(
+                        subs, self.B, u, v, w, eta
+                    ),
+                ),
+            ):
+                auc, low, high = calculate_AUC_sampled(
+                    expectation(subs_pos),
+                    expectation(subs_neg),
+                    confidence=self.auc_confidence,
+                )
+                results[f"{name}_{suffix}"] = auc
+                results[f"{name}_{suffix}_low"] = low
+                results[f"{name}_{suffix}_high"] = high
+
+            if suffix == "test":
+                results["opt_func_train"] = PSloglikelihood_sampled(
+                    self.B, u, v, w, eta, subs_pos, subs_neg, n_neg
+                )
+
+        return results
+
     def save_results(self):
         # Check if the output file exists; if not, write the header
         output_path = Path(self.out_file)
@@ -176,9 +279,87 @@ class CrossValidation(ABC):
             # Flush the output buffer to ensure all data is written to the file
             outfile.flush()
 
-    def run_single_iteration(self):
+    def _data_key(self):
         """
-        Run the cross-validation procedure.
+        Return the key that identifies the data loaded by `load_data`.
+        """
+        return self.algorithm, self.in_folder, self.adj
+
+    def _load_data_cached(self, cache=None):
+        """
+        Load the data, reusing the copy stored in `cache` by a previous grid point.
+        """
+        if cache is None:
+            self.load_data()
+            return
+        key = ("data",) + self._data_key()
+        if key not in cache:
+            before = dict(vars(self))
+            self.load_data()
+            cache[key] = {
+                name: value
+                for name, value in vars(self).items()
+                if name not in before or before[name] is not value
+            }
+        self.__dict__.update(cache[key])
+
+    def dataset_hash(self):
+        """
+        Return a hash of the data used by the cross-validation.
+        """
+        return dataset_hash(self.B)
+
+    def _dataset_hash_cached(self, cache=None):
+        """
+        Return the hash of the data, reusing the one stored in `cache` by a previous grid point.
+        """
+        if cache is None:
+            return self.dataset_hash()
+        key = ("hash",) + self._data_key()
+        if key not in cache:
+            cache[key] = self.dataset_hash()
+        return cache[key]
+
+    def task_key(self, fold, cache=None):
+        """
+        Return the key of the result of a fold in the result cache.
+        """
+        fields = {}
+        if self.auc_samples is not None:
+            # The sampled evaluation does not give the results of the exact one
+            fields.update(auc_samples=self.auc_samples, auc_confidence=self.auc_confidence)
+        if self.mask_scheme != "shuffle":
+            fields.update(mask_scheme=self.mask_scheme)
+        return self.result_cache.key(
+            algorithm=self.algorithm,
+            dataset=self._dataset_hash_cached(cache),
+            parameters=self.task_parameters,
+            NFold=getattr(self, "NFold", None),
+            fold=fold,
+            rseed=getattr(self, "rseed", None),
+            **fields,
+        )
+
+    def _extract_mask_cached(self, fold, cache=None):
+        """
+        Extract the mask of a fold, reusing the copy stored in `cache` by a previous grid point.
+        """
+        if cache is None:
+            return self.extract_mask(fold)
+        key = ("mask",) + self._data_key() + (self.rseed, self.NFold, fold)
+        if key not in cache:
+            cache[key] = self.extract_mask(fold)
+        return cache[key]
+
+    def prepare_iteration(self, cache=None):
+        """
+        Prepare the cross-validation of the current grid point: random seed, output directory,
+        data and shuffled indices of the folds.
+
+        Parameters
+        ----------
+        cache : dict, optional
+                Data and masks shared by the grid points run in the same process.
         """
         # Set up logging
         logging.basicConfig(level=logging.DEBUG)
@@ -190,9 +371,6 @@ class CrossValidation(ABC):
         # Set up output directory
         self.prepare_output_directory()
 
-        # Prepare list to store results
-        self.comparison = []
-
         # Prepare parameters to load data
         adjacency = self.prepare_file_name()
 
@@ -202,37 +380,91 @@ class CrossValidation(ABC):
             logging.info("Results will be saved in: %s" % self.out_file)
 
         # Import data
-        self.load_data()
-
-        logging.info("Starting the cross-validation procedure.")
-        time_start = time.time()
+        self._load_data_cached(cache)
 
         # Prepare indices for cross-validation
         self.L = self.B.shape[0]
         self.N = self.B.shape[-1]
-        self.indices = shuffle_indices_all_matrix(self.N, self.L, self.rseed)
+        if self.mask_scheme == "hash":
+            # The folds are computed from the coordinates of the entries
+            self.indices = None
+        else:
+            self.indices = shuffle_indices_all_matrix(self.N, self.L, self.rseed)
 
-        # Cross-validation loop
-        for fold in range(self.NFold):
-            logging.info("\nFOLD %s" % fold)
+    def folds(self):
+        """
+        Return the folds of the current grid point.
+        """
+        return range(self.NFold)
 
-            self.parameters["end_file"] = (
-                self.end_file + "_" + str(fold) + "K" + str(self.parameters["K"])
-            )
-            # Extract mask for the current fold
-            mask = self.extract_mask(fold)
+    def run_fold(self, fold, cache=None):
+        """
+        Run the algorithm on one fold and return its comparison dictionary.
+
+        If a result cache is set, the result of a fold completed by a previous run is loaded
+        from it instead, and the result of a new fold is stored in it.
+
+        Parameters
+        ----------
+        fold : int
+               Index of the fold.
+        cache : dict, optional
+                Data and masks shared by the grid points run in the same process.
+        """
+        if self.result_cache is None:
+            return self._run_fold(fold, cache)[0]
+
+        key = self.task_key(fold, cache)
+        entry = self.result_cache.load(key)
+        if entry is not None:
+            logging.info("Fold %s loaded from the result cache.", fold)
+            return entry["comparison"]
+
+        comparison, outputs = self._run_fold(fold, cache)
+        self.result_cache.store(key, comparison, outputs)
+        return comparison
+
+    def _run_fold(self, fold, cache=None):
+        """
+        Run the algorithm on one fold and return its comparison dictionary and fitted parameters.
+        """
+        logging.info("\nFOLD %s" % fold)
+
+        self.parameters["end_file"] = (
+            self.end_file + "_" + str(fold) + "K" + str(self.parameters["K"])
+        )
+        # Extract mask for the current fold
+        mask = self._extract_mask_cached(fold, cache)
+
+        # Prepare and run the algorithm
+        tic = time.time()
+        outputs, algorithm_object = self.prepare_and_run(mask)
+
+        # Output performance results
+        comparison = self.calculate_performance_and_prepare_comparison(
+            outputs, mask, fold, algorithm_object
+        )
+
+        logging.info("Time elapsed: %s seconds." % np.round(time.time() - tic, 2))
+
+        return comparison, outputs
 
-            # Prepare and run the algorithm
-            tic = time.time()
-            outputs, algorithm_object = self.prepare_and_run(mask)
+    def run_single_iteration(self):
+        """
+        Run the cross-validation procedure.
+        """
+        # Prepare the data and the folds
+        self.prepare_iteration()
 
-            # Output performance results
-            self.comparison.append(self.calculate_performance_and_prepare_comparison(
-                outputs, mask, fold, algorithm_object
-            ))
+        # Prepare list to store results
+        self.comparison = []
 
-            logging.info("Time elapsed: %s seconds." % np.round(time.time() - tic, 2))
+        logging.info("Starting the cross-validation procedure.")
+        time_start = time.time()
 
+        # Cross-validation loop
+        for fold in self.folds():
+            self.comparison.append(self.run_fold(fold))
 
         logging.info(
             "\nTime elapsed: %s seconds." % np.round(time.time() - time_start, 2)
@@ -8,7 +8,7 @@ import time
 
 import numpy as np
 
-from pgm.input.loader import import_data
+from pgm.input.loader import graph_nodes, import_data
 from pgm.model.dyncrep import DynCRep
 from pgm.model_selection.cross_validation import CrossValidation
 from pgm.output.evaluate import calculate_AUC, calculate_conditional_expectation_dyncrep
@@ -24,6 +24,11 @@ class DynCRepCrossValidation(CrossValidation):
     - Calculate performance measures in the hidden set (AUC).
     """
 
+    # The folds are evaluated on every entry of the held-out set
+    supports_auc_samples = False
+    # The masks are extracted without hashing the coordinates of the entries
+    mask_schemes = ("shuffle",)
+
     def __init__(self, algorithm, parameters, input_cv_params, numerical_parameters=None):
         """
         Constructor for the DynCRepCrossValidation class.
@@ -51,9 +56,10 @@ class DynCRepCrossValidation(CrossValidation):
             self.in_folder + self.adj,
             sep=self.sep,
             header=0,
+            input_cache=self.input_cache,
         )
         # Get the nodes
-        self.nodes = self.A[0].nodes()
+        self.nodes = graph_nodes(self.A)
 
     def prepare_and_run(self, t):
         B_train = self.B[:t]  # use data up to time t-1 for training
@@ -115,9 +121,10 @@ class DynCRepCrossValidation(CrossValidation):
         # Return the comparison dictionary
         return comparison
 
-    def run_single_iteration(self):
+    def prepare_iteration(self, cache=None):
         """
-        Run the cross-validation procedure.
+        Prepare the cross-validation of the current grid point: output directory, data and
+        number of time steps.
         """
         # Set up logging
         logging.basicConfig(level=logging.DEBUG)
@@ -125,44 +132,43 @@ class DynCRepCrossValidation(CrossValidation):
         # Set up output directory
         self.prepare_output_directory()
 
-        # Prepare list to store results
-        self.comparison = []
-
         # Import data
-        self.load_data()
+        self._load_data_cached(cache)
 
         # Make sure T is not too large
         self.T = max(0, min(self.T, self.B.shape[0] - 1))
 
-        logging.info("Starting the cross-validation procedure.")
-        time_start = time.time()
-
-        # Cross-validation loop
-        for t in range(1, self.T + 1):  # skip first and last time step (last is hidden)
+    def folds(self):
+        """
+        Return the time steps used as folds, skipping the first and the hidden last one.
+        """
+        return range(1, self.T + 1)
 
-            if t == 1:
-                self.parameters["fix_beta"] = (
-                    True  # for the first time step beta cannot be inferred
-                )
-            else:
-                self.parameters["fix_beta"] = False
-            self.parameters["end_file"] = (
-                self.end_file + "_" + str(t) + "_" + str(self.K)
+    def _run_fold(self, fold, cache=None):
+        """
+        Run the algorithm up to time step `fold` and return its comparison dictionary and
+        fitted parameters.
+        """
+        t = fold
+        if t == 1:
+            self.parameters["fix_beta"] = (
+                True  # for the first time step beta cannot be inferred
             )
+        else:
+            self.parameters["fix_beta"] = False
+        self.parameters["end_file"] = (
+            self.end_file + "_" + str(t) + "_" + str(self.K)
+        )
 
-            # Prepare and run the algorithm
-            tic = time.time()
-            outputs, algorithm_object = self.prepare_and_run(t)
-
-            # Output performance results
-            self.comparison.append(self.calculate_performance_and_prepare_comparison(
-                outputs=outputs, mask=None, fold=t, algorithm_object=algorithm_object
-            ))
-
-            logging.info("Time elapsed: %s seconds.", np.round(time.time() - tic, 2))
+        # Prepare and run the algorithm
+        tic = time.time()
+        outputs, algorithm_object = self.prepare_and_run(t)
 
-        logging.info(
-            "\nTime elapsed: %s seconds.", np.round(time.time() - time_start, 2)
+        # Output performance results
+        comparison = self.calculate_performance_and_prepare_comparison(
+            outputs=outputs, mask=None, fold=t, algorithm_object=algorithm_object
         )
 
-        return self.comparison
+        logging.info("Time elapsed: %s seconds.", np.round(time.time() - tic, 2))
+
+        return comparison, outputs
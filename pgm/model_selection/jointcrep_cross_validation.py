@@ -34,18 +34,15 @@ class JointCRepCrossValidation(CrossValidation):
         return super()._load_data()
 
     def prepare_and_run(self, mask):
-        # Create a copy of the adjacency matrix B to use for training
-        B_train = self.B.copy()
-
-        # Apply the mask to the training data by setting masked elements to 0
-        B_train[mask > 0] = 0
+        # Create a copy of the adjacency matrix B where the held-out entries are set to 0
+        B_train, B_T, data_T_vals = self._training_inputs(mask)
 
         # Initialize the JointCRep algorithm object
         algorithm_object = JointCRep(**self.num_parameters)
 
         # Fit the JointCRep model to the training data and get the outputs
         outputs = algorithm_object.fit(
-            B_train, self.B_T, self.data_T_vals, nodes=self.nodes, **self.parameters
+            B_train, B_T, data_T_vals, nodes=self.nodes, **self.parameters
         )
 
         # Return the outputs and the algorithm object
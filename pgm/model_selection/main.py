@@ -2,21 +2,59 @@
 Main module for running cross-validation for different algorithms.
 """
 
+import argparse
 import logging
+import os
 
 import pandas as pd
+import yaml
 
 from pgm.model_selection.acd_cross_validation import ACDCrossValidation
+from pgm.model_selection.cache import ResultCache
 from pgm.model_selection.crep_cross_validation import CRepCrossValidation
 from pgm.model_selection.dyncrep_cross_validation import DynCRepCrossValidation
 from pgm.model_selection.jointcrep_cross_validation import JointCRepCrossValidation
 from pgm.model_selection.mtcov_cross_validation import MTCOVCrossValidation
 from pgm.model_selection.parameter_search import define_grid
+from pgm.model_selection.scheduler import run_tasks
 
 
 def cross_validation(
-    algorithm, model_parameters, cv_parameters, numerical_parameters=None
+    algorithm,
+    model_parameters,
+    cv_parameters,
+    numerical_parameters=None,
+    n_jobs=1,
+    resume=False,
+    cache_folder=None,
 ):
+    """
+    Run the cross-validation of an algorithm over a grid of parameters.
+
+    Parameters
+    ----------
+    algorithm : str
+                Name of the algorithm.
+    model_parameters : dict
+                       Model parameters; the values given as lists define the grid.
+    cv_parameters : dict
+                    Parameters of the cross-validation.
+    numerical_parameters : dict, optional
+                           Numerical parameters of the algorithm.
+    n_jobs : int
+             Number of processes running the folds. A value of -1 uses all the CPUs.
+    resume : bool
+             If True, the result of every fold is stored in a cache, and the folds already
+             completed by a previous run with the same data and parameters are skipped.
+    cache_folder : str, optional
+                   Folder of the result cache. By default, the `cv_cache` folder inside the
+                   output folder.
+
+    Returns
+    -------
+    results_df : DataFrame
+                 Results of every grid point and fold.
+    """
 
     if numerical_parameters is None:
         numerical_parameters = {}
@@ -45,21 +83,35 @@ def cross_validation(
     param_grid = define_grid(**model_parameters)
     logging.info("Parameter grid created with %d combinations", len(param_grid))
 
-    # Define list to store results
-    results = []
-
-    # Loop over the grid of parameters
-    for params in param_grid:
-        logging.info("Running cross-validation for parameters: %s", params)
-        # Instantiate the cross-validation class with the current parameters
-        cv = cv_classes[algorithm](
-            algorithm, params, cv_parameters, numerical_parameters
-        )
-        # Run the cross-validation and store the results
-        # The output of run_single_iteration is a list of dictionaries with the results for the
-        # different folds. Here, we add those lists to a results list.
-        results += cv.run_single_iteration()
-        logging.info("Completed cross-validation for parameters: %s", params)
+    # The output file is named after the adjacency file, in the output folder of the grid
+    cv = cv_classes[algorithm](
+        algorithm, param_grid[0], cv_parameters, numerical_parameters
+    )
+    out_file = None
+    if cv.out_folder:
+        adjacency = cv.prepare_file_name()
+        out_file = cv.out_folder + adjacency + "_cv.csv"
+
+    # Set up the cache of the fold results to resume an interrupted run
+    result_cache = None
+    if resume:
+        if cache_folder is None:
+            cache_folder = os.path.join(cv.out_folder or ".", "cv_cache")
+        result_cache = ResultCache(cache_folder)
+        logging.info("Resuming from the result cache in: %s", cache_folder)
+
+    # Run the folds of every grid point, streaming the results to the output file. The output
+    # of each fold is a dictionary with its results, in the order of the grid and of the folds.
+    results = run_tasks(
+        cv_classes[algorithm],
+        algorithm,
+        param_grid,
+        cv_parameters,
+        numerical_parameters,
+        n_jobs=n_jobs,
+        out_file=out_file,
+        result_cache=result_cache,
+    )
 
     # Transform the list of results into a DataFrame
     results_df = pd.DataFrame(results)
@@ -67,12 +119,77 @@ def cross_validation(
     logging.info("Completed cross-validation for algorithm: %s", algorithm)
 
     # If the output file is set, save the results to a CSV file
-    if cv.out_folder:
-        # Prepare the output directory
-        adjacency = cv.prepare_file_name()
-        out_file = cv.out_folder + adjacency + "_cv.csv"
+    if out_file:
         # Save the results to a CSV file
         results_df.to_csv(out_file, index=False)
         logging.info("Results saved in: %s", out_file)
 
     return results_df
+
+
+def main():
+    """
+    Command-line entry point of the cross-validation.
+
+    The configuration file is a YAML file with the `parameters` of the model (the values given as
+    lists define the grid), the `input_params` of the cross-validation and, optionally, the
+    `numerical_parameters` of the algorithm.
+    """
+    parser = argparse.ArgumentParser(
+        description="Script to run the cross-validation of the CRep, JointCRep, DynCRep, MTCOV "
+        "and ACD algorithms.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "algorithm",
+        choices=["CRep", "JointCRep", "MTCOV", "ACD", "DynCRep"],
+        help="Algorithm to cross-validate",
+    )
+    parser.add_argument(
+        "-c", "--config", type=str, required=True, help="Path to the configuration file"
+    )
+    parser.add_argument(
+        "--n_jobs",
+        type=int,
+        default=1,
+        help="Number of processes running the folds (-1 uses all the CPUs)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Store the result of every fold and skip the folds already completed",
+    )
+    parser.add_argument(
+        "--cache_folder",
+        type=str,
+        default=None,
+        help="Folder of the result cache (default: cv_cache in the output folder)",
+    )
+    parser.add_argument(
+        "--debug",
+        "-d",
+        dest="debug",
+        action="store_true",
+        default=False,
+        help="Enable debug mode",
+    )
+    args = parser.parse_args()
+
+    # Logging
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="*** [%(levelname)s][%(asctime)s][%(module)s] %(message)s",
+    )
+
+    with open(args.config, encoding="utf-8") as fp:
+        conf = yaml.safe_load(fp)
+
+    cross_validation(
+        args.algorithm,
+        conf["parameters"],
+        conf["input_params"],
+        conf.get("numerical_parameters"),
+        n_jobs=args.n_jobs,
+        resume=args.resume,
+        cache_folder=args.cache_folder,
+    )
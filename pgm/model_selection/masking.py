@@ -2,9 +2,13 @@
 This module provides functions for shuffling indices and extracting masks for selecting the held-out set in the adjacency tensor and design matrix.
 """
 
-from typing import List, Optional, Tuple
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
 
 import numpy as np
+from sparse import COO
+
+from pgm.input.tools import entries_at, hash_fold
 
 
 def shuffle_indices(N: int, L: int, rseed: int) -> List[np.ndarray]:
@@ -254,3 +258,219 @@ def shuffle_indices_all_matrix(N: int, L: int, rseed: int = 10) -> List[np.ndarr
 
     # Return the shuffled indices
     return indices
+
+
+class HashedFoldMask:
+    """
+    Held-out set of a fold defined by `hash_fold`.
+
+    The mask stores only the parameters of the split, so its memory does not depend on the size
+    of the adjacency tensor. It gives the fold membership of any entry, the non-zero entries of a
+    tensor in the held-out set and uniform samples of the held-out set; `to_dense` builds the
+    boolean mask of `extract_mask_kfold` for the code that needs it.
+
+    Parameters
+    ----------
+    shape : tuple
+            Shape (L, N, N) of the adjacency tensor.
+    fold : int
+           Current fold.
+    NFold : int
+            Number of total folds.
+    rseed : int
+            Random seed.
+    complement : bool
+                 If True, the mask selects the entries outside the fold, i.e. the training set.
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, int, int],
+        fold: int,
+        NFold: int,
+        rseed: int,
+        complement: bool = False,
+    ):
+        self.shape = tuple(int(s) for s in shape)
+        self.fold = int(fold)
+        self.NFold = int(NFold)
+        self.rseed = int(rseed)
+        self.complement = bool(complement)
+
+    def __invert__(self) -> "HashedFoldMask":
+        return HashedFoldMask(
+            self.shape, self.fold, self.NFold, self.rseed, not self.complement
+        )
+
+    @property
+    def fraction(self) -> float:
+        """
+        Expected fraction of the entries selected by the mask.
+        """
+        return 1.0 - 1.0 / self.NFold if self.complement else 1.0 / self.NFold
+
+    def contains(self, subs: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+        """
+        Return whether the entries with the given coordinates are selected by the mask.
+        """
+        inside = hash_fold(subs, self.shape[-1], self.rseed, self.NFold) == self.fold
+        return ~inside if self.complement else inside
+
+    def coordinates(self, data: Union[COO, np.ndarray]) -> Tuple[np.ndarray, ...]:
+        """
+        Return the coordinates of the non-zero entries of a tensor selected by the mask.
+        """
+        if isinstance(data, COO):
+            subs = tuple(np.asarray(c, dtype=np.int64) for c in data.coords[:, data.data != 0])
+        else:
+            subs = np.nonzero(data)
+        keep = self.contains(subs)
+        return tuple(s[keep] for s in subs)
+
+    def remove_from(self, data: Union[COO, np.ndarray]) -> Union[COO, np.ndarray]:
+        """
+        Return a copy of a tensor where the entries selected by the mask are set to zero.
+        """
+        if isinstance(data, COO):
+            keep = ~self.contains(tuple(data.coords))
+            return COO(data.coords[:, keep], data.data[keep], shape=data.shape)
+        data = data.copy()
+        data[self.coordinates(data)] = 0
+        return data
+
+    def sample(
+        self, n_samples: int, rng: Optional[np.random.Generator] = None
+    ) -> Tuple[np.ndarray, ...]:
+        """
+        Return the coordinates of a uniform sample, with replacement, of the entries selected by
+        the mask.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        chunks, n_found = [], 0
+        while n_found < n_samples:
+            size = int(2 * (n_samples - n_found) / self.fraction) + 1
+            subs = np.stack([rng.integers(0, dim, size=size) for dim in self.shape])
+            subs = subs[:, self.contains(tuple(subs))]
+            chunks.append(subs)
+            n_found += subs.shape[1]
+        return tuple(np.concatenate(chunks, axis=1)[:, :n_samples])
+
+    def sample_heldout_pairs(
+        self,
+        data: Union[COO, np.ndarray],
+        n_samples: int,
+        rng: Optional[np.random.Generator] = None,
+    ) -> Tuple[Tuple[np.ndarray, ...], Tuple[np.ndarray, ...], int]:
+        """
+        Return the positive entries of a tensor selected by the mask and a uniform sample, with
+        replacement, of its zero entries, as `sample_heldout_pairs` of `pgm.output.evaluate`.
+
+        The number of zero entries is estimated from the size of the mask. If it is at most
+        `n_samples`, the zero entries are enumerated one layer at a time and all returned.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        subs_pos = self.coordinates(data)
+        size = self.fraction * np.prod(self.shape)
+        n_neg = max(int(round(size)) - len(subs_pos[0]), 0)
+
+        if n_neg <= n_samples:
+            subs_neg = self._zeros(data)
+            return subs_pos, subs_neg, len(subs_neg[0])
+
+        accept_rate = n_neg / size
+        chunks, n_found = [], 0
+        while n_found < n_samples:
+            subs = self.sample(int(2 * (n_samples - n_found) / accept_rate) + 1, rng)
+            keep = entries_at(data, subs) == 0
+            chunks.append(np.stack(subs)[:, keep])
+            n_found += int(keep.sum())
+        return subs_pos, tuple(np.concatenate(chunks, axis=1)[:, :n_samples]), n_neg
+
+    def _zeros(self, data: Union[COO, np.ndarray]) -> Tuple[np.ndarray, ...]:
+        """
+        Return the coordinates of the zero entries of a tensor selected by the mask.
+        """
+        L, N, _ = self.shape
+        i, j = np.divmod(np.arange(N * N, dtype=np.int64), N)
+        chunks = []
+        for a in range(L):
+            subs = (np.full(N * N, a, dtype=np.int64), i, j)
+            subs = tuple(s[self.contains(subs)] for s in subs)
+            chunks.append(np.stack(subs)[:, entries_at(data, subs) == 0])
+        return tuple(np.concatenate(chunks, axis=1))
+
+    def to_dense(self) -> np.ndarray:
+        """
+        Return the boolean mask with the shape of the adjacency tensor.
+        """
+        L, N, _ = self.shape
+        i, j = np.divmod(np.arange(N * N, dtype=np.int64), N)
+        mask = np.zeros(self.shape, dtype=bool)
+        for a in range(L):
+            mask[a] = self.contains((np.full(N * N, a), i, j)).reshape(N, N)
+        return mask
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Save the parameters of the mask to a `.npz` file.
+        """
+        np.savez(
+            path,
+            scheme="hash",
+            shape=self.shape,
+            fold=self.fold,
+            NFold=self.NFold,
+            rseed=self.rseed,
+            complement=self.complement,
+        )
+
+
+def save_mask(path: Union[str, Path], mask: Union[np.ndarray, HashedFoldMask]) -> None:
+    """
+    Save a mask to a `.npz` file.
+
+    A hashed mask is saved as the parameters of the split, a dense mask as the coordinates of its
+    selected entries, compressed and with the smallest integer type that holds them.
+
+    Parameters
+    ----------
+    path : str or Path
+           Path of the file.
+    mask : ndarray or HashedFoldMask
+           Mask for selecting the held out set in the adjacency tensor.
+    """
+    if isinstance(mask, HashedFoldMask):
+        mask.save(path)
+        return
+    dtype = np.min_scalar_type(max(mask.shape))
+    np.savez_compressed(
+        path, scheme="coords", shape=mask.shape, coords=np.array(np.nonzero(mask), dtype=dtype)
+    )
+
+
+def load_mask(path: Union[str, Path]) -> Union[Tuple[np.ndarray, ...], HashedFoldMask]:
+    """
+    Load a mask saved by `save_mask`.
+
+    Parameters
+    ----------
+    path : str or Path
+           Path of the file.
+
+    Returns
+    -------
+    mask : tuple or HashedFoldMask
+           Hashed mask, or coordinates of the selected entries of a dense mask.
+    """
+    with np.load(path) as f:
+        if str(f["scheme"]) == "hash":
+            return HashedFoldMask(
+                tuple(f["shape"]),
+                int(f["fold"]),
+                int(f["NFold"]),
+                int(f["rseed"]),
+                complement=bool(f["complement"]),
+            )
+        return tuple(np.asarray(c, dtype=np.int64) for c in f["coords"])
@@ -4,14 +4,14 @@ algorithm.
 """
 
 import logging
-import pickle
 
 import numpy as np
 
 from pgm.input.loader import import_data_mtcov
 from pgm.model.mtcov import MTCOV
+from pgm.model_selection.cache import dataset_hash
 from pgm.model_selection.cross_validation import CrossValidation
-from pgm.model_selection.masking import extract_masks, shuffle_indicesG, shuffle_indicesX
+from pgm.model_selection.masking import extract_masks, save_mask, shuffle_indicesG, shuffle_indicesX
 from pgm.model_selection.metrics import covariates_accuracy
 from pgm.output.evaluate import calculate_AUC_mtcov
 from pgm.output.likelihood import loglikelihood
@@ -22,6 +22,11 @@ class MTCOVCrossValidation(CrossValidation):
     Class for cross-validation of the MTCOV algorithm.
     """
 
+    # The folds are evaluated on every entry of the held-out set
+    supports_auc_samples = False
+    # The masks are extracted without hashing the coordinates of the entries
+    mask_schemes = ("shuffle",)
+
     def __init__(self, algorithm, parameters, input_cv_params, numerical_parameters=None):
         """
         Constructor for the MTCOVCrossValidation class.
@@ -58,19 +63,24 @@ class MTCOVCrossValidation(CrossValidation):
 
         # If the out_mask attribute is set, save the masks to files
         if self.out_mask:
-            outmaskG = self.out_folder + "maskG_f" + str(fold) + "_" + self.adj + ".pkl"
-            outmaskX = self.out_folder + "maskX_f" + str(fold) + "_" + self.adj + ".pkl"
+            outmaskG = self.out_folder + "maskG_f" + str(fold) + "_" + self.adj + ".npz"
+            outmaskX = self.out_folder + "maskX_f" + str(fold) + "_" + self.adj + ".npz"
             logging.debug("Masks saved in: %s, %s", outmaskG, outmaskX)
 
-            # Save the masks to pickle files
-            with open(outmaskG, "wb") as f:
-                pickle.dump(np.where(maskG > 0), f)
-            with open(outmaskX, "wb") as f:
-                pickle.dump(np.where(maskX > 0), f)
+            # Save the coordinates of the held-out entries
+            save_mask(outmaskG, maskG)
+            save_mask(outmaskX, maskX)
 
         # Return the masks
         return maskG, maskX
 
+    def _data_key(self):
+        # The design matrix and the symmetrization of the network are part of the data
+        return super()._data_key() + (self.cov, self.parameters["undirected"])
+
+    def dataset_hash(self):
+        return dataset_hash(self.B, self.Xs)
+
     def load_data(self):
         # Load data
         self.A, self.B, self.X, self.nodes = import_data_mtcov(
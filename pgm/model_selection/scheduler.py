@@ -0,0 +1,243 @@
+"""
+Scheduler for the (grid point, fold) tasks of a cross-validation sweep.
+
+Every task fits the algorithm on one fold of one grid point. The tasks are run one after the other
+or on a pool of processes; in both cases the data and the masks are built once per process, and the
+results are returned, and streamed to the output file, in the order of the grid and of the folds.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import csv
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pgm.model_selection.cache import ResultCache
+
+# Cross-validation objects and cache of data and masks of the worker process
+_WORKER_CONTEXT: Dict[str, Any] = {}
+
+
+class ResultWriter:
+    """
+    Write the comparison dictionaries to a CSV file as soon as they are available.
+
+    The header is taken from the first row; the file is truncated when the writer is created.
+    """
+
+    def __init__(self, out_file: str):
+        self.out_file = Path(out_file)
+        self.fieldnames: Optional[List[str]] = None
+        self.out_file.unlink(missing_ok=True)
+
+    def write(self, comparison: Dict[str, Any]) -> None:
+        """
+        Append a row to the output file.
+
+        Parameters
+        ----------
+        comparison : dict
+                     Results of one task.
+        """
+        with self.out_file.open("a", newline="") as outfile:
+            if self.fieldnames is None:
+                self.fieldnames = list(comparison.keys())
+                wrtr = csv.DictWriter(outfile, self.fieldnames, extrasaction="ignore")
+                wrtr.writeheader()
+            else:
+                wrtr = csv.DictWriter(outfile, self.fieldnames, extrasaction="ignore")
+            wrtr.writerow(comparison)
+            outfile.flush()
+
+
+def _prepare(
+    cv_class: Callable,
+    algorithm: str,
+    params: Dict[str, Any],
+    cv_parameters: Dict[str, Any],
+    numerical_parameters: Dict[str, Any],
+    cache: Dict[Tuple, Any],
+    result_cache: Optional[ResultCache] = None,
+) -> Any:
+    """
+    Instantiate and prepare the cross-validation object of a grid point.
+    """
+    cv = cv_class(algorithm, dict(params), cv_parameters, numerical_parameters)
+    cv.result_cache = result_cache
+    cv.prepare_iteration(cache)
+    return cv
+
+
+def _init_worker(
+    cv_class: Callable,
+    algorithm: str,
+    cv_parameters: Dict[str, Any],
+    numerical_parameters: Dict[str, Any],
+    result_cache: Optional[ResultCache],
+) -> None:
+    """
+    Store the settings of the sweep in the worker process.
+    """
+    _WORKER_CONTEXT.clear()
+    _WORKER_CONTEXT.update(
+        cv_class=cv_class,
+        algorithm=algorithm,
+        cv_parameters=cv_parameters,
+        numerical_parameters=numerical_parameters,
+        result_cache=result_cache,
+        cvs={},
+        cache={},
+    )
+
+
+def _run_worker_task(index: int, params: Dict[str, Any], fold: int) -> Dict[str, Any]:
+    """
+    Run one fold of one grid point in the worker process.
+    """
+    cvs = _WORKER_CONTEXT["cvs"]
+    if index not in cvs:
+        cvs[index] = _prepare(
+            _WORKER_CONTEXT["cv_class"],
+            _WORKER_CONTEXT["algorithm"],
+            params,
+            _WORKER_CONTEXT["cv_parameters"],
+            _WORKER_CONTEXT["numerical_parameters"],
+            _WORKER_CONTEXT["cache"],
+            _WORKER_CONTEXT["result_cache"],
+        )
+    return cvs[index].run_fold(fold, _WORKER_CONTEXT["cache"])
+
+
+def _run_serial(
+    param_grid: List[Dict[str, Any]], prepare: Callable
+) -> Iterator[Tuple[Tuple[int, int], Dict[str, Any]]]:
+    """
+    Run the tasks in this process, one grid point after the other.
+    """
+    cache: Dict[Tuple, Any] = {}
+    for index, params in enumerate(param_grid):
+        cv = prepare(params, cache)
+        for fold in cv.folds():
+            yield (index, fold), cv.run_fold(fold, cache)
+
+
+def _run_parallel(
+    param_grid: List[Dict[str, Any]], prepare: Callable, n_jobs: int, initargs: tuple
+) -> Iterator[Tuple[Tuple[int, int], Dict[str, Any]]]:
+    """
+    Run the tasks on a pool of processes and yield their results in the order of the tasks.
+    """
+    # Prepare the grid points in this process, to enumerate their folds and to look up the
+    # tasks already in the result cache
+    cache: Dict[Tuple, Any] = {}
+    tasks: List[Tuple[int, int]] = []
+    done: Dict[int, Dict[str, Any]] = {}
+    for index, params in enumerate(param_grid):
+        cv = prepare(params, cache)
+        for fold in cv.folds():
+            if cv.result_cache is not None:
+                entry = cv.result_cache.load(cv.task_key(fold, cache))
+                if entry is not None:
+                    done[len(tasks)] = entry["comparison"]
+            tasks.append((index, fold))
+    cache.clear()
+    todo = [position for position in range(len(tasks)) if position not in done]
+    logging.info(
+        "Running %d cross-validation tasks on %d processes (%d found in the cache)",
+        len(todo),
+        n_jobs,
+        len(done),
+    )
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(n_jobs, len(todo))),
+        initializer=_init_worker,
+        initargs=initargs,
+    ) as executor:
+        futures = {}
+        for position in todo:
+            index, fold = tasks[position]
+            future = executor.submit(_run_worker_task, index, param_grid[index], fold)
+            futures[future] = position
+        pending = set(futures)
+        next_position = 0
+        while next_position < len(tasks):
+            # Release the results that complete the ordered prefix
+            while next_position in done:
+                yield tasks[next_position], done.pop(next_position)
+                next_position += 1
+            if pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done[futures[future]] = future.result()
+
+
+def run_tasks(
+    cv_class: Callable,
+    algorithm: str,
+    param_grid: List[Dict[str, Any]],
+    cv_parameters: Dict[str, Any],
+    numerical_parameters: Dict[str, Any],
+    n_jobs: int = 1,
+    out_file: Optional[str] = None,
+    result_cache: Optional[ResultCache] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run the cross-validation of every grid point and fold.
+
+    Parameters
+    ----------
+    cv_class : type
+               Cross-validation class of the algorithm.
+    algorithm : str
+                Name of the algorithm.
+    param_grid : list
+                 Grid of model parameters.
+    cv_parameters : dict
+                    Parameters of the cross-validation.
+    numerical_parameters : dict
+                           Numerical parameters of the algorithm.
+    n_jobs : int
+             Number of processes. A value of -1 uses all the CPUs.
+    out_file : str, optional
+               CSV file where the results are streamed.
+    result_cache : ResultCache, optional
+                   Cache of the task results; the tasks found in it are not run again.
+
+    Returns
+    -------
+    results : list
+              Comparison dictionaries, ordered by grid point and fold.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs < 1:
+        raise ValueError("The number of jobs must be a positive integer or -1.")
+
+    def prepare(params, cache):
+        return _prepare(
+            cv_class,
+            algorithm,
+            params,
+            cv_parameters,
+            numerical_parameters,
+            cache,
+            result_cache,
+        )
+
+    if n_jobs == 1:
+        stream = _run_serial(param_grid, prepare)
+    else:
+        initargs = (cv_class, algorithm, cv_parameters, numerical_parameters, result_cache)
+        stream = _run_parallel(param_grid, prepare, n_jobs, initargs)
+
+    writer = ResultWriter(out_file) if out_file else None
+    results = []
+    for (index, fold), comparison in stream:
+        logging.info("Completed fold %s for parameters: %s", fold, param_grid[index])
+        if writer is not None:
+            writer.write(comparison)
+        results.append(comparison)
+
+    return results
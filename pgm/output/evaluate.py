@@ -3,18 +3,77 @@ It provides essential functions for model assessment like AUC for link predictio
 and marginal expectations.
 """
 
-from typing import Optional, Tuple, Union
+from typing import Any, Optional, Tuple, Union
 
 import numpy as np
-from scipy.stats import poisson
+from scipy.stats import norm, poisson
 from sklearn import metrics
 from sparse import COO
 
-from ..input.tools import check_symmetric, transpose_ij, transpose_ij2, transpose_ij3
+from ..input.tools import (
+    check_symmetric, contract_uvw, entries_at, transpose_ij, transpose_ij2, transpose_ij3)
+
+
+def rank_auc(scores: np.ndarray, labels: np.ndarray) -> float:
+    """
+    Return the AUC of the scores given the binary labels, computed with the Mann-Whitney
+    rank-sum statistic.
+
+    The entries are sorted once and the tied scores get their average rank, so a tie between a
+    positive and a negative entry counts 1/2 as in the trapezoidal ROC curve.
+
+    Parameters
+    ----------
+    scores : ndarray
+             Predicted scores.
+    labels : ndarray
+             Labels of the entries; the entries greater than zero are the positive ones.
+
+    Returns
+    -------
+    AUC : float
+          AUC value; nan if all the entries belong to the same class.
+    """
+    scores = np.asarray(scores).ravel()
+    labels = np.asarray(labels).ravel() > 0
+    n = scores.size
+    n_pos = np.count_nonzero(labels)
+    n_neg = n - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return np.nan
+
+    order = np.argsort(scores, kind="mergesort")
+    sorted_scores = scores[order]
+
+    # Average rank (1-based) of each group of tied scores
+    starts = np.flatnonzero(np.r_[True, sorted_scores[1:] != sorted_scores[:-1]])
+    sizes = np.diff(np.r_[starts, n])
+    ranks = np.repeat(starts + (sizes + 1) / 2.0, sizes)
+
+    rank_sum = ranks[labels[order]].sum()
+    return float((rank_sum - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg))
+
+
+def _masked_entries(
+    M: np.ndarray, data: np.ndarray, mask: Optional[Union[np.ndarray, tuple]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the entries of two tensors selected by a mask.
+
+    The mask is either an array whose positive entries are selected or a tuple of coordinate
+    arrays, as returned by `np.where`.
+    """
+    if mask is None:
+        return M.ravel(), data.ravel()
+    if not isinstance(mask, tuple):
+        mask = mask > 0
+    return M[mask], data[mask]
 
 
 def calculate_AUC(
-    pred: np.ndarray, data0: np.ndarray, mask: Optional[np.ndarray] = None
+    pred: np.ndarray,
+    data0: np.ndarray,
+    mask: Optional[Union[np.ndarray, tuple]] = None,
 ) -> float:
     """
     Return the AUC of the link prediction. It represents the probability that a randomly chosen
@@ -27,29 +86,23 @@ def calculate_AUC(
            Inferred values.
     data0 : ndarray
             Given values.
-    mask : ndarray
-           Mask for selecting a subset of the adjacency tensor.
+    mask : ndarray or tuple
+           Mask for selecting a subset of the adjacency tensor, or tuple with the coordinates of
+           the selected entries.
 
     Returns
     -------
     AUC value.
     """
-    # The following line is needed to avoid a bug in sklearn
-    data = (data0 > 0).astype("int")
-
-    if mask is None:
-        fpr, tpr, _ = metrics.roc_curve(data.flatten(), pred.flatten())
-    else:
-        fpr, tpr, _ = metrics.roc_curve(data[mask > 0], pred[mask > 0])
+    return rank_auc(*_masked_entries(pred, data0, mask))
 
-    return metrics.auc(fpr, tpr)
 
 def calculate_AUC_mtcov(
     B: np.ndarray,
     u: np.ndarray,
     v: np.ndarray,
     w: np.ndarray,
-    mask: Optional[np.ndarray] = None,
+    mask: Optional[Union[np.ndarray, tuple]] = None,
 ) -> float:
     """
     Return the AUC of the link prediction. It represents the probability that a randomly chosen missing connection
@@ -66,8 +119,9 @@ def calculate_AUC_mtcov(
         Membership matrix (in-degree).
     w : ndarray
         Affinity tensor.
-    mask : ndarray
-           Mask for selecting a subset of the adjacency tensor.
+    mask : ndarray or tuple
+           Mask for selecting a subset of the adjacency tensor, or tuple with the coordinates of
+           the selected entries.
 
     Returns
     -------
@@ -77,18 +131,211 @@ def calculate_AUC_mtcov(
 
     M = expected_Aija_mtcov(u, v, w)
 
-    if mask is None:
-        R = list(zip(M.flatten(), B.flatten()))
-        Pos = B.sum()
+    return rank_auc(*_masked_entries(M, B, mask))
+
+
+def sample_heldout_pairs(
+    data: Union[COO, np.ndarray],
+    mask: Union[np.ndarray, Any],
+    n_samples: int,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[Tuple[np.ndarray, ...], Tuple[np.ndarray, ...], int]:
+    """
+    Return the positive entries selected by a mask and a uniform sample of its zero entries.
+
+    The zero entries are drawn with replacement by rejection sampling over the whole tensor, so
+    their number is fixed by `n_samples` rather than by the size of the mask. If the mask has at
+    most `n_samples` zero entries, they are all returned.
+
+    Parameters
+    ----------
+    data : ndarray or COO
+           Graph adjacency tensor.
+    mask : ndarray or HashedFoldMask
+           Mask for selecting a subset of the adjacency tensor. A mask that is never made
+           dense, such as the hashed folds of the cross-validation, samples its own entries
+           through its `sample_heldout_pairs` method.
+    n_samples : int
+                Number of zero entries to sample.
+    rng : Generator, optional
+          Random number generator.
+
+    Returns
+    -------
+    subs_pos : tuple
+               Coordinates of the positive entries selected by the mask.
+    subs_neg : tuple
+               Coordinates of the sampled zero entries.
+    n_neg : int
+            Number of zero entries selected by the mask.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    if hasattr(mask, "sample_heldout_pairs"):
+        return mask.sample_heldout_pairs(data, n_samples, rng)
+
+    selected = np.asarray(mask) > 0
+
+    if isinstance(data, COO):
+        coords = tuple(data.coords[:, (data.data > 0) & selected[tuple(data.coords)]])
+        subs_pos = tuple(np.asarray(c, dtype=np.int64) for c in coords)
     else:
-        R = list(zip(M[mask > 0], B[mask > 0]))
-        Pos = B[mask > 0].sum()
+        subs_pos = np.nonzero((np.asarray(data) > 0) & selected)
+    n_neg = int(np.count_nonzero(selected)) - len(subs_pos[0])
+
+    if n_neg <= n_samples:
+        zeros = selected.copy()
+        zeros[subs_pos] = False
+        return subs_pos, np.nonzero(zeros), n_neg
+
+    accept_rate = n_neg / selected.size
+    chunks, n_found = [], 0
+    while n_found < n_samples:
+        size = int(2 * (n_samples - n_found) / accept_rate) + 1
+        subs = tuple(rng.integers(0, dim, size=size) for dim in selected.shape)
+        keep = selected[subs] & (entries_at(data, subs) == 0)
+        chunks.append(np.stack(subs)[:, keep])
+        n_found += int(keep.sum())
+    subs_neg = tuple(np.concatenate(chunks, axis=1)[:, :n_samples])
+
+    return subs_pos, subs_neg, n_neg
+
+
+def calculate_expectation_at(
+    subs: Tuple[np.ndarray, ...], u: np.ndarray, v: np.ndarray, w: np.ndarray, eta: float
+) -> np.ndarray:
+    """
+    Compute the expectations m_{ij} of `calculate_expectation` only at the given coordinates.
+
+    Parameters
+    ----------
+    subs : tuple
+           Coordinates (layer, row, column) of the entries.
+    u : ndarray
+        Out-going membership matrix.
+    v : ndarray
+        In-coming membership matrix.
+    w : ndarray
+        Affinity tensor.
+    eta : float
+          Reciprocity coefficient.
+
+    Returns
+    -------
+    M : ndarray
+        Expectations m_{ij} of the entries.
+    """
+    assortative = w.ndim == 2
+    subs_T = (subs[0], subs[2], subs[1])
+    lambda0 = lambda0_nz(subs, u, v, w, assortative=assortative)
+    lambda0T = lambda0_nz(subs_T, u, v, w, assortative=assortative)
+
+    return (lambda0 + eta * lambda0T) / (1.0 - eta * eta)
+
+
+def calculate_conditional_expectation_at(
+    subs: Tuple[np.ndarray, ...],
+    B: Union[COO, np.ndarray],
+    u: np.ndarray,
+    v: np.ndarray,
+    w: np.ndarray,
+    eta: float,
+) -> np.ndarray:
+    """
+    Compute the conditional expectations of `calculate_conditional_expectation` only at the
+    given coordinates.
+
+    Parameters
+    ----------
+    subs : tuple
+           Coordinates (layer, row, column) of the entries.
+    B : ndarray or COO
+        Graph adjacency tensor.
+    u : ndarray
+        Out-going membership matrix.
+    v : ndarray
+        In-coming membership matrix.
+    w : ndarray
+        Affinity tensor.
+    eta : float
+          Reciprocity coefficient.
+
+    Returns
+    -------
+    M : ndarray
+        Conditional expectations lambda_{ij} of the entries.
+    """
+    subs_T = (subs[0], subs[2], subs[1])
+
+    return lambda0_nz(subs, u, v, w, assortative=w.ndim == 2) + eta * entries_at(B, subs_T)
+
+
+def auc_confidence_interval(
+    auc: float, n_pos: int, n_neg: int, confidence: float = 0.95
+) -> Tuple[float, float]:
+    """
+    Return the confidence interval of an AUC with the standard error of Hanley and McNeil.
+
+    Parameters
+    ----------
+    auc : float
+          AUC value.
+    n_pos : int
+            Number of positive entries.
+    n_neg : int
+            Number of negative entries.
+    confidence : float
+                 Confidence level of the interval.
+
+    Returns
+    -------
+    low : float
+          Lower bound of the interval.
+    high : float
+           Upper bound of the interval.
+    """
+    q1 = auc / (2.0 - auc)
+    q2 = 2.0 * auc**2 / (1.0 + auc)
+    variance = (
+        auc * (1.0 - auc) + (n_pos - 1) * (q1 - auc**2) + (n_neg - 1) * (q2 - auc**2)
+    ) / (n_pos * n_neg)
+    half_width = norm.ppf(0.5 + confidence / 2.0) * np.sqrt(max(variance, 0.0))
+
+    return max(auc - half_width, 0.0), min(auc + half_width, 1.0)
+
+
+def calculate_AUC_sampled(
+    pred_pos: np.ndarray, pred_neg: np.ndarray, confidence: float = 0.95
+) -> Tuple[float, float, float]:
+    """
+    Return the AUC of the link prediction from the scores of the positive entries and of a
+    sample of the negative ones, together with its confidence interval.
+
+    Parameters
+    ----------
+    pred_pos : ndarray
+               Inferred values of the positive entries.
+    pred_neg : ndarray
+               Inferred values of the sampled negative entries.
+    confidence : float
+                 Confidence level of the interval.
 
-    R.sort(key=lambda x: x[0], reverse=False)
-    R_length = len(R)
-    Neg = R_length - Pos
+    Returns
+    -------
+    AUC : float
+          AUC value.
+    low : float
+          Lower bound of the confidence interval.
+    high : float
+           Upper bound of the confidence interval.
+    """
+    labels = np.r_[np.ones(len(pred_pos)), np.zeros(len(pred_neg))]
+    auc = rank_auc(np.r_[pred_pos, pred_neg], labels)
+    if np.isnan(auc):
+        return auc, np.nan, np.nan
 
-    return fAUC(R, Pos, Neg)
+    return (auc,) + auc_confidence_interval(auc, len(pred_pos), len(pred_neg), confidence)
 
 
 def fAUC(R: list, Pos: float, Neg: float) -> float:
@@ -229,8 +476,9 @@ def calculate_expectation(
     return M
 
 
-def lambda0_full(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarray: # TODO: is there a
-    # better name for this? Ask Martina
+def lambda0_full(
+    u: np.ndarray, v: np.ndarray, w: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray: # TODO: is there a better name for this? Ask Martina
     """
     Compute the mean lambda0 for all entries (former Exp_ija_matrix(u, v, w)).
 
@@ -242,6 +490,8 @@ def lambda0_full(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarray: # T
         In-coming membership matrix.
     w : ndarray
         Affinity tensor.
+    out : ndarray, optional
+          Array of shape (L, N, N) where the result is written.
 
     Returns
     -------
@@ -249,14 +499,7 @@ def lambda0_full(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarray: # T
         Mean lambda0 for all entries.
     """
 
-    if w.ndim == 2:
-        M = np.einsum("ik,jk->ijk", u, v)
-        M = np.einsum("ijk,ak->aij", M, w)
-    else:
-        M = np.einsum("ik,jq->ijkq", u, v)
-        M = np.einsum("ijkq,akq->aij", M, w)
-
-    return M
+    return contract_uvw(u, v, w, out=out)
 
 
 def lambda0_full_dyncrep(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarray:
@@ -278,14 +521,47 @@ def lambda0_full_dyncrep(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndar
     Mean lambda0 for all entries.
     """
 
-    if w.ndim == 2:
-        M = np.einsum("ik,jk->ijk", u, v)
-        M = np.einsum("ijk,ak->ij", M, w)
-    else:
-        M = np.einsum("ik,jq->ijkq", u, v)
-        M = np.einsum("ijkq,akq->ij", M, w)
+    # The sum over the layers only needs the sum of the affinity tensor
+    return contract_uvw(u, v, w.sum(axis=0, keepdims=True))[0]
 
-    return M
+
+def lambda0_sum(
+    u: np.ndarray, v: np.ndarray, w: np.ndarray, mask: Optional[np.ndarray] = None
+) -> float:
+    """
+    Compute the sum of the mean lambda0 over all entries, without building lambda0_full.
+
+    The sum factorizes as sum_a (1^T u) w_a (v^T 1), so it costs O(NK + LK^2). If a mask is
+    given, the sum is restricted to the entries selected by the mask, and it costs one product
+    of each layer of the mask with v.
+
+    Parameters
+    ----------
+    u : ndarray
+        Out-going membership matrix.
+    v : ndarray
+        In-coming membership matrix.
+    w : ndarray
+        Affinity tensor.
+    mask : ndarray, optional
+           Mask for selecting a subset of the entries.
+
+    Returns
+    -------
+    M_sum : float
+            Sum of the mean lambda0.
+    """
+
+    if mask is None:
+        if w.ndim == 2:
+            return np.einsum("k,ak,k->", u.sum(axis=0), w, v.sum(axis=0))
+        return np.einsum("k,akq,q->", u.sum(axis=0), w, v.sum(axis=0))
+
+    # Sum over the masked entries of each row, weighted by v
+    MV = np.stack([(mask[a] > 0) @ v for a in range(mask.shape[0])])
+    if w.ndim == 2:
+        return np.einsum("ik,aik,ak->", u, MV, w)
+    return np.einsum("ik,aiq,akq->", u, MV, w)
 
 
 def lambda0_nz(
@@ -364,13 +640,7 @@ def expected_Aija(U: np.ndarray, V: np.ndarray, W: np.ndarray) -> np.ndarray:
     np.ndarray
         The expected value of the adjacency tensor.
     """
-    if W.ndim == 1:
-        M = np.einsum("ik,jk->ijk", U, V)
-        M = np.einsum("ijk,k->ij", M, W)
-    else:
-        M = np.einsum("ik,jq->ijkq", U, V)
-        M = np.einsum("ijkq,kq->ij", M, W)
-    return M
+    return contract_uvw(U, V, W[np.newaxis])[0]
 
 
 def expected_Aija_mtcov(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarray:
@@ -391,9 +661,7 @@ def expected_Aija_mtcov(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> np.ndarr
     np.ndarray
         The expected value of the adjacency tensor.
     """
-    M = np.einsum("ik,jq->ijkq", u, v)
-    M = np.einsum("ijkq,akq->aij", M, w)
-    return M
+    return contract_uvw(u, v, w)
 
 
 
@@ -453,6 +721,78 @@ def func_lagrange_multiplier(lambda_i: float, num: float, den: float) -> float:
     return np.sum(f) - 1
 
 
+def solve_lagrange_multipliers(
+    num: np.ndarray, den: np.ndarray, tol: float = 1e-12, max_iter: int = 100
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the Lagrange multipliers of all the rows at once.
+
+    For every row i it solves sum_k num_ik / (lambda_i + den_k) = 1, i.e. the root of
+    `func_lagrange_multiplier`, on the branch lambda_i > -min_k den_k where the left-hand side
+    is positive, decreasing and convex. The root is bracketed by that pole and by
+    sum_k num_ik - min_k den_k, and it is found by Newton steps that fall back to bisection when
+    they leave the bracket.
+
+    Parameters
+    ----------
+    num : ndarray
+          Non-negative numerators, of shape (N, K).
+    den : ndarray
+          Non-negative denominators, of shape (K,) or (N, K).
+    tol : float
+          Tolerance on the value of the function and on the width of the bracket.
+    max_iter : int
+               Maximum number of iterations.
+
+    Returns
+    -------
+    lambdas : ndarray
+              Lagrange multiplier of every row.
+    converged : ndarray
+                Boolean mask of the rows whose multiplier has converged. The rows without a
+                positive numerator have no root and are never converged.
+    """
+    num = np.asarray(num, dtype=float)
+    den = np.broadcast_to(np.asarray(den, dtype=float), num.shape)
+
+    # Bracket of the root on the branch to the right of the pole
+    positive = num > 0
+    solvable = positive.any(axis=1)
+    pole = -np.where(positive, den, np.inf).min(axis=1)
+    pole[~solvable] = 0.0
+    lo = pole.copy()
+    hi = pole + num.sum(axis=1)
+
+    lambdas = 0.5 * (lo + hi)
+    converged = ~solvable
+    for _ in range(max_iter):
+        active = ~converged
+        if not active.any():
+            break
+        x = lambdas[active]
+        ratio = num[active] / (x[:, np.newaxis] + den[active])
+        f = ratio.sum(axis=1) - 1
+        df = -(ratio / (x[:, np.newaxis] + den[active])).sum(axis=1)
+
+        # Shrink the bracket: f is positive to the left of the root
+        a = np.where(f > 0, x, lo[active])
+        b = np.where(f > 0, hi[active], x)
+        lo[active], hi[active] = a, b
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = x - f / df
+        outside = ~((step > a) & (step < b))
+        step[outside] = 0.5 * (a + b)[outside]
+        lambdas[active] = step
+
+        converged[active] = (np.abs(f) < tol) | (b - a <= tol * (1.0 + np.abs(x)))
+        # Keep the point where the function was evaluated for the rows that have converged
+        done = np.flatnonzero(active)[converged[active]]
+        lambdas[done] = x[converged[active]]
+
+    return lambdas, converged & solvable
+
+
 def u_with_lagrange_multiplier(
     u: np.ndarray, x: np.ndarray, y: np.ndarray
 ) -> np.ndarray:
@@ -2,13 +2,15 @@
 This module provides functions for computing the log-likelihood and pseudo log-likelihood of the model, as well as other related calculations.
 """
 
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
+from sparse import COO
 
 from pgm.input.tools import log_and_raise_error
-from pgm.output.evaluate import expected_Aija, expected_Aija_mtcov, lambda0_full
+from pgm.output.evaluate import (
+    entries_at, expected_Aija, expected_Aija_mtcov, lambda0_full, lambda0_nz)
 
 
 def loglikelihood(
@@ -245,6 +247,64 @@ def PSloglikelihood(
     return (B[mask > 0] * logM).sum() - M.sum()
 
 
+def PSloglikelihood_sampled(
+    B: Union[COO, np.ndarray],
+    u: np.ndarray,
+    v: np.ndarray,
+    w: np.ndarray,
+    eta: float,
+    subs_pos: Tuple[np.ndarray, ...],
+    subs_neg: Tuple[np.ndarray, ...],
+    n_neg: int,
+) -> float:
+    """
+    Estimate the pseudo log-likelihood of the entries selected by a mask from its positive
+    entries and a uniform sample of its zero entries, as returned by `sample_heldout_pairs`.
+
+    The term of the positive entries is exact, while the one of the zero entries is the mean
+    over the sample scaled by their number.
+
+    Parameters
+    ----------
+    B : np.ndarray or COO
+        Graph adjacency tensor.
+    u : np.ndarray
+        Out-going membership matrix.
+    v : np.ndarray
+        In-coming membership matrix.
+    w : np.ndarray
+        Affinity tensor.
+    eta : float
+        Reciprocity coefficient.
+    subs_pos : tuple
+        Coordinates of the positive entries selected by the mask.
+    subs_neg : tuple
+        Coordinates of the sampled zero entries.
+    n_neg : int
+        Number of zero entries selected by the mask.
+
+    Returns
+    -------
+    float
+        Estimated pseudo log-likelihood value.
+    """
+
+    def expectation(subs):
+        # As in PSloglikelihood, the reciprocal entries are taken from the first layer
+        subs_T = (np.zeros_like(subs[0]), subs[2], subs[1])
+        return lambda0_nz(subs, u, v, w, assortative=w.ndim == 2) + eta * entries_at(B, subs_T)
+
+    M_pos = expectation(subs_pos)
+    logM = np.zeros(M_pos.shape)
+    logM[M_pos > 0] = np.log(M_pos[M_pos > 0])
+    loglik = (entries_at(B, subs_pos) * logM).sum() - M_pos.sum()
+
+    if len(subs_neg[0]) > 0:
+        loglik -= n_neg * expectation(subs_neg).mean()
+
+    return loglik
+
+
 def calculate_opt_func(
     B: np.ndarray,
     algo_obj,
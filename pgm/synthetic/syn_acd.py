@@ -11,10 +11,10 @@ import pandas as pd
 from scipy import sparse
 from scipy.optimize import brentq
 
-from pgm.input.tools import flt
+from pgm.input.tools import Exp_ija_matrix, flt
 from pgm.output.plot import plot_M
 from pgm.synthetic.syn_dyncrep import eq_c, membership_vectors
-from pgm.synthetic.syn_rep import affinity_matrix
+from pgm.synthetic.syn_rep import affinity_matrix, sample_factorized_poisson
 
 EPS = 1e-12  # Small value to avoid division by zero
 
@@ -46,6 +46,7 @@ class SyntNetAnomaly:
         output_parameters: bool = False,
         output_adj: bool = False,
         outfile_adj: str = None,
+        factorized: bool = False,
     ) -> None:
         """
         Initialize the SyntNetAnomaly class.
@@ -92,6 +93,9 @@ class SyntNetAnomaly:
             Flag for storing the generated adjacency matrix (default is False).
         outfile_adj : str, optional
             Name for saving the adjacency matrix (default is None).
+        factorized : bool, optional
+            Flag for sampling the edges from the factorized means, without the dense NxN
+            matrix (default is False).
 
         Raises
         ------
@@ -123,6 +127,8 @@ class SyntNetAnomaly:
         self.output_adj = output_adj
         # Set name for saving the adjacency matrix
         self.outfile_adj = outfile_adj
+        # Set flag for sampling the edges without the dense matrix of the means
+        self.factorized = factorized
         # Set required average degree
         self.avg_degree = avg_degree
         self.rho_anomaly = rho_anomaly
@@ -248,29 +254,32 @@ class SyntNetAnomaly:
         for i in range(self.N):
             G.add_node(i)
 
-        # Compute M_ij
-        M = np.einsum("ik,jq->ijkq", self.u, self.v)
-        M = np.einsum("ijkq,kq->ij", M, self.w)
+        if self.factorized:
+            M = None
+            G, G0 = self._factorized_anomaly_network()
+        else:
+            # Compute M_ij
+            M = Exp_ija_matrix(self.u, self.v, self.w)
 
-        # Set c sparsity parameter
-        c = brentq(
-            eq_c, EPS, 20, args=(M, self.N, self.ExpM, self.rho_anomaly, self.mu)
-        )
+            # Set c sparsity parameter
+            c = brentq(
+                eq_c, EPS, 20, args=(M, self.N, self.ExpM, self.rho_anomaly, self.mu)
+            )
 
-        self.w *= c
+            self.w *= c
 
-        # Build network
-        A = self.prng.poisson(c * M)
-        A[A > 0] = 1  # binarize the adjacency matrix
-        np.fill_diagonal(A, 0)
-        G0 = nx.to_networkx_graph(A, create_using=nx.DiGraph)
+            # Build network
+            A = self.prng.poisson(c * M)
+            A[A > 0] = 1  # binarize the adjacency matrix
+            np.fill_diagonal(A, 0)
+            G0 = nx.to_networkx_graph(A, create_using=nx.DiGraph)
 
-        # weighted anomaly
-        A[self.z.nonzero()] = self.prng.poisson(self.pi * self.z.count_nonzero())
-        A[A > 0] = 1  # binarize the adjacency matrix
-        np.fill_diagonal(A, 0)
+            # weighted anomaly
+            A[self.z.nonzero()] = self.prng.poisson(self.pi * self.z.count_nonzero())
+            A[A > 0] = 1  # binarize the adjacency matrix
+            np.fill_diagonal(A, 0)
 
-        G = nx.to_networkx_graph(A, create_using=nx.DiGraph)
+            G = nx.to_networkx_graph(A, create_using=nx.DiGraph)
 
         # Network post-processing
 
@@ -331,6 +340,75 @@ class SyntNetAnomaly:
 
         return G, G0
 
+    def _factorized_anomaly_network(self, n_pairs: int = 2**20):
+        """
+        Generate the networks with and without anomalies from the factorized means, without the
+        dense NxN matrix M.
+
+        The sparsity parameter c solves the same equation as `eq_c`, whose sum over the
+        off-diagonal entries is estimated on `n_pairs` random pairs of nodes (or computed on all
+        of them if there are fewer).
+
+        Parameters
+        ----------
+        n_pairs : int, optional
+            Number of pairs of nodes used to estimate the sparsity parameter.
+
+        Returns
+        -------
+        G : DiGraph
+            DiGraph NetworkX object of the network with anomalies.
+        G0 : DiGraph
+            DiGraph NetworkX object of the network before the anomalies.
+        """
+        rng = np.random.default_rng(self.rseed)
+        n_offdiagonal = self.N**2 - self.N
+
+        # Means of the diagonal entries, and of a sample of the off-diagonal ones
+        diagonal = np.einsum("ik,kq,iq->i", self.u, self.w, self.v)
+        if n_offdiagonal <= n_pairs:
+            rows, cols = np.nonzero(~np.eye(self.N, dtype=bool))
+        else:
+            rows, cols = rng.integers(self.N, size=(2, n_pairs))
+            rows, cols = rows[rows != cols], cols[rows != cols]
+        offdiagonal = np.einsum("ik,kq,iq->i", self.u[rows], self.w, self.v[cols])
+
+        def eq_c_factorized(c: float) -> float:
+            return (
+                np.sum(np.exp(-c * diagonal))
+                + n_offdiagonal * (np.mean(np.exp(-c * offdiagonal)) - 1)
+                + self.ExpM * (1 - self.rho_anomaly) / (1 - self.mu)
+            )
+
+        # Set c sparsity parameter
+        c = brentq(eq_c_factorized, EPS, 20)
+
+        self.w *= c
+
+        # Build network
+        A = sample_factorized_poisson(self.u, self.v, self.w, rng)
+        A.data[:] = 1  # binarize the adjacency matrix
+        G0 = digraph_from_adjacency(A)
+
+        # weighted anomaly
+        z = sparse.coo_matrix(self.z)
+        offdiagonal_z = z.row != z.col
+        Z = sparse.csr_matrix(
+            (np.ones(offdiagonal_z.sum()), (z.row[offdiagonal_z], z.col[offdiagonal_z])),
+            shape=A.shape,
+        )
+        Z.data[:] = 1
+        if self.prng.poisson(self.pi * self.z.count_nonzero()) > 0:
+            A = A + Z
+            A.data[:] = 1  # binarize the adjacency matrix
+        else:
+            A = A - A.multiply(Z)
+            A.eliminate_zeros()
+
+        G = digraph_from_adjacency(A)
+
+        return G, G0
+
     def _generate_lv(self):
         """
         Generate z, u, v, w latent variables.
@@ -364,8 +442,10 @@ class SyntNetAnomaly:
             density = EPS
         else:
             density = self.mu
+        # A Generator draws the positions without permuting all the NxN entries
+        random_state = np.random.default_rng(self.rseed) if self.factorized else self.rseed
         z = sparse.random(
-            self.N, self.N, density=density, data_rvs=np.ones, random_state=self.rseed
+            self.N, self.N, density=density, data_rvs=np.ones, random_state=random_state
         )
         upper_z = sparse.triu(z)
         z = upper_z + upper_z.T
@@ -506,3 +586,25 @@ class SyntNetAnomaly:
                 break
         plt.colorbar(PCM, ax=ax)
         plt.show()
+
+
+def digraph_from_adjacency(A: sparse.spmatrix) -> nx.DiGraph:
+    """
+    Build the DiGraph of a binary sparse adjacency matrix, as `nx.to_networkx_graph` does for a
+    dense one.
+
+    Parameters
+    ----------
+    A : scipy.sparse.spmatrix
+        Binary adjacency matrix.
+
+    Returns
+    -------
+    G : DiGraph
+        DiGraph NetworkX object, with unit edge weights.
+    """
+    A = sparse.coo_matrix(A)
+    G = nx.DiGraph()
+    G.add_nodes_from(range(A.shape[0]))
+    G.add_weighted_edges_from(zip(A.row.tolist(), A.col.tolist(), A.data.tolist()))
+    return G
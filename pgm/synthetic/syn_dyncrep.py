@@ -3,7 +3,6 @@ Class definition of the reciprocity generative model with the member functions r
 """
 
 import logging
-import math
 from typing import List, Optional, Tuple
 
 import matplotlib.pyplot as plt
@@ -12,7 +11,7 @@ import numpy as np
 from numpy.random import RandomState
 import pandas as pd
 import scipy
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_array
 
 from ..input.tools import normalize_nonzero_membership
 from ..model.constants import EPS_
@@ -251,12 +250,6 @@ class SyntheticDynCRep:
             # Set latent variables
             self.u, self.v, self.w = parameters
 
-        # Network generation
-        G = [nx.DiGraph() for t in range(self.T + 1)]
-        for t in range(self.T + 1):
-            for i in range(self.N):
-                G[t].add_node(i)
-
         # Compute M_ij
         M = self.Exp_ija_matrix(self.u, self.v, self.w)
         np.fill_diagonal(M, 0)
@@ -264,44 +257,34 @@ class SyntheticDynCRep:
         # Set c sparsity parameter
         Exp_M_inferred = M.sum()
         c = self.ExpM / Exp_M_inferred
+
+        # The off-diagonal entries are drawn in row-major order, with one draw per pair as in
+        # the loop over (i, j), so a seed gives the same network as the pairwise sampling
+        off_diagonal = ~np.eye(self.N, dtype=bool)
+
         # For t = 0
-        for i in range(self.N):
-            for j in range(self.N):
-                if i != j:
-                    A_ij = self.prng.poisson(c * M[i, j], 1)[0]
-                    if A_ij > 0:
-                        G[0].add_edge(i, j, weight=1)  # binarized
+        A_bin = np.zeros((self.N, self.N), dtype=bool)
+        A_bin[off_diagonal] = self.prng.poisson(c * M[off_diagonal]) > 0  # binarized
+        A_bin_t = [A_bin]
 
         # For t > 0
         for t in range(self.T):
-            for i in range(self.N):
-                for j in range(self.N):
-                    if i != j:
-
-                        if G[t].has_edge(
-                            j, i
-                        ):  # reciprocal edge determines Poisson rate
-                            lambda_ij = c * M[i, j] + self.eta
-                        else:
-                            lambda_ij = c * M[i, j]
-
-                        if G[t].has_edge(
-                            i, j
-                        ):  # the edge at previous time step: determines the transition rate
-                            q = 1 - self.beta
-                        else:
-                            q = self.beta * lambda_ij
-                        r = self.prng.rand()
-                        if r <= q:
-                            G[t + 1].add_edge(i, j, weight=1)  # binarized
+            # The reciprocal edge determines the Poisson rate
+            lambda_ij = c * M + self.eta * A_bin_t[t].T
+            # The edge at previous time step determines the transition rate
+            q = np.where(A_bin_t[t], 1 - self.beta, self.beta * lambda_ij)
+            A_bin = np.zeros((self.N, self.N), dtype=bool)
+            A_bin[off_diagonal] = self.prng.rand(self.N * (self.N - 1)) <= q[off_diagonal]
+            A_bin_t.append(A_bin)
+
+        # Network generation
+        G = [nx.DiGraph() for t in range(self.T + 1)]
+        for t in range(self.T + 1):
+            G[t].add_nodes_from(range(self.N))
+            G[t].add_edges_from(zip(*(idx.tolist() for idx in A_bin_t[t].nonzero())), weight=1)
 
         # Network post-processing
-        nodes = list(G[0].nodes())
-        assert len(nodes) == self.N
-        A = [
-            nx.to_scipy_sparse_array(G[t], nodelist=nodes, weight="weight")
-            for t in range(len(G))
-        ]
+        A = [csr_array(A_bin.astype(int)) for A_bin in A_bin_t]
 
         # Keep largest connected component
         A_sum = A[0].copy()
@@ -678,15 +661,10 @@ def membership_vectors(
     size = int(N / K)
     u = np.zeros((N, K))
     v = np.zeros((N, K))
-    for i in range(N):
-        q = int(math.floor(float(i) / float(size)))
-        if q == K:
-            u[i:, K - 1] = 1.0
-            v[i:, K - 1] = 1.0
-        else:
-            for j in range(q * size, q * size + size):
-                u[j, q] = 1.0
-                v[j, q] = 1.0
+    # Assign the remaining nodes to the last community
+    communities = np.minimum(np.arange(N) // size, K - 1)
+    u[np.arange(N), communities] = 1.0
+    v[np.arange(N), communities] = 1.0
     # Generate mixed communities if requested
     if over != 0.0:
         overlapping = int(N * over)  # number of nodes belonging to more communities
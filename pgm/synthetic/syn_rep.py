@@ -4,20 +4,20 @@ It builds a directed, possibly weighted, network.
 """
 
 import logging
-import math
 from pathlib import Path
 import sys
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Union
 import warnings
 
 import networkx as nx
 import numpy as np
 import pandas as pd
-from scipy.sparse import tril, triu
+from scipy.sparse import coo_matrix, csr_matrix, tril, triu
+from scipy.sparse.csgraph import connected_components
 
 from ..input.stats import reciprocal_edges
 from ..input.tools import (
-    Exp_ija_matrix, log_and_raise_error, normalize_nonzero_membership, transpose_ij2)
+    Exp_ija_matrix, hash_fold, log_and_raise_error, normalize_nonzero_membership, transpose_ij2)
 
 # TODO: add type hints into a separate script
 
@@ -50,6 +50,9 @@ class GM_reciprocity:
         output_adj: bool = False,
         outfile_adj: str = None,
         ExpM: Optional[float] = None,
+        vectorized: bool = False,
+        factorized: bool = False,
+        output_graph: bool = True,
     ):
         self.N = N  # number of nodes
         self.K = K  # number of communities
@@ -63,6 +66,15 @@ class GM_reciprocity:
         self.output_parameters = output_parameters  # flag for storing the parameters
         self.output_adj = output_adj  # flag for storing the generated adjacency matrix
         self.outfile_adj = outfile_adj  # name for saving the adjacency matrix
+        # flag for drawing all the pairs at once with a numpy Generator seeded with `seed`,
+        # instead of one pair at a time from the legacy RandomState stream
+        self.vectorized = vectorized
+        # flag for drawing the edges of each block pair from the factorized means, without any
+        # (N, N) matrix, in O(E + N K^2) time and memory
+        self.factorized = factorized
+        # flag for building the NetworkX graph in the factorized generation, which otherwise
+        # returns only the sparse adjacency matrix
+        self.output_graph = output_graph
         if (eta < 0) or (eta >= 1):  # reciprocity coefficient
             log_and_raise_error(
                 ValueError, "The reciprocity coefficient eta has to be in [0, 1)!"
@@ -152,21 +164,11 @@ class GM_reciprocity:
             self.u = np.zeros((self.N, self.K))
             self.v = np.zeros((self.N, self.K))
 
-            # Loop over all nodes
-            for i in range(self.N):
-                # Calculate the community index for the current node
-                q = int(math.floor(float(i) / float(size)))
-
-                # If the community index is equal to the number of communities
-                if q == self.K:
-                    # Assign the last community to the remaining nodes
-                    self.u[i:, self.K - 1] = 1.0
-                    self.v[i:, self.K - 1] = 1.0
-                else:
-                    # Assign the current community to the nodes in the current range
-                    for j in range(q * size, q * size + size):
-                        self.u[j, q] = 1.0
-                        self.v[j, q] = 1.0
+            # Assign the nodes to consecutive communities of the same size, and the remaining
+            # nodes to the last community
+            communities = np.minimum(np.arange(self.N) // size, self.K - 1)
+            self.u[np.arange(self.N), communities] = 1.0
+            self.v[np.arange(self.N), communities] = 1.0
 
             # Generate the affinity matrix w
             self.w = affinity_matrix(
@@ -210,6 +212,9 @@ class GM_reciprocity:
                     self.u = normalize_nonzero_membership(self.u)
                     self.v = normalize_nonzero_membership(self.v)
 
+        if self.factorized:
+            return self._factorized_network(parameters, reciprocity=True)
+
         # Compute the expected number of edges between each pair of nodes
         M0 = Exp_ija_matrix(self.u, self.v, self.w)  # whose elements are lambda0_{ij}
         np.fill_diagonal(M0, 0)
@@ -241,48 +246,55 @@ class GM_reciprocity:
         Exp_r = self.eta + ((MM0 * Mt + self.eta * Mt**2).sum() / MM.sum())
 
         # Generate the network G and the adjacency matrix A using the latent variables
-        G = nx.MultiDiGraph()
-        for i in range(self.N):
-            G.add_node(i)
-
-        counter, totM = 0, 0
-        for i in range(self.N):
-            for j in range(i + 1, self.N):
-                r = prng.rand(1)[0]
-                if r < 0.5:
-                    # Draw the number of edges from node i to node j from a Poisson distribution
-                    A_ij = prng.poisson(M[i, j], 1)[
-                        0
-                    ]  # draw A_ij from P(A_ij) = Poisson(m_ij)
-                    if A_ij > 0:
-                        G.add_edge(i, j, weight=A_ij)
-                    # Compute the expected number of edges from node j to node i considering
-                    # reciprocity
-                    lambda_ji = M0[j, i] + self.eta * A_ij
-                    # Draw the number of edges from node j to node i from a Poisson distribution
-                    A_ji = prng.poisson(lambda_ji, 1)[
-                        0
-                    ]  # draw A_ji from P(A_ji|A_ij) = Poisson(lambda0_ji + eta*A_ij)
-                    if A_ji > 0:
-                        G.add_edge(j, i, weight=A_ji)
-                else:
-                    # Draw the number of edges from node j to node i from a Poisson distribution
-                    A_ji = prng.poisson(M[j, i], 1)[
-                        0
-                    ]  # draw A_ij from P(A_ij) = Poisson(m_ij)
-                    if A_ji > 0:
-                        G.add_edge(j, i, weight=A_ji)
-                    # Compute the expected number of edges from node i to node j considering
-                    # reciprocity
-                    lambda_ij = M0[i, j] + self.eta * A_ji
-                    # Draw the number of edges from node i to node j from a Poisson distribution
-                    A_ij = prng.poisson(lambda_ij, 1)[
-                        0
-                    ]  # draw A_ji from P(A_ji|A_ij) = Poisson(lambda0_ji + eta*A_ij)
-                    if A_ij > 0:
-                        G.add_edge(i, j, weight=A_ij)
-                counter += 1
-                totM += A_ij + A_ji
+        if self.vectorized:
+            rows, cols, weights = sample_reciprocal_pairs(
+                self.N, M, M0, self.eta, np.random.default_rng(self.seed)
+            )
+            G = graph_from_edges(self.N, rows, cols, weights)
+            counter, totM = self.N * (self.N - 1) // 2, weights.sum()
+        else:
+            G = nx.MultiDiGraph()
+            for i in range(self.N):
+                G.add_node(i)
+
+            counter, totM = 0, 0
+            for i in range(self.N):
+                for j in range(i + 1, self.N):
+                    r = prng.rand(1)[0]
+                    if r < 0.5:
+                        # Draw the number of edges from node i to node j from a Poisson distribution
+                        A_ij = prng.poisson(M[i, j], 1)[
+                            0
+                        ]  # draw A_ij from P(A_ij) = Poisson(m_ij)
+                        if A_ij > 0:
+                            G.add_edge(i, j, weight=A_ij)
+                        # Compute the expected number of edges from node j to node i considering
+                        # reciprocity
+                        lambda_ji = M0[j, i] + self.eta * A_ij
+                        # Draw the number of edges from node j to node i from a Poisson distribution
+                        A_ji = prng.poisson(lambda_ji, 1)[
+                            0
+                        ]  # draw A_ji from P(A_ji|A_ij) = Poisson(lambda0_ji + eta*A_ij)
+                        if A_ji > 0:
+                            G.add_edge(j, i, weight=A_ji)
+                    else:
+                        # Draw the number of edges from node j to node i from a Poisson distribution
+                        A_ji = prng.poisson(M[j, i], 1)[
+                            0
+                        ]  # draw A_ij from P(A_ij) = Poisson(m_ij)
+                        if A_ji > 0:
+                            G.add_edge(j, i, weight=A_ji)
+                        # Compute the expected number of edges from node i to node j considering
+                        # reciprocity
+                        lambda_ij = M0[i, j] + self.eta * A_ji
+                        # Draw the number of edges from node i to node j from a Poisson distribution
+                        A_ij = prng.poisson(lambda_ij, 1)[
+                            0
+                        ]  # draw A_ji from P(A_ji|A_ij) = Poisson(lambda0_ji + eta*A_ij)
+                        if A_ij > 0:
+                            G.add_edge(i, j, weight=A_ij)
+                    counter += 1
+                    totM += A_ij + A_ji
 
         # Keep only the largest connected component of the network
         Gc = max(nx.weakly_connected_components(G), key=len)
@@ -378,21 +390,11 @@ class GM_reciprocity:
             self.u = np.zeros((self.N, self.K))
             self.v = np.zeros((self.N, self.K))
 
-            # Loop over all nodes
-            for i in range(self.N):
-                # Calculate the community index for the current node
-                q = int(math.floor(float(i) / float(size)))
-
-                # If the community index is equal to the number of communities
-                if q == self.K:
-                    # Assign the last community to the remaining nodes
-                    self.u[i:, self.K - 1] = 1.0
-                    self.v[i:, self.K - 1] = 1.0
-                else:
-                    # Assign the current community to the nodes in the current range
-                    for j in range(q * size, q * size + size):
-                        self.u[j, q] = 1.0
-                        self.v[j, q] = 1.0
+            # Assign the nodes to consecutive communities of the same size, and the remaining
+            # nodes to the last community
+            communities = np.minimum(np.arange(self.N) // size, self.K - 1)
+            self.u[np.arange(self.N), communities] = 1.0
+            self.v[np.arange(self.N), communities] = 1.0
 
             # Generate the affinity matrix w
             self.w = affinity_matrix(
@@ -436,6 +438,9 @@ class GM_reciprocity:
                     self.u = normalize_nonzero_membership(self.u)
                     self.v = normalize_nonzero_membership(self.v)
 
+        if self.factorized:
+            return self._factorized_network(parameters, reciprocity=False)
+
         # Compute the expected number of edges between each pair of nodes
         M0 = Exp_ija_matrix(self.u, self.v, self.w)  # whose elements are lambda0_{ij}
         np.fill_diagonal(M0, 0)
@@ -453,19 +458,13 @@ class GM_reciprocity:
 
         # Generate network G (and adjacency matrix A) using the latent variable,
         # with the generative model (A_ij) ~ P(A_ij|u,v,w)
-        G = nx.MultiDiGraph()
-        for i in range(self.N):
-            G.add_node(i)
-
-        totM = 0
-        for i in range(self.N):
-            for j in range(self.N):
-                if i != j:  # no self-loops
-                    # draw A_ij from P(A_ij) = Poisson(c*m_ij)
-                    A_ij = prng.poisson(c * M0[i, j], 1)[0]
-                    if A_ij > 0:
-                        G.add_edge(i, j, weight=A_ij)
-                    totM += A_ij
+        # The entries are drawn in row-major order, as one draw per pair of the legacy stream
+        rows, cols = np.nonzero(~np.eye(self.N, dtype=bool))
+        sampler = np.random.default_rng(self.seed) if self.vectorized else prng
+        # draw A_ij from P(A_ij) = Poisson(c*m_ij)
+        weights = sampler.poisson(c * M0[rows, cols])
+        G = graph_from_edges(self.N, rows, cols, weights)
+        totM = weights.sum()
 
         nodes = list(G.nodes())
 
@@ -557,34 +556,42 @@ class GM_reciprocity:
         if p is None:
             p = (1.0 - self.eta) * self.k * 0.5 / (self.N - 1.0)
 
-        # Initialize a directed graph G
-        G = nx.MultiDiGraph()
-        for i in range(self.N):
-            G.add_node(i)
-
-        # Initialize total weight of the graph
-        totM = 0
-
-        # Generate edges for the graph
-        for i in range(self.N):
-            for j in range(i + 1, self.N):
-                # Draw two random numbers from Poisson distribution
-                A0 = prng.poisson(p, 1)[0]
-                A1 = prng.poisson(p + A0, 1)[0]
-                r = prng.rand(1)[0]
-                # Add edges to the graph based on the drawn numbers
-                if r < 0.5:
-                    if A0 > 0:
-                        G.add_edge(i, j, weight=A0)
-                    if A1 > 0:
-                        G.add_edge(j, i, weight=A1)
-                else:
-                    if A0 > 0:
-                        G.add_edge(j, i, weight=A0)
-                    if A1 > 0:
-                        G.add_edge(i, j, weight=A1)
-                # Update total weight of the graph
-                totM += A0 + A1
+        if self.vectorized:
+            # One of the directed-edges is drawn with mean p, the other with mean p + A0
+            rows, cols, weights = sample_reciprocal_pairs(
+                self.N, p, p, 1.0, np.random.default_rng(self.seed)
+            )
+            G = graph_from_edges(self.N, rows, cols, weights)
+            totM = weights.sum()
+        else:
+            # Initialize a directed graph G
+            G = nx.MultiDiGraph()
+            for i in range(self.N):
+                G.add_node(i)
+
+            # Initialize total weight of the graph
+            totM = 0
+
+            # Generate edges for the graph
+            for i in range(self.N):
+                for j in range(i + 1, self.N):
+                    # Draw two random numbers from Poisson distribution
+                    A0 = prng.poisson(p, 1)[0]
+                    A1 = prng.poisson(p + A0, 1)[0]
+                    r = prng.rand(1)[0]
+                    # Add edges to the graph based on the drawn numbers
+                    if r < 0.5:
+                        if A0 > 0:
+                            G.add_edge(i, j, weight=A0)
+                        if A1 > 0:
+                            G.add_edge(j, i, weight=A1)
+                    else:
+                        if A0 > 0:
+                            G.add_edge(j, i, weight=A0)
+                        if A1 > 0:
+                            G.add_edge(i, j, weight=A1)
+                    # Update total weight of the graph
+                    totM += A0 + A1
 
         # Keep only the largest connected component of the graph
         Gc = max(nx.weakly_connected_components(G), key=len)
@@ -639,6 +646,84 @@ class GM_reciprocity:
 
         return G, A
 
+    def _factorized_network(
+        self,
+        parameters: Optional[Tuple[np.ndarray, ...]],
+        reciprocity: bool = True,
+    ) -> Tuple[Optional[nx.MultiDiGraph], csr_matrix]:
+        """
+        Generate the network from the factorized means, without any (N, N) matrix.
+
+        The sparsity constant is the one of the dense generation, computed with
+        `offdiagonal_sum`. The edges are drawn with `sample_factorized_reciprocity`, or with
+        `sample_factorized_poisson` if there is no reciprocity, and the largest connected
+        component is extracted from the sparse adjacency matrix.
+
+        Parameters
+        ----------
+        parameters: tuple, optional
+                    Latent variables given by the user. If None, w is rescaled in place.
+        reciprocity: bool
+                     If True, draw the edges with reciprocity, otherwise conditionally
+                     independent.
+
+        Returns
+        -------
+        G: MultiDiGraph or None
+           MultiDiGraph NetworkX object, or None if `output_graph` is False.
+        A: csr_matrix
+           The adjacency matrix of the generated network.
+        """
+        rng = np.random.default_rng(self.seed)
+        total = offdiagonal_sum(self.u, self.v, self.w)
+        if reciprocity:
+            c = (self.ExpM * (1.0 - self.eta)) / total
+        else:
+            c = self.ExpM / float(total)
+        if parameters is None:
+            self.w *= c  # only w is impact by that, u and v have a constraint
+            w = self.w
+        else:
+            w = c * self.w
+
+        if reciprocity:
+            A = sample_factorized_reciprocity(self.u, self.v, w, self.eta, rng, self.seed)
+        else:
+            A = sample_factorized_poisson(self.u, self.v, w, rng)
+
+        # Keep only the largest connected component of the network
+        nodes = largest_weak_component(A)
+        n_removed = self.N - len(nodes)
+        A = A[nodes][:, nodes]
+        self.u = self.u[nodes]
+        self.v = self.v[nodes]
+        self.N = len(nodes)
+
+        binary = (A > 0).astype(int)
+        logging.info(
+            "Removed %s nodes, because not part of the largest connected component", n_removed
+        )
+        logging.info("Number of nodes: %s", self.N)
+        logging.info("Number of edges: %s", A.nnz)
+        logging.info("Average degree (2E/N): %s", np.round(2 * A.nnz / float(self.N), 3))
+        logging.info("Average weighted degree (2M/N): %s", np.round(2 * A.sum() / self.N, 3))
+        logging.info(
+            "Reciprocity (networkX) = %.3f", binary.multiply(binary.T).sum() / max(A.nnz, 1)
+        )
+
+        G = None
+        if self.output_graph or self.output_adj:
+            A_coo = A.tocoo()
+            G = graph_from_edges(self.N, A_coo.row, A_coo.col, A_coo.data)
+            G = nx.relabel_nodes(G, dict(enumerate(nodes.tolist())))
+
+        if self.output_parameters:
+            self.output_results(nodes.tolist())
+        if self.output_adj:
+            self.output_adjacency(G, outfile=self.outfile_adj)
+
+        return (G if self.output_graph else None), A
+
     def output_results(self, nodes: List[int]) -> None:
         """
         Output results in a compressed file.
@@ -770,3 +855,283 @@ def affinity_matrix(
         p[1, 0] = b * p1
 
     return p
+
+
+def upper_triangle_pairs(N: int, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the pairs (i, j) with start <= i < stop and i < j < N, in row-major order.
+
+    Parameters
+    ----------
+    N : int
+        Number of nodes.
+    start : int
+        First row of the block.
+    stop : int
+        Row after the last row of the block.
+
+    Returns
+    -------
+    i : ndarray
+        Row indices of the pairs.
+    j : ndarray
+        Column indices of the pairs.
+    """
+    rows = np.arange(start, min(stop, N), dtype=np.int64)
+    counts = N - 1 - rows
+    i = np.repeat(rows, counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    j = np.arange(len(i), dtype=np.int64) - offsets + i + 1
+    return i, j
+
+
+def sample_reciprocal_pairs(
+    N: int,
+    rate_first: Union[float, np.ndarray],
+    rate_second: Union[float, np.ndarray],
+    eta: float,
+    rng: np.random.Generator,
+    block_pairs: int = 2**22,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Draw the two directed edges of every unordered pair of nodes, with reciprocity.
+
+    For every pair i < j, a direction is chosen uniformly at random. The edge in that direction,
+    say A_ij, is drawn from Poisson(rate_first[i, j]), and the edge in the opposite direction from
+    Poisson(rate_second[j, i] + eta * A_ij). The pairs are drawn in blocks of rows, so the memory
+    is O(block_pairs) on top of the rate matrices.
+
+    Parameters
+    ----------
+    N : int
+        Number of nodes.
+    rate_first : float or ndarray
+                 Mean of the edge drawn first, either a constant or an (N, N) matrix.
+    rate_second : float or ndarray
+                  Mean of the edge drawn second when the first one is zero, with the same shape.
+    eta : float
+          Reciprocity coefficient.
+    rng : Generator
+          Random number generator.
+    block_pairs : int
+                  Approximate number of pairs drawn at once.
+
+    Returns
+    -------
+    rows : ndarray
+           Source nodes of the non-zero edges.
+    cols : ndarray
+           Target nodes of the non-zero edges.
+    weights : ndarray
+              Weights of the non-zero edges.
+    """
+    rate_first, rate_second = np.asarray(rate_first), np.asarray(rate_second)
+
+    def at(rate: np.ndarray, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        return rate[src, dst] if rate.ndim == 2 else np.broadcast_to(rate, src.shape)
+
+    rows, cols, weights = [], [], []
+    step = max(1, block_pairs // N)
+    for start in range(0, N - 1, step):
+        i, j = upper_triangle_pairs(N, start, start + step)
+        forward = rng.random(len(i)) < 0.5
+        src, dst = np.where(forward, i, j), np.where(forward, j, i)
+        first = rng.poisson(at(rate_first, src, dst))
+        second = rng.poisson(at(rate_second, dst, src) + eta * first)
+        for a, b, x in ((src, dst, first), (dst, src, second)):
+            nz = x > 0
+            rows.append(a[nz])
+            cols.append(b[nz])
+            weights.append(x[nz])
+
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=int)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+
+
+def graph_from_edges(
+    N: int, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray
+) -> nx.MultiDiGraph:
+    """
+    Build the graph with nodes 0, ..., N-1 and the non-zero weighted edges, in the given order.
+
+    Parameters
+    ----------
+    N : int
+        Number of nodes.
+    rows : ndarray
+           Source nodes of the edges.
+    cols : ndarray
+           Target nodes of the edges.
+    weights : ndarray
+              Weights of the edges. The edges with zero weight are skipped.
+
+    Returns
+    -------
+    G : MultiDiGraph
+        MultiDiGraph NetworkX object.
+    """
+    nz = weights > 0
+    G = nx.MultiDiGraph()
+    G.add_nodes_from(range(N))
+    G.add_weighted_edges_from(zip(rows[nz].tolist(), cols[nz].tolist(), weights[nz]))
+    return G
+
+
+def offdiagonal_sum(u: np.ndarray, v: np.ndarray, w: np.ndarray) -> float:
+    """
+    Sum the means lambda0_ij = sum_kq u_ik w_kq v_jq over the pairs i != j, in O(N K^2) time.
+
+    Parameters
+    ----------
+    u : ndarray
+        Out-going membership matrix, of shape (N, K).
+    v : ndarray
+        In-coming membership matrix, of shape (N, K).
+    w : ndarray
+        Affinity matrix, of shape (K, K).
+
+    Returns
+    -------
+    total : float
+            Sum of the off-diagonal means.
+    """
+    return u.sum(axis=0) @ w @ v.sum(axis=0) - np.einsum("ik,kq,iq->", u, w, v)
+
+
+def sample_factorized_poisson(
+    u: np.ndarray, v: np.ndarray, w: np.ndarray, rng: np.random.Generator
+) -> csr_matrix:
+    """
+    Draw A_ij ~ Poisson(sum_kq u_ik w_kq v_jq) for all the pairs i != j, without the (N, N) mean.
+
+    The mean is a sum over the block pairs (k, q), so A is the superposition of K^2 Poisson
+    processes. The number of edges of the block pair (k, q) is drawn from
+    Poisson(w_kq U_k V_q), with U_k = sum_i u_ik and V_q = sum_j v_jq, and the endpoints of its
+    edges are drawn from the distributions u_ik / U_k and v_jq / V_q. The self-loops are then
+    discarded. The time and memory are O(E + N K + K^2).
+
+    Parameters
+    ----------
+    u : ndarray
+        Out-going membership matrix, of shape (N, K).
+    v : ndarray
+        In-coming membership matrix, of shape (N, K).
+    w : ndarray
+        Affinity matrix, of shape (K, K).
+    rng : Generator
+          Random number generator.
+
+    Returns
+    -------
+    A : csr_matrix
+        Adjacency matrix, with the number of edges of each pair.
+    """
+    N, K = u.shape
+    U, V = u.sum(axis=0), v.sum(axis=0)
+    n_blocks = rng.poisson(w * np.outer(U, V))
+
+    # The endpoints of all the edges leaving group k, and of all those entering group q, are
+    # drawn at once, then split among the block pairs
+    sources = [
+        rng.choice(N, size=n, p=u[:, k] / U[k]) if n > 0 else np.zeros(0, dtype=np.int64)
+        for k, n in enumerate(n_blocks.sum(axis=1))
+    ]
+    targets = [
+        rng.choice(N, size=n, p=v[:, q] / V[q]) if n > 0 else np.zeros(0, dtype=np.int64)
+        for q, n in enumerate(n_blocks.sum(axis=0))
+    ]
+    offsets = np.cumsum(n_blocks, axis=0) - n_blocks
+    dst = [
+        targets[q][offsets[k, q] : offsets[k, q] + n_blocks[k, q]]
+        for k in range(K)
+        for q in range(K)
+    ]
+    src, dst = np.concatenate(sources), np.concatenate(dst)
+
+    keep = src != dst
+    src, dst = src[keep], dst[keep]
+    return coo_matrix((np.ones(len(src), dtype=np.int64), (src, dst)), shape=(N, N)).tocsr()
+
+
+def sample_factorized_reciprocity(
+    u: np.ndarray,
+    v: np.ndarray,
+    w: np.ndarray,
+    eta: float,
+    rng: np.random.Generator,
+    seed: int,
+) -> csr_matrix:
+    """
+    Draw a network from the reciprocity generative model, without the (N, N) means.
+
+    For every pair i < j, a direction is chosen at random, say i -> j. Then A_ij is drawn from
+    Poisson(m_ij), with m = (lambda0 + eta lambda0^T) / (1 - eta^2), and A_ji from
+    Poisson(lambda0_ji + eta A_ij). Both m and lambda0 are factorized, so they are drawn for all
+    the pairs with `sample_factorized_poisson`. The direction of each pair is given by a hash
+    of the pair, so only the entries in the chosen directions are kept. The term eta A_ij is
+    added by drawing Poisson(eta A_ij) on the non-zero entries only.
+
+    Parameters
+    ----------
+    u : ndarray
+        Out-going membership matrix, of shape (N, K).
+    v : ndarray
+        In-coming membership matrix, of shape (N, K).
+    w : ndarray
+        Affinity matrix, of shape (K, K), already scaled by the sparsity constant.
+    eta : float
+          Reciprocity coefficient.
+    rng : Generator
+          Random number generator.
+    seed : int
+           Seed of the hash choosing the direction drawn first in every pair.
+
+    Returns
+    -------
+    A : csr_matrix
+        Adjacency matrix, with the number of edges of each pair.
+    """
+    N = u.shape[0]
+    scale = 1.0 / (1.0 - eta * eta)
+    # m_ij = (lambda0_ij + eta lambda0_ji) / (1 - eta^2), and lambda0_ji has factors (v, w^T, u)
+    first = (
+        sample_factorized_poisson(u, v, scale * w, rng)
+        + sample_factorized_poisson(v, u, eta * scale * w.T, rng)
+    ).tocoo()
+    second = sample_factorized_poisson(u, v, w, rng).tocoo()
+
+    def drawn_first(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        low, high = np.minimum(rows, cols), np.maximum(rows, cols)
+        coin = hash_fold((np.zeros_like(low), low, high), N, seed, 2) == 0
+        return coin == (rows < cols)
+
+    keep_first = drawn_first(first.row, first.col)
+    src, dst, vals = first.row[keep_first], first.col[keep_first], first.data[keep_first]
+    keep_second = ~drawn_first(second.row, second.col)
+    # The reciprocal term eta * A_ij is added on the edges drawn first only
+    reciprocal = rng.poisson(eta * vals)
+
+    rows = np.concatenate([src, second.row[keep_second], dst])
+    cols = np.concatenate([dst, second.col[keep_second], src])
+    vals = np.concatenate([vals, second.data[keep_second], reciprocal])
+    nz = vals > 0
+    return coo_matrix((vals[nz], (rows[nz], cols[nz])), shape=(N, N)).tocsr()
+
+
+def largest_weak_component(A: csr_matrix) -> np.ndarray:
+    """
+    Return the nodes of the largest weakly connected component of a directed network.
+
+    Parameters
+    ----------
+    A : csr_matrix
+        Adjacency matrix of the network.
+
+    Returns
+    -------
+    nodes : ndarray
+            Sorted indices of the nodes of the largest component.
+    """
+    _, labels = connected_components(A, directed=True, connection="weak")
+    return np.flatnonzero(labels == np.argmax(np.bincount(labels)))
@@ -4,7 +4,6 @@ This module contains classes for generating synthetic networks using mixed-membe
 
 from abc import ABCMeta
 import logging
-import math
 import os
 from typing import Optional, Tuple
 
@@ -12,6 +11,7 @@ import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 from scipy.optimize import brentq
+from scipy.sparse import csr_array
 
 from ..input.stats import print_graph_stat
 from ..input.tools import (
@@ -19,6 +19,7 @@ from ..input.tools import (
     output_adjacency, transpose_tensor)
 from ..output.evaluate import lambda0_full
 from ..output.plot import plot_A
+from .syn_rep import largest_weak_component, offdiagonal_sum, sample_factorized_poisson
 
 DEFAULT_N = 1000
 DEFAULT_L = 1
@@ -134,6 +135,9 @@ class StandardMMSBM(BaseSyntheticNetwork):
             is_sparse = DEFAULT_IS_SPARSE
         self.is_sparse = is_sparse
 
+        # Draw the edges of each block pair from the factorized means, without the dense tensor
+        self.factorized = kwargs.get("factorized", False)
+
         if "label" in kwargs:
             label = kwargs["label"]
         else:
@@ -299,6 +303,10 @@ class StandardMMSBM(BaseSyntheticNetwork):
                     ValueError, "The shape of the parameter w has to be (L, K, K)."
                 )
 
+        if self.factorized:
+            self._build_Y_factorized(parameters)
+            return
+
         # Generate Y
 
         self.M = Exp_ija_matrix(self.u, self.v, self.w)
@@ -336,6 +344,57 @@ class StandardMMSBM(BaseSyntheticNetwork):
         self.v = self.v[self.nodes]
         self.N = len(self.nodes)
 
+    def _build_Y_factorized(self, parameters=None) -> None:
+        """
+        Generate the network layers from the factorized means, without the dense (L, N, N) tensor.
+
+        Each layer is drawn with `sample_factorized_poisson`, in O(E + N K) time and memory. The
+        NetworkX graphs of the layers are built only if the details of the network are shown.
+
+        Parameters
+        ----------
+        parameters: Tuple[np.ndarray, np.ndarray, np.ndarray], optional
+                    Latent variables given by the user. If None, w is rescaled in place.
+        """
+        rng = np.random.default_rng(self.seed)
+        self.M = None
+        w = self.w
+        # sparsity parameter for Y
+        if self.is_sparse:
+            c = self.ExpEdges / sum(
+                offdiagonal_sum(self.u, self.v, self.w[layer]) for layer in range(self.L)
+            )
+            if parameters is None:
+                self.w *= c
+            else:
+                w = c * self.w
+
+        Y = [sample_factorized_poisson(self.u, self.v, w[layer], rng) for layer in range(self.L)]
+
+        # Remove the nodes that are not in the largest connected component of any layer
+        keep = np.zeros(self.N, dtype=bool)
+        for A in Y:
+            keep[largest_weak_component(A)] = True
+        nodes = np.flatnonzero(keep)
+        self.nodes = nodes.tolist()
+        self.layer_graphs = [csr_array(A[nodes][:, nodes]) for A in Y]
+
+        self.G = None
+        if self.show_details:
+            self.G = []
+            for A in self.layer_graphs:
+                A_coo = A.tocoo()
+                G = nx.DiGraph()
+                G.add_nodes_from(self.nodes)
+                G.add_weighted_edges_from(
+                    zip(nodes[A_coo.row].tolist(), nodes[A_coo.col].tolist(), A_coo.data)
+                )
+                self.G.append(G)
+
+        self.u = self.u[nodes]
+        self.v = self.v[nodes]
+        self.N = len(self.nodes)
+
     def _apply_overlapping(
         self, u: np.ndarray, v: np.ndarray
     ) -> Tuple[np.ndarray, np.ndarray]:
@@ -384,15 +443,10 @@ class StandardMMSBM(BaseSyntheticNetwork):
         size = int(self.N / self.K)
         u = np.zeros((self.N, self.K))
         v = np.zeros((self.N, self.K))
-        for i in range(self.N):
-            q = int(math.floor(float(i) / float(size)))
-            if q == self.K:
-                u[i:, self.K - 1] = 1.0
-                v[i:, self.K - 1] = 1.0
-            else:
-                for j in range(q * size, q * size + size):
-                    u[j, q] = 1.0
-                    v[j, q] = 1.0
+        # Assign the remaining nodes to the last community
+        communities = np.minimum(np.arange(self.N) // size, self.K - 1)
+        u[np.arange(self.N), communities] = 1.0
+        v[np.arange(self.N), communities] = 1.0
 
         return u, v
 
@@ -613,41 +667,27 @@ class ReciprocityMMSBM_joints(StandardMMSBM):
         # compute the normalization constant
         self.Z = self._calculate_Z(self.M0, self.eta)
 
+        # The pairs i < j are drawn in row-major order, with one uniform number per pair as in
+        # the loop over the pairs, so a seed gives the same network as the pairwise sampling
+        i, j = np.triu_indices(self.N, k=1)
         for layer in range(self.L):
-            for i in range(self.N):
-                for j in range(i + 1, self.N):
-                    # The probabilities look like [p00, p01, p10, p11]
-                    probabilities = (
-                        np.array(
-                            [
-                                1.0,
-                                self.M0[layer, j, i],
-                                self.M0[layer, i, j],
-                                self.M0[layer, i, j] * self.M0[layer, j, i] * self.eta,
-                            ]
-                        )
-                        / self.Z[layer, i, j]
-                    )
-                    cumulative = [
-                        1.0 / self.Z[layer, i, j],
-                        np.sum(probabilities[:2]),
-                        np.sum(probabilities[:3]),
-                        1.0,
-                    ]
-
-                    r = self.prng.rand(1)[0]
-                    if r <= probabilities[0]:
-                        A_ij, A_ji = 0, 0
-                    elif probabilities[0] < r <= cumulative[1]:
-                        A_ij, A_ji = 0, 1
-                    elif cumulative[1] < r <= cumulative[2]:
-                        A_ij, A_ji = 1, 0
-                    elif r > cumulative[2]:
-                        A_ij, A_ji = 1, 1
-                    if A_ij > 0:
-                        self.G[layer].add_edge(i, j, weight=1)  # binary
-                    if A_ji > 0:
-                        self.G[layer].add_edge(j, i, weight=1)  # binary
+            M_ij, M_ji, Z = self.M0[layer, i, j], self.M0[layer, j, i], self.Z[layer, i, j]
+            # The probabilities look like [p00, p01, p10, p11], with cumulative sums
+            p00 = 1.0 / Z
+            cumulative_01 = p00 + M_ji / Z
+            cumulative_10 = cumulative_01 + M_ij / Z
+
+            r = self.prng.rand(len(i))
+            A_ij = r > cumulative_01
+            A_ji = ((p00 < r) & (r <= cumulative_01)) | (r > cumulative_10)
+
+            # The edges of each pair are added in the order (i, j), (j, i)
+            src = np.stack([i, j], axis=1).ravel()
+            dst = np.stack([j, i], axis=1).ravel()
+            keep = np.stack([A_ij, A_ji], axis=1).ravel()
+            self.G[layer].add_edges_from(
+                zip(src[keep].tolist(), dst[keep].tolist()), weight=1
+            )  # binary
 
             assert len(list(self.G[layer].nodes())) == self.N
 
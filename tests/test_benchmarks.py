@@ -0,0 +1,96 @@
+"""
+Test cases for the benchmarks module.
+"""
+
+from pathlib import Path
+import tempfile
+import unittest
+from unittest import mock
+
+from pgm.benchmarks.main import main
+from pgm.benchmarks.runner import (
+    compare_reports, define_cases, load_report, PHASES, run_benchmarks, run_case, save_report)
+
+
+class TestBenchmarks(unittest.TestCase):
+    """
+    Test cases for the benchmark runner.
+    """
+
+    def test_define_cases(self):
+        # The layers only vary for MTCOV, and the time steps only for DynCRep
+        cases = define_cases(["CRep", "MTCOV", "DynCRep"], N=[50, 80], L=[1, 2], T=[2, 3])
+        self.assertEqual(
+            [case.name for case in cases if case.algorithm == "CRep"],
+            ["CRep_N50_K3_L1_deg10_T0_seed0", "CRep_N80_K3_L1_deg10_T0_seed0"],
+        )
+        self.assertEqual(sum(case.algorithm == "MTCOV" for case in cases), 4)
+        self.assertEqual(sum(case.algorithm == "DynCRep" for case in cases), 4)
+        with self.assertRaises(ValueError):
+            define_cases(["SBM"])
+
+    def test_run_benchmarks(self):
+        cases = define_cases(["CRep", "DynCRep"], N=[60], K=[2], avg_degree=[6], T=[2])
+        report = run_benchmarks(cases, isolate=False, max_iter=5, NFold=2)
+
+        self.assertEqual(len(report["results"]), 2)
+        for result in report["results"]:
+            self.assertEqual(list(result["timings"]), list(PHASES))
+            self.assertEqual(result["n_iterations"], 5)
+            self.assertGreater(result["wall_time"], sum(result["timings"].values()) / 2)
+            self.assertGreater(result["n_edges"], 0)
+
+        # The reports are saved to JSON, and compared against themselves without regressions
+        with tempfile.TemporaryDirectory() as folder:
+            save_report(report, Path(folder) / "baseline.json")
+            baseline = load_report(Path(folder) / "baseline.json")
+        comparison = compare_reports(report, baseline)
+        self.assertEqual(len(comparison), 2 * (len(PHASES) + 2))
+        self.assertFalse(any(row["regression"] for row in comparison))
+
+        # A slower phase is a regression
+        baseline["results"][0]["timings"]["fit"] /= 2
+        comparison = compare_reports(report, baseline)
+        self.assertEqual(
+            [(row["name"], row["metric"]) for row in comparison if row["regression"]],
+            [(cases[0].name, "fit")],
+        )
+
+    def test_failed_phase(self):
+        # A failed cross-validation is stored in the result, or raised to compare a baseline
+        case = define_cases(["CRep"], N=[60], K=[2], avg_degree=[6])[0]
+        with mock.patch(
+            "pgm.benchmarks.runner.cross_validation", side_effect=RuntimeError("fold")
+        ):
+            result = run_case(case, phases=["cross_validation"])
+            with self.assertRaises(RuntimeError):
+                run_case(case, phases=["cross_validation"], raise_errors=True)
+        self.assertEqual(list(result["errors"]), ["cross_validation"])
+        self.assertNotIn("cross_validation", result["timings"])
+
+        # The phase missing from the report is a regression, and so is a phase with an error
+        baseline = {"results": [{**result, "timings": {**result["timings"]}}]}
+        baseline["results"][0]["timings"]["cross_validation"] = 1.0
+        rows = compare_reports({"results": [result]}, baseline)
+        missing = [row for row in rows if row["metric"] == "cross_validation"]
+        self.assertEqual(len(missing), 1)
+        self.assertEqual((missing[0]["current"], missing[0]["regression"]), (None, True))
+        rows = compare_reports({"results": [result]}, {"results": [result]})
+        self.assertEqual([row["metric"] for row in rows if row["regression"]], ["cross_validation"])
+
+        # The cases missing from one of the reports are not compared
+        self.assertEqual(compare_reports({"results": []}, baseline), [])
+
+    def test_main(self):
+        # The command line runs the cases in separate processes and writes the report
+        with tempfile.TemporaryDirectory() as folder:
+            output = str(Path(folder) / "benchmarks.json")
+            argv = ["-a", "ACD", "-N", "60", "-K", "2", "--max_iter", "3", "-o", output]
+            argv += ["--phases", "import_data", "fit"]
+            self.assertEqual(main(argv), 0)
+            report = load_report(output)
+        self.assertEqual(
+            list(report["results"][0]["timings"]),
+            ["generate", "import_data", "em_iteration", "fit"],
+        )
+        self.assertIn("peak_rss_mb", report["results"][0])
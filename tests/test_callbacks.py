@@ -0,0 +1,60 @@
+"""
+Test cases for the callbacks of the EM algorithm.
+"""
+
+import json
+from pathlib import Path
+import pickle
+import tempfile
+import unittest
+
+from pgm.model.callbacks import JSONLinesProgress, PlateauStop, resolve_stop, Stop, TimeBudget
+
+
+class TestCallbacks(unittest.TestCase):
+    """
+    Test cases for the built-in callbacks.
+    """
+
+    def test_resolve_stop(self):
+        self.assertIsNone(resolve_stop(None))
+        self.assertIsNone(resolve_stop(False))
+        self.assertEqual(resolve_stop(True), Stop.FIT)
+        self.assertEqual(resolve_stop(Stop.REALIZATION), Stop.REALIZATION)
+
+    def test_time_budget(self):
+        budget = TimeBudget(2.0)
+        self.assertIsNone(budget(0, 1, -10.0, {}, 1.5))
+        self.assertEqual(budget(0, 2, -10.0, {}, 2.5), Stop.FIT)
+
+    def test_plateau_stop(self):
+        plateau = PlateauStop(patience=20, min_delta=0.5)
+        logliks = [-100.0] * 10 + [-90.0] * 10 + [-89.9] * 30
+        stops = [plateau(0, it, loglik, {}, 0.0) for it, loglik in enumerate(logliks, 1)]
+        # The last improvement larger than min_delta is at iteration 11
+        self.assertEqual(stops.index(Stop.REALIZATION), 30)
+
+        # The state is reset for every realization, and without log-likelihood it never stops
+        self.assertIsNone(plateau(1, 1, -89.9, {}, 0.0))
+        self.assertIsNone(plateau(2, 100, None, {}, 0.0))
+
+    def test_json_lines_progress(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "progress.jsonl"
+            progress = JSONLinesProgress(str(path), every=2)
+            for it in range(1, 6):
+                progress(0, it, -1.0 / it, {"u": 0.1, "w": 0.2}, 0.01 * it)
+            # A copy sent to another process appends to the same file
+            copy = pickle.loads(pickle.dumps(progress))
+            copy(1, 2, None, {"u": 0.3}, 0.5)
+            copy.close()
+            progress.close()
+
+            with open(path, encoding="utf-8") as fp:
+                records = [json.loads(line) for line in fp]
+        self.assertEqual(
+            [(record["realization"], record["iteration"]) for record in records],
+            [(0, 2), (0, 4), (1, 2)],
+        )
+        self.assertEqual(records[0]["deltas"], {"u": 0.1, "w": 0.2})
+        self.assertIsNone(records[2]["loglik"])
@@ -2,11 +2,15 @@
 Test cases for the cv module.
 """
 
+from pathlib import Path
+import tempfile
 import unittest
 
 import numpy as np
+from sparse import COO
 
-from pgm.model_selection.masking import extract_mask_kfold, shuffle_indices_all_matrix
+from pgm.model_selection.masking import (
+    extract_mask_kfold, HashedFoldMask, load_mask, save_mask, shuffle_indices_all_matrix)
 
 
 class TestCV(unittest.TestCase):
@@ -52,3 +56,66 @@ class TestCV(unittest.TestCase):
         # Check if the indices are shuffled for each layer
         for l in range(self.L):
             self.assertTrue(np.any(indices[l] != np.arange(self.N * self.N)))
+
+    def test_hashed_fold_mask(self):
+        # Test the folds computed by hashing the coordinates of the entries
+        shape = (self.L, 20, 20)
+        masks = [HashedFoldMask(shape, fold, self.NFold, self.rseed) for fold in range(self.NFold)]
+        dense = np.stack([mask.to_dense() for mask in masks])
+
+        # Every entry belongs to exactly one fold, and the folds have similar sizes
+        np.testing.assert_array_equal(dense.sum(axis=0), 1)
+        self.assertLess(np.ptp(dense.sum(axis=(1, 2, 3))), 0.1 * dense[0].size)
+        np.testing.assert_array_equal((~masks[0]).to_dense(), ~dense[0])
+
+        # Non-zero entries of a tensor selected by the mask, for dense and sparse tensors
+        rng = np.random.default_rng(0)
+        data = (rng.random(shape) < 0.2).astype(int)
+        expected = np.nonzero(data * dense[1])
+        for tensor in (data, COO.from_numpy(data)):
+            subs = masks[1].coordinates(tensor)
+            np.testing.assert_array_equal(np.stack(subs), np.stack(expected))
+        train = masks[1].remove_from(COO.from_numpy(data)).todense()
+        np.testing.assert_array_equal(train, data * ~dense[1])
+
+        # Samples are drawn from the mask
+        subs = masks[2].sample(500, rng)
+        self.assertEqual(len(subs[0]), 500)
+        self.assertTrue(dense[2][subs].all())
+
+    def test_hashed_fold_mask_heldout_pairs(self):
+        # Test the sample of the held-out entries of a hashed fold
+        shape = (self.L, 20, 20)
+        mask = HashedFoldMask(shape, 1, self.NFold, self.rseed)
+        dense = mask.to_dense()
+        rng = np.random.default_rng(0)
+        data = (rng.random(shape) < 0.2).astype(int)
+
+        subs_pos, subs_neg, n_neg = mask.sample_heldout_pairs(COO.from_numpy(data), 50, rng)
+        np.testing.assert_array_equal(np.stack(subs_pos), np.stack(np.nonzero(data * dense)))
+        self.assertEqual(len(subs_neg[0]), 50)
+        self.assertTrue(dense[subs_neg].all())
+        self.assertFalse(data[subs_neg].any())
+        self.assertGreater(n_neg, 50)
+
+        # With few zero entries in the fold, they are all returned, and none if the fold is full
+        data[dense] = 1
+        data[0, dense[0]] = 0
+        subs_pos, subs_neg, n_neg = mask.sample_heldout_pairs(data, 10**6, rng)
+        np.testing.assert_array_equal(np.stack(subs_neg), np.stack(np.nonzero(dense[:1])))
+        self.assertEqual(n_neg, np.count_nonzero(dense[0]))
+        subs_pos, subs_neg, n_neg = mask.sample_heldout_pairs(np.ones(shape, dtype=int), 50, rng)
+        self.assertEqual((len(subs_pos[0]), len(subs_neg[0]), n_neg), (dense.sum(), 0, 0))
+
+    def test_save_and_load_mask(self):
+        # Test the on-disk format of the masks
+        mask = HashedFoldMask((self.L, self.N, self.N), 1, self.NFold, self.rseed)
+        dense = mask.to_dense()
+        with tempfile.TemporaryDirectory() as folder:
+            save_mask(Path(folder) / "hashed.npz", mask)
+            loaded = load_mask(Path(folder) / "hashed.npz")
+            np.testing.assert_array_equal(loaded.to_dense(), dense)
+
+            save_mask(Path(folder) / "dense.npz", dense)
+            loaded = load_mask(Path(folder) / "dense.npz")
+            np.testing.assert_array_equal(np.stack(loaded), np.stack(np.nonzero(dense)))
@@ -5,9 +5,13 @@ Test cases for the evaluate module.
 import unittest
 
 import numpy as np
+from scipy.optimize import brentq
+from sklearn import metrics
 
 from pgm.output.evaluate import (
-    calculate_AUC, calculate_conditional_expectation, calculate_expectation, lambda0_full)
+    calculate_AUC, calculate_AUC_sampled, calculate_conditional_expectation, calculate_expectation,
+    calculate_expectation_at, func_lagrange_multiplier, lambda0_full, lambda0_sum, rank_auc,
+    sample_heldout_pairs, solve_lagrange_multipliers)
 
 
 class TestEvaluateFunctions(unittest.TestCase):
@@ -55,6 +59,21 @@ class TestEvaluateFunctions(unittest.TestCase):
         # Check if AUC result is 1.0
         self.assertEqual(auc_result, 1.0)
 
+    def test_rank_auc_with_ties(self):
+        # Test rank_auc against the trapezoidal ROC curve, with many tied scores
+        scores = np.round(np.random.rand(1000), 1)
+        labels = np.random.rand(1000) < 0.3
+
+        fpr, tpr, _ = metrics.roc_curve(labels, scores)
+        self.assertAlmostEqual(rank_auc(scores, labels), metrics.auc(fpr, tpr), places=12)
+
+        # The mask can also be given as the coordinates of the selected entries
+        pred = np.random.rand(self.L, self.N, self.N)
+        self.assertEqual(
+            calculate_AUC(pred, self.B, mask=np.where(self.mask)),
+            calculate_AUC(pred, self.B, mask=self.mask),
+        )
+
     def test_lambda0_full(self):
         # Example input values
         u = np.array([[0.1, 0.2], [0.3, 0.4]])
@@ -72,6 +91,17 @@ class TestEvaluateFunctions(unittest.TestCase):
         # Check if the result matches the updated expected output
         self.assertTrue(np.allclose(result, expected_result))
 
+    def test_lambda0_sum(self):
+        rng = np.random.default_rng(0)
+        u = rng.random((10, 3))
+        v = rng.random((10, 3))
+        mask = rng.random((2, 10, 10)) > 0.5
+        for w in (rng.random((2, 3, 3)), rng.random((2, 3))):
+            with self.subTest(ndim=w.ndim):
+                M = lambda0_full(u, v, w)
+                self.assertAlmostEqual(lambda0_sum(u, v, w), M.sum())
+                self.assertAlmostEqual(lambda0_sum(u, v, w, mask=mask), M[mask].sum())
+
     def test_calculate_conditional_expectation(self):
         # Test calculate_conditional_expectation function
 
@@ -91,3 +121,53 @@ class TestEvaluateFunctions(unittest.TestCase):
 
         # Check the shape of the result
         self.assertEqual(expectation.shape, (self.L, self.N, self.N))
+
+    def test_solve_lagrange_multipliers(self):
+        # Test solve_lagrange_multipliers against the root finding on each row
+        num = np.random.rand(50, self.K)
+        num[0] = 0.0
+        num[1, 0] = 0.0
+        den = np.random.rand(self.K)
+
+        lambdas, converged = solve_lagrange_multipliers(num, den)
+
+        # A row without positive numerators has no root
+        self.assertFalse(converged[0])
+        self.assertTrue(converged[1:].all())
+        for i in range(1, num.shape[0]):
+            expected = brentq(
+                func_lagrange_multiplier,
+                -den[num[i] > 0].min() + 1e-12,
+                num[i].sum() + 1,
+                args=(num[i], den),
+                xtol=1e-14,
+            )
+            self.assertAlmostEqual(lambdas[i], expected, places=8)
+        np.testing.assert_allclose(
+            (num[1:] / (lambdas[1:, np.newaxis] + den)).sum(axis=1), 1.0, rtol=1e-8
+        )
+
+    def test_sampled_AUC(self):
+        # Test the AUC computed on a sample of the zero entries against the exact one
+        rng = np.random.default_rng(0)
+        N, L, K = 60, 2, 3
+        u, v = rng.random((N, K)), rng.random((N, K))
+        w = rng.random((L, K, K))
+        B = (rng.random((L, N, N)) < 0.1).astype(int)
+        mask = rng.random((L, N, N)) < 0.5
+
+        subs_pos, subs_neg, n_neg = sample_heldout_pairs(B, mask, 2000, rng)
+        self.assertEqual(len(subs_pos[0]), np.count_nonzero(B[mask]))
+        self.assertEqual(n_neg, np.count_nonzero(B[mask] == 0))
+        self.assertEqual(len(subs_neg[0]), 2000)
+        self.assertTrue(mask[subs_neg].all())
+        self.assertFalse(B[subs_neg].any())
+
+        M = calculate_expectation(u, v, w, eta=self.eta)
+        np.testing.assert_allclose(
+            calculate_expectation_at(subs_neg, u, v, w, eta=self.eta), M[subs_neg]
+        )
+        auc, low, high = calculate_AUC_sampled(M[subs_pos], M[subs_neg])
+        self.assertLessEqual(low, calculate_AUC(M, B, mask=mask))
+        self.assertGreaterEqual(high, calculate_AUC(M, B, mask=mask))
+        self.assertTrue(low <= auc <= high)
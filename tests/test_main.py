@@ -385,6 +385,7 @@ class TestMainAnomalyDetection(TestMain):
             "K",
             "fix_communities",
             "files",
+            "implicit_q",
             "mask",
             "out_inference",
             "out_folder",
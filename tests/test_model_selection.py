@@ -1,4 +1,6 @@
+from pathlib import Path
 import unittest
+from unittest import mock
 
 import numpy as np
 import pandas as pd
@@ -6,11 +8,25 @@ from tests.constants import PATH_TO_GT
 from tests.fixtures import BaseTest
 import yaml
 
+from pgm.model_selection.crep_cross_validation import CRepCrossValidation
 from pgm.model_selection.cross_validation import CrossValidation
 from pgm.model_selection.labeling import predict_label
 from pgm.model_selection.main import cross_validation
 
 
+def as_number(value):
+    """
+    Convert the numbers written as strings, e.g. "[0.25]" in the columns mixing arrays and
+    floats, so that they are compared up to the tolerance of the test.
+    """
+    if isinstance(value, str):
+        try:
+            return float(value.strip("[]"))
+        except ValueError:
+            return value
+    return value
+
+
 class TestCrossValidationModels(BaseTest):
     def setUp(self):
         self.models = {}
@@ -26,7 +42,7 @@ class TestCrossValidationModels(BaseTest):
                 model_name = model_file.split(".")[0].split("_")[1]
                 self.models[model_name] = yaml.safe_load(file)
 
-    def run_cv_and_check_results(self, model_name):
+    def run_cv_and_check_results(self, model_name, n_jobs=1, resume=False):
         # Load the model settings
         model = self.models[model_name]
         # Change the output folder to the current temporary folder
@@ -38,18 +54,26 @@ class TestCrossValidationModels(BaseTest):
             PATH_TO_GT / self.models[model_name]["ground_truth_file"]
         )
         # Run the cross-validation
-        cross_validation(model_name, model["parameters"], model["input_params"])
+        cross_validation(
+            model_name,
+            model["parameters"],
+            model["input_params"],
+            n_jobs=n_jobs,
+            resume=resume,
+        )
         # Load the generated and ground truth dataframes
         generated_df = pd.read_csv(model["output_file"])
         ground_truth_df = pd.read_csv(model["ground_truth_file"])
         # Check that the generated dataframe is equal to the ground truth dataframe
-        for column in generated_df.columns:
+        self.assertEqual(len(generated_df), len(ground_truth_df))
+        for column in ground_truth_df.columns:
             for i in range(len(generated_df)):
                 self.assertAlmostEqual(
-                    generated_df[column][i],
-                    ground_truth_df[column][i],
+                    as_number(generated_df[column][i]),
+                    as_number(ground_truth_df[column][i]),
                     places=5,
                 )
+        return generated_df
 
     def test_dyncrep_cross_validation(self):
         self.run_cv_and_check_results("DynCRep")
@@ -66,6 +90,65 @@ class TestCrossValidationModels(BaseTest):
     def test_jointcrep_cross_validation(self):
         self.run_cv_and_check_results("JointCRep")
 
+    def test_crep_cross_validation_parallel(self):
+        self.run_cv_and_check_results("CRep", n_jobs=2)
+
+    def test_dyncrep_cross_validation_parallel(self):
+        self.run_cv_and_check_results("DynCRep", n_jobs=2)
+
+    def test_crep_cross_validation_sampled(self):
+        # With more samples than zero entries, the sampled evaluation scores all the entries
+        self.models["CRep"]["input_params"]["auc_samples"] = 10**9
+        generated_df = self.run_cv_and_check_results("CRep")
+        for name in ("auc_train", "auc_test", "auc_cond_train", "auc_cond_test"):
+            self.assertTrue((generated_df[f"{name}_low"] <= generated_df[name]).all())
+            self.assertTrue((generated_df[name] <= generated_df[f"{name}_high"]).all())
+
+    def test_cross_validation_sampled_unsupported(self):
+        # The algorithms evaluated on every held-out entry reject a sampled evaluation
+        for model_name in ("DynCRep", "MTCOV", "ACD"):
+            model = self.models[model_name]
+            model["input_params"]["auc_samples"] = 2000
+            with self.assertRaises(ValueError):
+                cross_validation(model_name, model["parameters"], model["input_params"])
+
+    def test_cross_validation_hashed_folds_unsupported(self):
+        # The algorithms with their own extraction of the masks reject the hashed folds
+        for model_name in ("DynCRep", "MTCOV", "ACD"):
+            model = self.models[model_name]
+            model["input_params"]["mask_scheme"] = "hash"
+            with self.assertRaises(ValueError):
+                cross_validation(model_name, model["parameters"], model["input_params"])
+
+    def test_crep_cross_validation_hashed_folds(self):
+        # With hashed folds and a sampled evaluation, the data is never made dense
+        model = self.models["CRep"]
+        model["parameters"]["out_folder"] = [self.folder]
+        model["input_params"].update(mask_scheme="hash", auc_samples=2000, out_mask=True)
+        with mock.patch(
+            "pgm.model_selection.masking.HashedFoldMask.to_dense", side_effect=RuntimeError
+        ):
+            results = cross_validation("CRep", model["parameters"], model["input_params"])
+
+        NFold = model["input_params"]["NFold"]
+        self.assertEqual(len(results), len(model["parameters"]["K"]) * NFold)
+        for name in ("auc_train", "auc_test", "auc_cond_train", "auc_cond_test"):
+            self.assertTrue(results[name].between(0, 1).all())
+        self.assertEqual(len(list(Path(self.folder).glob("mask_f*.npz"))), NFold)
+
+    def test_crep_cross_validation_resume(self):
+        self.run_cv_and_check_results("CRep", resume=True)
+        self.assertEqual(len(list(Path(self.folder, "cv_cache").glob("*.pkl"))), 6)
+
+        # A resumed run reads every fold from the cache, without fitting the model again
+        with mock.patch.object(
+            CRepCrossValidation, "prepare_and_run", side_effect=RuntimeError
+        ):
+            self.setUp()
+            self.run_cv_and_check_results("CRep", resume=True)
+            self.setUp()
+            self.run_cv_and_check_results("CRep", n_jobs=2, resume=True)
+
 
 class TestCrossValidation(unittest.TestCase):
     def test_define_grid(self):
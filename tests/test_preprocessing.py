@@ -2,14 +2,18 @@
 Tests for the preprocessing module.
 """
 
+from itertools import product
 import unittest
 
 import networkx as nx
 import numpy as np
+import pandas as pd
 from sparse import COO
 
 from pgm.input import tools
-from pgm.input.preprocessing import build_B_from_A, build_sparse_B_from_A, preprocess
+from pgm.input.loader import GraphLayers, read_graph, read_tensor
+from pgm.input.preprocessing import (
+    build_B_from_A, build_sparse_B_from_A, build_sparse_B_from_coords, preprocess)
 
 
 class TestPreprocessing(unittest.TestCase):
@@ -108,6 +112,61 @@ class TestPreprocessing(unittest.TestCase):
         np.testing.assert_array_almost_equal(v_T, expected_v_T)
         np.testing.assert_array_almost_equal(rw, expected_rw)
 
+    def test_build_sparse_B_from_coords(self):
+        # Test case for build_sparse_B_from_coords against build_sparse_B_from_A
+        G1 = nx.MultiDiGraph()
+        G1.add_edges_from(
+            [(0, 1, {"weight": 1}), (1, 0, {"weight": 2}), (1, 2, {"weight": 3})]
+        )
+        G2 = nx.MultiDiGraph()
+        G2.add_nodes_from([0, 1, 2])
+        G2.add_edges_from([(2, 0, {"weight": 2})])
+        A = [G1, G2]
+
+        coords = np.array([[1, 0, 0, 0], [2, 1, 0, 1], [0, 2, 1, 0]])
+        vals = np.array([2.0, 3.0, 1.0, 2.0])
+        data, data_T, v_T, rw = build_sparse_B_from_coords(
+            coords, vals, (2, 3, 3), calculate_reciprocity=True
+        )
+        expected = build_sparse_B_from_A(A, calculate_reciprocity=True)
+
+        np.testing.assert_array_equal(data.coords, expected[0].coords)
+        np.testing.assert_array_equal(data.data, expected[0].data)
+        np.testing.assert_array_equal(data_T.coords, expected[1].coords)
+        np.testing.assert_array_equal(data_T.data, expected[1].data)
+        np.testing.assert_array_equal(v_T, expected[2])
+        np.testing.assert_array_almost_equal(rw, expected[3])
+
+    def test_read_tensor(self):
+        # Test case for read_tensor against read_graph, with duplicated edges and self-loops
+        df_adj = pd.DataFrame(
+            {
+                "source": ["b", "a", "a", "c", "c"],
+                "target": ["a", "b", "b", "c", "a"],
+                "L0": [1, 2, 3, 1, 0],
+                "L1": [0, 1, 0, 4, 2],
+            }
+        )
+        for undirected, noselfloop, binary in product([False, True], repeat=3):
+            coords, vals, nodes = read_tensor(
+                df_adj, undirected=undirected, noselfloop=noselfloop, binary=binary
+            )
+            A = read_graph(
+                df_adj, undirected=undirected, noselfloop=noselfloop, binary=binary
+            )
+            B, _ = build_B_from_A(A, nodes=list(A[0].nodes()), calculate_reciprocity=False)
+
+            self.assertEqual(nodes, list(A[0].nodes()))
+            np.testing.assert_array_equal(COO(coords, vals, shape=B.shape).todense(), B)
+
+            # The lazily built graphs have the same edges as the ones of read_graph
+            layers = GraphLayers(coords, vals, nodes, len(A), undirected=undirected)
+            for layer in range(len(A)):
+                self.assertEqual(
+                    nx.to_numpy_array(layers[layer], nodelist=nodes).tolist(),
+                    nx.to_numpy_array(A[layer], nodelist=nodes).tolist(),
+                )
+
     def test_preprocess_dense_array(self):
         # Test case for preprocess with dense array
         # Create a dense array A
@@ -0,0 +1,85 @@
+"""
+Test cases for the profiling of the EM phases.
+"""
+
+import json
+from pathlib import Path
+import tempfile
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from pgm.model.profiling import PhaseProfiler, profiled, save_profile
+
+
+class Updater:
+    """
+    Minimal model with profiled update methods.
+    """
+
+    def __init__(self, profiler=None):
+        self._profiler = profiler
+
+    @profiled()
+    def _update_em(self):
+        for _ in range(3):
+            self._update_U()
+        return self._update_U()
+
+    @profiled("allocate")
+    def _update_U(self):
+        return np.ones(2**18).sum()
+
+
+class TestProfiling(unittest.TestCase):
+    """
+    Test cases for the PhaseProfiler and the profiled decorator.
+    """
+
+    def test_no_profiler(self):
+        # Without a profiler, the decorated methods are called as they are
+        self.assertEqual(Updater()._update_em(), 2**18)
+        self.assertEqual(Updater._update_em.__name__, "_update_em")
+
+    def test_phases(self):
+        profiler = PhaseProfiler()
+        model = Updater(profiler)
+        for _ in range(2):
+            self.assertEqual(model._update_em(), 2**18)
+
+        profile = profiler.to_dict()
+        self.assertEqual(list(profile), ["update_em", "allocate"])
+        self.assertEqual(profile["update_em"]["calls"], 2)
+        self.assertEqual(profile["allocate"]["calls"], 8)
+        # The outer phase includes the inner ones
+        self.assertGreaterEqual(profile["update_em"]["time"], profile["allocate"]["time"])
+        self.assertAlmostEqual(
+            profile["allocate"]["mean_time"], profile["allocate"]["time"] / 8
+        )
+        self.assertNotIn("peak_memory_mb", profile["allocate"])
+
+        # The profiles of other processes are added
+        other = PhaseProfiler()
+        Updater(other)._update_U()
+        profiler.merge(other)
+        self.assertEqual(profiler.phases["allocate"].calls, 9)
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "profile.json"
+            save_profile(profiler.to_dict(), path)
+            with open(path, encoding="utf-8") as fp:
+                self.assertEqual(json.load(fp)["allocate"]["calls"], 9)
+
+    def test_peak_memory(self):
+        profiler = PhaseProfiler(trace_memory=True)
+        Updater(profiler)._update_em()
+        profiler.stop()
+        self.assertFalse(tracemalloc.is_tracing())
+
+        # The peak of the inner phase, 2 MB for the array of ones, is also the outer one
+        profile = profiler.to_dict()
+        self.assertGreaterEqual(profile["allocate"]["peak_memory_mb"], 2)
+        self.assertGreaterEqual(
+            profile["update_em"]["peak_memory_mb"], profile["allocate"]["peak_memory_mb"]
+        )
@@ -0,0 +1,55 @@
+"""
+Test cases for the adaptive schedule of the log-likelihood checks.
+"""
+
+import unittest
+
+from pgm.model.constants import CHECK_INTERVAL_, MAX_CHECK_INTERVAL_, PRECHECK_DELTA_
+from pgm.model.schedule import LikelihoodSchedule
+
+
+class TestLikelihoodSchedule(unittest.TestCase):
+    """
+    Test cases for the LikelihoodSchedule class.
+    """
+
+    def setUp(self):
+        self.schedule = LikelihoodSchedule(convergence_tol=0.1, decision=2)
+        self.still = {"u": PRECHECK_DELTA_ / 2, "v": PRECHECK_DELTA_ / 2, "w": 1.0}
+
+    def test_cost_interval(self):
+        # A likelihood as expensive as 5 EM steps is computed every 50 iterations
+        self.schedule.record_step(1.0, self.still)
+        self.assertTrue(self.schedule.due(0))
+        self.assertEqual(self.schedule.record_check(0, -1e10, 5.0, 0), 0)
+        self.assertFalse(self.schedule.due(49))
+        self.assertTrue(self.schedule.due(50))
+
+        # The check is postponed while the memberships move, but not beyond the maximum interval
+        self.schedule.record_step(1.0, {"u": 2 * PRECHECK_DELTA_, "v": 0.0})
+        self.assertFalse(self.schedule.due(50))
+        self.assertTrue(self.schedule.due(MAX_CHECK_INTERVAL_))
+
+    def test_convergence(self):
+        # A cheap likelihood is checked every CHECK_INTERVAL_ iterations
+        self.schedule.record_step(1.0, self.still)
+        coincide = self.schedule.record_check(0, -1e10, 0.01, 0)
+        self.assertEqual(self.schedule.next_check, CHECK_INTERVAL_)
+
+        # The stable checks count their iterations, and a change over a longer gap is scaled
+        coincide = self.schedule.record_check(10, 0.05, 0.01, coincide)
+        coincide = self.schedule.record_check(25, 0.12, 0.01, coincide)
+        self.assertEqual(coincide, 25)
+        self.assertFalse(self.schedule.converged(coincide))
+
+        # The last check lands on the iteration where the realization converges
+        self.assertEqual(self.schedule.next_check, 30)
+        coincide = self.schedule.record_check(30, 0.01, 0.01, coincide)
+        self.assertTrue(self.schedule.converged(coincide))
+        self.assertFalse(self.schedule.stale(31))
+        self.assertEqual(self.schedule.fixed_evaluations(31), 4)
+        self.assertEqual(self.schedule.evaluations, 4)
+
+        # An unstable check resets the count
+        self.assertEqual(self.schedule.record_check(40, 1.0, 0.01, coincide), 0)
+        self.assertTrue(self.schedule.stale(50))
@@ -11,7 +11,7 @@ import yaml
 
 from pgm.synthetic.syn_acd import SyntNetAnomaly
 from pgm.synthetic.syn_dyncrep import SyntheticDynCRep
-from pgm.synthetic.syn_rep import affinity_matrix, GM_reciprocity
+from pgm.synthetic.syn_rep import affinity_matrix, GM_reciprocity, sample_factorized_poisson
 from pgm.synthetic.syn_sbm import BaseSyntheticNetwork, ReciprocityMMSBM_joints
 
 from .constants import RTOL
@@ -78,6 +78,49 @@ class TestGMReciprocity(unittest.TestCase):
         }
         self._run_test(gm.reciprocity_planted_network, expected_values)
 
+    def test_reciprocity_planted_network_vectorized(self):
+        # The vectorized sampler is reproducible for a given seed
+        G, A = GM_reciprocity(self.N, self.K, vectorized=True).reciprocity_planted_network()
+        G_seed, A_seed = GM_reciprocity(
+            self.N, self.K, vectorized=True
+        ).reciprocity_planted_network()
+        self.assertIsInstance(G, nx.MultiDiGraph)
+        self.assertEqual((A != A_seed).nnz, 0)
+        self.assertEqual(list(G.edges(data=True)), list(G_seed.edges(data=True)))
+        np.testing.assert_array_equal(
+            nx.to_scipy_sparse_array(G, nodelist=list(G.nodes())).toarray(), A.toarray()
+        )
+        # The reciprocity is far from the one of conditionally independent edges
+        self.assertGreater(nx.reciprocity(G), 0.3)
+
+    def test_reciprocity_planted_network_factorized(self):
+        # The factorized sampler never builds the NxN matrix of the means
+        G, A = GM_reciprocity(self.N, self.K, factorized=True).reciprocity_planted_network()
+        self.assertIsInstance(G, nx.MultiDiGraph)
+        self.assertEqual(A.shape, (len(G.nodes()), len(G.nodes())))
+        np.testing.assert_array_equal(
+            nx.to_scipy_sparse_array(G, nodelist=list(G.nodes())).toarray(), A.toarray()
+        )
+        self.assertGreater(nx.reciprocity(G), 0.3)
+
+        # Without the graph, only the sparse adjacency matrix is returned
+        G, A = GM_reciprocity(
+            self.N, self.K, factorized=True, output_graph=False
+        ).planted_network_cond_independent()
+        self.assertIsNone(G)
+        self.assertEqual(A.shape[0], A.shape[1])
+
+    def test_sample_factorized_poisson(self):
+        # The sampled edges have the means of the dense model, without self-loops
+        rng = np.random.default_rng(0)
+        u, v = rng.dirichlet(np.ones(self.K), size=(2, self.N))
+        w = affinity_matrix(N=self.N, K=self.K, avg_degree=20.0)
+        A = sum(sample_factorized_poisson(u, v, w, rng) for _ in range(200)) / 200
+        M = u @ w @ v.T
+        np.fill_diagonal(M, 0)
+        self.assertEqual(A.diagonal().sum(), 0)
+        self.assertAlmostEqual(A.sum() / M.sum(), 1, places=2)
+
     def test_planted_network_cond_independent(self):
         gm = GM_reciprocity(self.N, self.K)
         gm.verbose = False  # Disable verbose output for testing
@@ -360,6 +403,17 @@ class TestSyntNetAnomaly(unittest.TestCase):
             G, G0, self.syn_acd, expected_values
         )
 
+    def test_anomaly_network_PB_factorized(self):
+        # With few nodes, the sparsity parameter is computed exactly from all the pairs
+        syn_acd = SyntNetAnomaly(N=200, K=3)
+        syn_acd.anomaly_network_PB()
+        syn_acd_factorized = SyntNetAnomaly(N=200, K=3, factorized=True)
+        G, G0 = syn_acd_factorized.anomaly_network_PB()
+        np.testing.assert_array_almost_equal(syn_acd_factorized.w, syn_acd.w)
+        self.assertEqual(list(G.nodes()), list(G0.nodes()))
+        self.assertEqual(syn_acd_factorized.N, G.number_of_nodes())
+        self.assertEqual(nx.number_of_selfloops(G), 0)
+
     def test_anomaly_network_PB_with_parameters(self):
         syn_acd = SyntNetAnomaly(
             N=200, K=3, corr=0.9, over=0.5, structure="disassortative", L1=True
@@ -12,11 +12,12 @@ from scipy.sparse import coo_matrix
 from sparse import COO
 
 from pgm.input.tools import (
-    build_edgelist, can_cast_to_int, Exp_ija_matrix, get_item_array_from_subs, is_sparse,
-    normalize_nonzero_membership, output_adjacency, sp_uttkrp, sp_uttkrp_assortative,
-    sptensor_from_dense_array, transpose_ij2, transpose_ij3, write_adjacency, write_design_Matrix)
+    build_edgelist, can_cast_to_int, contract_uvw, Exp_ija_matrix, get_item_array_from_subs,
+    is_sparse, MaskIndex, NonzeroIndex, normalize_nonzero_membership, output_adjacency, sp_uttkrp,
+    sp_uttkrp_assortative, sp_uttkrp_assortative_fused, sp_uttkrp_fused, sptensor_from_dense_array,
+    transpose_ij2, transpose_ij3, uttkrp_w, write_adjacency, write_design_Matrix)
 
-from .constants import DECIMAL, RTOL
+from .constants import DECIMAL, RANDOM_SEED_REPROD, RTOL
 from .fixtures import BaseTest
 
 
@@ -134,6 +135,26 @@ class TestTensors(unittest.TestCase):
         result = Exp_ija_matrix(u, v, w)
         np.testing.assert_allclose(result, expected_result, rtol=RTOL)
 
+    def test_contract_uvw(self):
+        # Test case for contract_uvw against the outer product of u and v
+        rng = np.random.default_rng(RANDOM_SEED_REPROD)
+        u, v = rng.random((5, 3)), rng.random((4, 3))
+        for w in (rng.random((2, 3, 3)), rng.random((2, 3))):
+            if w.ndim == 3:
+                expected_result = np.einsum("ik,jq,akq->aij", u, v, w)
+            else:
+                expected_result = np.einsum("ik,jk,ak->aij", u, v, w)
+            np.testing.assert_allclose(contract_uvw(u, v, w), expected_result, rtol=RTOL)
+
+            # The result is written in the given output array
+            out = np.empty((2, 5, 4))
+            result = contract_uvw(u, v, w, out=out, n_threads=1)
+            self.assertIs(result, out)
+            np.testing.assert_allclose(out, expected_result, rtol=RTOL)
+
+        with self.assertRaises(ValueError):
+            contract_uvw(u, v, w, out=np.empty((2, 5, 5)))
+
     def test_sp_uttkrp_mode_1(self):
         mode = 1
         result = sp_uttkrp(self.vals_, self.subs_, mode, self.u_, self.v_, self.w_)
@@ -163,6 +184,196 @@ class TestTensors(unittest.TestCase):
         self.assertTrue(np.allclose(result, expected_result))
 
 
+class TestFusedUttkrp(unittest.TestCase):
+    """
+    Test that the fused Khatri-Rao kernels match the reference implementations.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(RANDOM_SEED_REPROD)
+        self.N, self.K, self.L, self.nnz = 30, 4, 3, 200
+        self.vals = rng.random(self.nnz)
+        self.subs = (
+            rng.integers(0, self.L, self.nnz),
+            rng.integers(0, self.N, self.nnz),
+            rng.integers(0, self.N, self.nnz),
+        )
+        self.u = rng.random((self.N, self.K))
+        self.v = rng.random((self.N, self.K))
+        self.w = rng.random((self.L, self.K, self.K))
+        self.w_a = rng.random((self.L, self.K))
+
+    def test_sp_uttkrp_fused_matches_reference(self):
+        for m in (1, 2):
+            for temporal in (True, False):
+                with self.subTest(m=m, temporal=temporal):
+                    expected = sp_uttkrp(
+                        self.vals, self.subs, m, self.u, self.v, self.w, temporal=temporal
+                    )
+                    result = sp_uttkrp_fused(
+                        self.vals, self.subs, m, self.u, self.v, self.w, temporal=temporal
+                    )
+                    np.testing.assert_allclose(result, expected)
+
+    def test_sp_uttkrp_assortative_fused_matches_reference(self):
+        for m in (1, 2):
+            for temporal in (True, False):
+                with self.subTest(m=m, temporal=temporal):
+                    expected = sp_uttkrp_assortative(
+                        self.vals, self.subs, m, self.u, self.v, self.w_a, temporal=temporal
+                    )
+                    result = sp_uttkrp_assortative_fused(
+                        self.vals, self.subs, m, self.u, self.v, self.w_a, temporal=temporal
+                    )
+                    np.testing.assert_allclose(result, expected)
+
+    def test_sp_uttkrp_fused_small_example(self):
+        # Same example as the reference tests in TestTensors
+        vals = np.array([1.0, 2.0, 3.0])
+        subs = (np.array([0, 0, 1]), np.array([0, 1, 2]), np.array([0, 1, 2]))
+        u = np.array([[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]])
+        v = np.array([[0.7, 0.8], [0.9, 1.0], [1.1, 1.2]])
+        w = np.array([[[0.1, 0.2], [0.3, 0.4]], [[0.5, 0.6], [0.7, 0.8]]])
+        result = sp_uttkrp_fused(vals, subs, 1, u, v, w)
+        expected_result = np.array([[0.23, 0.53], [0.58, 1.34], [3.81, 5.19]])
+        np.testing.assert_allclose(result, expected_result)
+
+    def test_sp_uttkrp_fused_empty_layer(self):
+        # Layers without non-zero entries must not contribute
+        subs = (np.zeros(self.nnz, dtype=int), self.subs[1], self.subs[2])
+        expected = sp_uttkrp(self.vals, subs, 1, self.u, self.v, self.w)
+        result = sp_uttkrp_fused(self.vals, subs, 1, self.u, self.v, self.w)
+        np.testing.assert_allclose(result, expected)
+
+    def test_sp_uttkrp_fused_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            sp_uttkrp_fused(self.vals, self.subs, 3, self.u, self.v, self.w)
+        with self.assertRaises(ValueError):
+            sp_uttkrp_assortative_fused(self.vals, self.subs[:2], 1, self.u, self.v, self.w_a)
+
+    def test_sp_uttkrp_fused_with_index(self):
+        index = NonzeroIndex.from_subs(self.subs, (self.L, self.N, self.N))
+        for m in (1, 2):
+            with self.subTest(m=m):
+                expected = sp_uttkrp(self.vals, self.subs, m, self.u, self.v, self.w)
+                result = sp_uttkrp_fused(
+                    self.vals, self.subs, m, self.u, self.v, self.w, index=index
+                )
+                np.testing.assert_allclose(result, expected)
+                expected = sp_uttkrp_assortative(
+                    self.vals, self.subs, m, self.u, self.v, self.w_a
+                )
+                result = sp_uttkrp_assortative_fused(
+                    self.vals, self.subs, m, self.u, self.v, self.w_a, index=index
+                )
+                np.testing.assert_allclose(result, expected)
+
+    def test_uttkrp_w_matches_loop(self):
+        # Reference: one outer product per non-zero entry, as in the old DynCRep W updates
+        expected = np.zeros((self.L, self.K, self.K))
+        expected_a = np.zeros((self.L, self.K))
+        for idx, (a, i, j) in enumerate(zip(*self.subs)):
+            expected[a] += self.vals[idx] * np.einsum("k,q->kq", self.u[i], self.v[j])
+            expected_a[a] += self.vals[idx] * self.u[i] * self.v[j]
+
+        index = NonzeroIndex.from_subs(self.subs, (self.L, self.N, self.N))
+        for idx in (None, index):
+            with self.subTest(index=idx is not None):
+                result = uttkrp_w(self.vals, self.subs, self.u, self.v, self.L, index=idx)
+                np.testing.assert_allclose(result, expected)
+                result = uttkrp_w(
+                    self.vals, self.subs, self.u, self.v, self.L, assortative=True, index=idx
+                )
+                np.testing.assert_allclose(result, expected_a)
+                # The static update only uses the first layer
+                result = uttkrp_w(self.vals, self.subs, self.u, self.v, 1, index=idx)
+                np.testing.assert_allclose(result, expected[:1])
+
+
+class TestNonzeroIndex(unittest.TestCase):
+    """
+    Test the segments of the index of the non-zero entries.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(RANDOM_SEED_REPROD)
+        self.shape = (3, 20, 20)
+        self.nnz = 150
+        self.subs = tuple(rng.integers(0, dim, self.nnz) for dim in self.shape)
+        self.X = rng.random((self.nnz, 5))
+        self.weights = rng.random(self.nnz)
+        self.index = NonzeroIndex.from_subs(self.subs, self.shape)
+
+    def test_from_subs_accepts_coords_array(self):
+        index = NonzeroIndex.from_subs(np.array(self.subs), self.shape)
+        for mode in range(3):
+            np.testing.assert_array_equal(index.order[mode], self.index.order[mode])
+            np.testing.assert_array_equal(index.indptr[mode], self.index.indptr[mode])
+
+    def test_segments_are_sorted(self):
+        self.assertEqual(self.index.nnz, self.nnz)
+        for mode, dim in enumerate(self.shape):
+            with self.subTest(mode=mode):
+                sorted_subs = self.index.sorted_subs(mode)
+                self.assertTrue(np.all(np.diff(sorted_subs[mode]) >= 0))
+                np.testing.assert_array_equal(
+                    np.diff(self.index.indptr[mode]),
+                    np.bincount(self.subs[mode], minlength=dim),
+                )
+                for i, entries in self.index.segments(mode):
+                    self.assertTrue(np.all(self.subs[mode][entries] == i))
+
+    def test_segment_sum_matches_bincount(self):
+        for mode, dim in enumerate(self.shape):
+            with self.subTest(mode=mode):
+                expected = np.stack(
+                    [
+                        np.bincount(
+                            self.subs[mode], weights=self.weights * self.X[:, k], minlength=dim
+                        )
+                        for k in range(self.X.shape[1])
+                    ],
+                    axis=1,
+                )
+                result = self.index.segment_sum(mode, self.X, self.weights)
+                np.testing.assert_allclose(result, expected)
+                np.testing.assert_allclose(
+                    self.index.segment_sum(mode, self.X[:, 0]),
+                    np.bincount(self.subs[mode], weights=self.X[:, 0], minlength=dim),
+                )
+
+
+class TestMaskIndex(unittest.TestCase):
+    """
+    Test the index of the entries of the held out set.
+    """
+
+    def test_mask_index_matches_dense(self):
+        rng = np.random.default_rng(RANDOM_SEED_REPROD)
+        L, N, K = 3, 15, 2
+        data = rng.poisson(0.5, (L, N, N))
+        mask = rng.random((L, N, N)) < 0.3
+        u, v = rng.random((N, K)), rng.random((N, K))
+        data_T = np.einsum("aij->aji", data)
+
+        for tensor, tensor_T in ((data, data_T), (COO.from_numpy(data), None)):
+            index = MaskIndex.from_mask(mask, tensor, tensor_T)
+            np.testing.assert_array_equal(np.stack(index.subs), np.stack(np.nonzero(mask)))
+            np.testing.assert_array_equal(index.data_vals, data[mask])
+            np.testing.assert_array_equal(index.data_T_vals, data_T[mask])
+            np.testing.assert_array_equal(
+                np.stack(index.subs_nz), np.stack(np.nonzero(mask * data))
+            )
+            for w in (rng.random((L, K, K)), rng.random((L, K))):
+                with self.subTest(sparse=tensor_T is None, ndim=w.ndim):
+                    M = (
+                        np.einsum("ik,jq,akq->aij", u, v, w)
+                        if w.ndim == 3
+                        else np.einsum("ik,jk,ak->aij", u, v, w)
+                    )
+                    self.assertAlmostEqual(index.lambda0_sum(u, v, w), M[mask].sum())
+
+
 class TestWriteDesignMatrix(BaseTest):
     def setUp(self):
         self.metadata = {"node1": "metadata1", "node2": "metadata2"}
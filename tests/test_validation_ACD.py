@@ -1,5 +1,6 @@
 from importlib.resources import files
 from pathlib import Path
+from unittest import mock
 
 import networkx as nx
 import numpy as np
@@ -287,6 +288,29 @@ class ACDTestCase(BaseTest):
             u=u, v=v, w=w, pi=pi, mu=mu, maxL=maxL, theta=self.theta, data=data
         )
 
+    def test_implicit_q_matches_dense(self):
+        """Test that the memory-lean mode gives the same results as the dense one."""
+        self.prepare_data()
+
+        results = []
+        for implicit_q in (False, True):
+            model = AnomalyDetection(num_realizations=1, convergence_tol=0.1, max_iter=30)
+            with mock.patch("pgm.model.acd.BLOCK_ENTRIES_", 7 * self.N):
+                results.append(
+                    model.fit(
+                        data=self.B_train,
+                        nodes=self.nodes,
+                        K=self.K,
+                        mask=self.mask_input,
+                        rseed=self.rseed,
+                        out_inference=False,
+                        implicit_q=implicit_q,
+                    )
+                )
+
+        for dense, implicit in zip(*results):
+            np.testing.assert_allclose(implicit, dense, rtol=1e-8)
+
     def test_force_dense_False(self):
         """Test the import data function with force_dense set to False, i.e., the data is sparse."""
 
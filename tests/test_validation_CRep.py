@@ -3,15 +3,21 @@ This is the test module for the CRep algorithm.
 """
 
 from importlib.resources import files
+import json
+from pathlib import Path
+from unittest import mock
 
 import numpy as np
 import yaml
 
+from pgm.input.cache import bundle_key, bundle_path, load_bundle, save_bundle
 from pgm.input.loader import import_data
+from pgm.model.callbacks import JSONLinesProgress, Stop
 from pgm.model.crep import CRep
+from pgm.model.parallel import derive_seeds
 from pgm.output.likelihood import calculate_opt_func, PSloglikelihood
 
-from .constants import DECIMAL, PATH_FOR_INIT
+from .constants import DECIMAL, DECIMAL_2, PATH_FOR_INIT
 from .fixtures import BaseTest, ModelTestMixin
 
 
@@ -77,6 +83,74 @@ class BaseTestCase(BaseTest, ModelTestMixin):
         else:
             self.assertTrue(self.B.data.sum() > 0)
 
+    def test_import_data_input_cache(self):
+        """
+        Test that a second import reads the cached tensors instead of the input file
+        """
+        with files("pgm.data.input").joinpath(self.adj).open("rb") as network:
+            cached = [
+                import_data(
+                    network.name,
+                    ego=self.ego,
+                    alter=self.alter,
+                    force_dense=self.force_dense,
+                    binary=False,
+                    header=0,
+                    input_cache=self.folder,
+                )
+            ]
+            with mock.patch(
+                "pgm.input.loader.pd.read_csv", side_effect=AssertionError
+            ):
+                cached.append(
+                    import_data(
+                        network.name,
+                        ego=self.ego,
+                        alter=self.alter,
+                        force_dense=self.force_dense,
+                        binary=False,
+                        header=0,
+                        input_cache=self.folder,
+                    )
+                )
+
+        for A, B, B_T, data_T_vals in cached:
+            self.assertEqual(list(A[0].nodes()), list(self.nodes))
+            np.testing.assert_array_equal(B.coords, self.B.coords)
+            np.testing.assert_array_equal(B.data, self.B.data)
+            np.testing.assert_array_equal(B_T.coords, self.B_T.coords)
+            np.testing.assert_array_equal(B_T.data, self.B_T.data)
+            np.testing.assert_array_equal(data_T_vals, self.data_T_vals)
+        self.assertIsInstance(cached[1][1].data.base, np.memmap)
+
+    def test_input_cache_shared(self):
+        """
+        Test that processes sharing the cache folder keep a valid bundle
+        """
+        with files("pgm.data.input").joinpath(self.adj).open("rb") as network:
+            path = network.name
+        key = bundle_key(path, {"header": 0})
+        folder = bundle_path(self.folder, path, key)
+        bundle = (self.B, self.B_T, self.data_T_vals, list(self.nodes), [0.0])
+
+        # A second writer of the same bundle leaves the first one in place
+        save_bundle(folder, key, *bundle)
+        manifest_time = (folder / "manifest.json").stat().st_mtime_ns
+        save_bundle(folder, key, *bundle)
+        self.assertEqual((folder / "manifest.json").stat().st_mtime_ns, manifest_time)
+        self.assertEqual([p.name for p in Path(self.folder).iterdir()], [folder.name])
+
+        # A writer that loses the race to rename its bundle into place discards it
+        with mock.patch("pgm.input.cache._read_manifest", return_value=None):
+            with mock.patch("pgm.input.cache.os.replace", side_effect=OSError(39, "")):
+                save_bundle(folder, key, *bundle)
+        self.assertEqual([p.name for p in Path(self.folder).iterdir()], [folder.name])
+        self.assertIsNotNone(load_bundle(folder, key))
+
+        # A bundle removed while it is read is a cache miss
+        (folder / "vals_T.npy").unlink()
+        self.assertIsNone(load_bundle(folder, key))
+
     def test_calculate_opt_func(self):
         """
         # Test calculate_opt_func function in the case where data is dense
@@ -148,3 +222,177 @@ class BaseTestCase(BaseTest, ModelTestMixin):
 
         # Check if psloglikelihood_result is a number
         self.assertIsInstance(psloglikelihood_result, float)
+
+    def test_profile(self):
+        """
+        Test that profiling the EM phases does not change the fit.
+        """
+        self.conf["out_inference"] = False
+        self.model = CRep(num_realizations=1)
+        self._fit_model_to_data(self.conf)
+        profiled_model = CRep(num_realizations=1, profile=True)
+        _ = profiled_model.fit(
+            data=self.B,
+            data_T=self.B_T,
+            data_T_vals=self.data_T_vals,
+            nodes=self.nodes,
+            **self.conf,
+        )
+
+        self.assertEqual(self.model.profile_, {})
+        np.testing.assert_array_equal(self.model.u_f, profiled_model.u_f)
+        self.assertEqual(self.model.maxPSL, profiled_model.maxPSL)
+
+        # One EM update per iteration, with the updates of the parameters nested in it
+        profile = profiled_model.profile_
+        self.assertEqual(next(iter(profile)), "update_em")
+        self.assertEqual(profile["update_em"]["calls"], profiled_model.final_it)
+        for phase in ["update_U", "update_V", "update_W_assortative", "update_eta"]:
+            self.assertEqual(profile[phase]["calls"], profile["update_em"]["calls"])
+        self.assertGreater(profile["compute_likelihood"]["calls"], 0)
+
+    def test_adaptive_check(self):
+        """
+        Test that the adaptive checks of the log-likelihood converge to the same solution with
+        fewer likelihood evaluations.
+        """
+        self.conf["out_inference"] = False
+        self.model = CRep(num_realizations=1)
+        self._fit_model_to_data(self.conf)
+        adaptive = CRep(num_realizations=1, adaptive_check=True, profile=True)
+        _ = adaptive.fit(
+            data=self.B,
+            data_T=self.B_T,
+            data_T_vals=self.data_T_vals,
+            nodes=self.nodes,
+            **self.conf,
+        )
+
+        self.assertEqual(self.model.likelihood_checks_, {"evaluations": 0, "fixed_schedule": 0})
+        np.testing.assert_almost_equal(adaptive.maxPSL, self.model.maxPSL, decimal=DECIMAL)
+        # The realization converges within a few iterations of the fixed schedule
+        self.assertLessEqual(abs(adaptive.final_it - self.model.final_it), 10)
+        np.testing.assert_array_almost_equal(adaptive.u_f, self.model.u_f, decimal=DECIMAL_2)
+
+        checks = adaptive.likelihood_checks_
+        self.assertEqual(checks["evaluations"], adaptive.profile_["compute_likelihood"]["calls"])
+        self.assertEqual(checks["fixed_schedule"], -(-adaptive.final_it // 10))
+        self.assertLess(checks["evaluations"], checks["fixed_schedule"])
+
+    def test_callbacks(self):
+        """
+        Test that the callbacks see every iteration and can stop the fit.
+        """
+        self.conf["out_inference"] = False
+        calls = []
+        self.model = CRep(num_realizations=2, callbacks=[lambda *args: calls.append(args)])
+        self._fit_model_to_data(self.conf)
+
+        # Every iteration of both realizations is reported, in order
+        iterations = [[call[1] for call in calls if call[0] == r] for r in range(2)]
+        for its in iterations:
+            self.assertEqual(its, list(range(1, len(its) + 1)))
+        self.assertEqual(len(iterations[self.model.best_r]), self.model.final_it)
+        self.assertEqual(set(calls[0][3]), {"u", "v", "w", "eta"})
+        elapsed = [call[4] for call in calls]
+        self.assertEqual(elapsed, sorted(elapsed))
+
+        # A stop of the fit ends the first realization and skips the second one
+        realizations = []
+        progress = JSONLinesProgress(str(Path(self.folder) / "progress.jsonl"))
+        stopped = CRep(
+            num_realizations=2,
+            callbacks=[progress, lambda r, it, *args: realizations.append(r) or it >= 5],
+        )
+        _ = stopped.fit(
+            data=self.B,
+            data_T=self.B_T,
+            data_T_vals=self.data_T_vals,
+            nodes=self.nodes,
+            **self.conf,
+        )
+        self.assertEqual((stopped.best_r, stopped.final_it), (0, 5))
+        self.assertEqual(realizations, [0] * 5)
+        # The file of the progress is closed at the end of the fit
+        self.assertIsNone(progress._fp)  # pylint: disable=protected-access
+        # The pseudo log-likelihood is the one of the parameters at the stop
+        self.assertEqual(stopped.maxPSL, stopped.compute_likelihood())
+
+    def test_parallel_realizations(self):
+        """
+        Test that the realizations run in parallel do not depend on the number of processes.
+        """
+        self.conf["out_inference"] = False
+
+        # Fit the model with two and three processes
+        self.model = CRep(num_realizations=3, n_jobs=2)
+        self._fit_model_to_data(self.conf)
+        model_3 = CRep(num_realizations=3, n_jobs=3)
+        _ = model_3.fit(
+            data=self.B,
+            data_T=self.B_T,
+            data_T_vals=self.data_T_vals,
+            nodes=self.nodes,
+            **self.conf,
+        )
+
+        self.assertEqual(self.model.best_r, model_3.best_r)
+        self.assertEqual(self.model.maxPSL, model_3.maxPSL)
+        np.testing.assert_array_equal(self.model.u_f, model_3.u_f)
+        np.testing.assert_array_equal(self.model.w_f, model_3.w_f)
+
+        # The best realization is reproduced by a serial fit with its derived seed
+        serial = CRep(num_realizations=1)
+        self.conf["rseed"] = derive_seeds(self.conf["rseed"], 3)[self.model.best_r]
+        _ = serial.fit(
+            data=self.B,
+            data_T=self.B_T,
+            data_T_vals=self.data_T_vals,
+            nodes=self.nodes,
+            **self.conf,
+        )
+        np.testing.assert_almost_equal(serial.maxPSL, self.model.maxPSL, decimal=DECIMAL)
+        np.testing.assert_array_almost_equal(serial.u_f, self.model.u_f, decimal=DECIMAL)
+
+    def test_parallel_callbacks(self):
+        """
+        Test that a stop of the fit stops the following realizations in the other processes, and
+        lets the previous ones run to the end.
+        """
+        self.conf["out_inference"] = False
+        for stop in [0, 1]:
+            path = Path(self.folder) / f"progress_{stop}.jsonl"
+            stopped = CRep(
+                num_realizations=8,
+                n_jobs=2,
+                callbacks=[
+                    JSONLinesProgress(str(path)),
+                    lambda r, it, *args, stop=stop: Stop.FIT if (r, it) == (stop, 3) else None,
+                ],
+            )
+            _ = stopped.fit(
+                data=self.B,
+                data_T=self.B_T,
+                data_T_vals=self.data_T_vals,
+                nodes=self.nodes,
+                **self.conf,
+            )
+            with open(path, encoding="utf-8") as fp:
+                iterations = {}
+                for line in fp:
+                    record = json.loads(line)
+                    iterations[record["realization"]] = record["iteration"]
+
+            # Only the realization running in the other process started with the stopped one
+            self.assertLessEqual(set(iterations), {0, 1})
+            self.assertEqual(iterations[stop], 3)
+            if stop == 0:
+                # The realization after the stop ends at its next iteration, and it is not a
+                # candidate for the best parameters
+                self.assertLess(iterations.get(1, 0), 50)
+                self.assertEqual((stopped.best_r, stopped.final_it), (0, 3))
+            else:
+                # The realization before the stop runs to the end, as in a serial fit
+                self.assertEqual(stopped.best_r, 0)
+                self.assertEqual(iterations[0], stopped.final_it)
+                self.assertGreater(stopped.final_it, 50)
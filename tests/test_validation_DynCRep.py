@@ -1,6 +1,5 @@
 from importlib.resources import files
 from pathlib import Path
-import unittest
 
 import networkx as nx
 import numpy as np
@@ -169,9 +168,6 @@ class DynCRepTestCase(BaseTest):
             u, v, w, eta, beta, Loglikelihood, M_inf, self.B, yaml_file
         )
 
-    # Skipping this one since it looks that DynCRep does not support sparse data. To be discussed
-    # with Hadiseh.
-    @unittest.skip("DynCRep does not support sparse data")
     def test_force_dense_false(self):
         """
         This is a test for the DynCRep algorithm with force_dense=False, i.e., the input data is sparse.
@@ -195,4 +191,16 @@ class DynCRepTestCase(BaseTest):
             bg=self.BG,
             **self.conf,
         )
-        self.assertEqual(Loglikelihood, self.LOG_LIKELIHOOD_EXPECTED)
+
+        # The sparse input gives the same results as the dense one
+        B = self.B.todense()
+        M_inf = expected_Aija(u, v, w[0]) + eta * transpose_tensor(B)
+        yaml_file = (
+            Path(__file__).parent
+            / "data"
+            / "dyncrep"
+            / "data_for_test_running_temporal_version.yaml"
+        )
+        self.assert_model_results_from_yaml(
+            u, v, w, eta, beta, Loglikelihood, M_inf, B, yaml_file
+        )